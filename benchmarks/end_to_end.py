@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+"""
+Benchmark whole load and unload pipelines against a local Postgres.
+
+Runs `copy_json_to_table` and `unload_table_to_s3`, as JSON and as CSV,
+through `shiftmanager.local.LocalRedshift`, which keeps S3 in a temporary
+directory and emulates COPY and UNLOAD. With ``--postgres-source`` it also
+times `copy_table_to_redshift` from the same database, which needs a role
+allowed to run COPY TO PROGRAM. Connection details come from the usual
+PGHOST, PGPORT, PGUSER, PGPASSWORD and PGDATABASE variables. Results are
+printed as a JSON object, or written to ``--output``; pass ``--profile``
+to write cProfile stats for each step alongside.
+
+Usage::
+
+    PGDATABASE=shiftmanager python benchmarks/end_to_end.py --rows 100000
+    python benchmarks/end_to_end.py --profile profiles/ --only unload_csv
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import cProfile
+import contextlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from shiftmanager.local import LocalRedshift
+
+BUCKET = 'benchmark'
+
+TABLE = 'shiftmanager_bench_events'
+
+COPY_TABLE = 'shiftmanager_bench_copied'
+
+JSONPATHS = {'jsonpaths': ["$['id']", "$['name']", "$['amount']",
+                           "$['tags']", "$['recorded_at']"]}
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silence the progress messages printed by the code under test."""
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        yield
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+
+def rows(count):
+    """Return *count* synthetic event documents."""
+    return [{'id': i,
+             'name': 'event %d' % i,
+             'amount': i * 0.25,
+             'tags': ['a', 'b'] if i % 2 else [],
+             'recorded_at': '2016-01-%02d 12:00:00' % (i % 28 + 1)}
+            for i in range(count)]
+
+
+def create_tables(redshift):
+    definition = ("(id BIGINT, name VARCHAR(256), amount FLOAT8, "
+                  "tags VARCHAR(256), recorded_at TIMESTAMP)")
+    redshift.execute(';\n'.join(
+        ['DROP TABLE IF EXISTS %s' % TABLE,
+         'DROP TABLE IF EXISTS %s' % COPY_TABLE,
+         'CREATE TABLE %s %s' % (TABLE, definition),
+         'CREATE TABLE %s %s' % (COPY_TABLE, definition)]))
+
+
+def drop_tables(redshift):
+    redshift.execute('DROP TABLE IF EXISTS %s;\nDROP TABLE IF EXISTS %s'
+                     % (TABLE, COPY_TABLE))
+
+
+def steps(redshift, data, slices):
+    """Return (name, function) pairs, each running one pipeline once."""
+    def copy_json():
+        redshift.execute('TRUNCATE %s' % TABLE)
+        redshift.copy_json_to_table(BUCKET, 'bench/json', data, JSONPATHS,
+                                    TABLE, slices=slices)
+
+    def unload(name, **kwargs):
+        def run():
+            redshift.unload_table_to_s3(BUCKET, 'bench/%s' % name, TABLE,
+                                        **kwargs)
+        return run
+
+    def copy_from_postgres():
+        redshift.execute('TRUNCATE %s' % COPY_TABLE)
+        redshift.copy_table_to_redshift(COPY_TABLE, BUCKET, 'bench/pg',
+                                        pg_table_name=TABLE)
+
+    return [('copy_json_to_table', copy_json),
+            ('unload_json', unload('unload_json')),
+            ('unload_csv', unload('unload_csv', file_format='csv')),
+            ('copy_table_to_redshift', copy_from_postgres)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--slices', type=int, default=8,
+                        help="Files written by each COPY and UNLOAD")
+    parser.add_argument('--postgres-source', action='store_true',
+                        help="Also time copy_table_to_redshift")
+    parser.add_argument('--only', action='append',
+                        choices=[name for name, _ in steps(None, None, 0)])
+    parser.add_argument('--profile', metavar='DIRECTORY',
+                        help="Write a .prof file per step to DIRECTORY")
+    parser.add_argument('--output')
+    args = parser.parse_args(argv)
+
+    s3_root = tempfile.mkdtemp()
+    os.mkdir(os.path.join(s3_root, BUCKET))
+    redshift = LocalRedshift(s3_root=s3_root, slices=args.slices,
+                             port=os.environ.get('PGPORT', 5432))
+    if args.postgres_source:
+        redshift.create_pg_connection(
+            host=redshift.host, port=redshift.port, user=redshift.user,
+            password=redshift.password, database=redshift.database)
+    if args.profile and not os.path.isdir(args.profile):
+        os.makedirs(args.profile)
+
+    report = {
+        'benchmark': 'end_to_end',
+        'python': sys.version.split()[0],
+        'rows': args.rows,
+        'runs': args.runs,
+        'slices': args.slices,
+        'results': {},
+    }
+    with quiet():
+        create_tables(redshift)
+    try:
+        data = rows(args.rows)
+        for name, step in steps(redshift, data, args.slices):
+            if args.only and name not in args.only:
+                continue
+            if name == 'copy_table_to_redshift' and \
+                    not args.postgres_source:
+                continue
+            profile = cProfile.Profile() if args.profile else None
+            timings = []
+            for _ in range(args.runs):
+                start = time.time()
+                with quiet():
+                    if profile is not None:
+                        profile.runcall(step)
+                    else:
+                        step()
+                timings.append(time.time() - start)
+            timings.sort()
+            median = timings[len(timings) // 2]
+            report['results'][name] = {
+                'min_seconds': timings[0],
+                'median_seconds': median,
+                'rows_per_second': args.rows / median if median else None,
+            }
+            if profile is not None:
+                profile.dump_stats(os.path.join(args.profile,
+                                                name + '.prof'))
+    finally:
+        with quiet():
+            drop_tables(redshift)
+        shutil.rmtree(s3_root)
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
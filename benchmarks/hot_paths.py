@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+"""
+Benchmark shiftmanager's CPU-bound hot paths without a cluster.
+
+Covers chunking JSON documents into gzipped slices, generating jsonpaths,
+reproducing grants from large ACLs, generating deep copy and table
+definition SQL for tables of increasing width against a fake catalog,
+and uploading files with `S3UploaderThread` to an in-memory bucket.
+Results are printed as a JSON object, or written to ``--output``; pass
+``--baseline`` with an earlier result to exit with a non-zero status
+when any median slowed down by more than ``--max-regression``.
+
+Usage::
+
+    python benchmarks/hot_paths.py --output bench.json
+    python benchmarks/hot_paths.py --baseline bench.json --max-regression 0.25
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from shiftmanager import Redshift, queries
+from shiftmanager.mixins.postgres import S3UploaderThread
+from shiftmanager.privileges import grants_from_privileges
+
+PRIVILEGE_CHARS = ['r', 'arwdRxt', 'ar*w', 'r*', 'arwd']
+
+
+def timed(function, runs):
+    """Return the min and median seconds of *runs* calls to *function*."""
+    timings = []
+    for _ in range(runs):
+        start = time.time()
+        function()
+        timings.append(time.time() - start)
+    timings.sort()
+    return {'min_seconds': timings[0],
+            'median_seconds': timings[len(timings) // 2]}
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silence the progress messages printed by the code under test."""
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        yield
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+
+def document(shape, width):
+    """Return a synthetic JSON document of the given *shape*."""
+    if shape == 'flat':
+        return dict(('field_%d' % i, i) for i in range(width))
+    if shape == 'nested':
+        doc = {'leaf': 1}
+        for depth in range(width // 10):
+            doc = {'level_%d' % depth: doc, 'value_%d' % depth: 'x'}
+        return doc
+    # 'mixed': scalars, lists and one level of nesting
+    return dict(('field_%d' % i,
+                 [i, i + 1] if i % 3 == 0 else
+                 {'inner': i, 'name': 'n%d' % i} if i % 3 == 1 else
+                 'value %d' % i)
+                for i in range(width))
+
+
+def bench_json(runs, quick):
+    report = {}
+    directory = tempfile.mkdtemp()
+    try:
+        for shape in ['flat', 'nested', 'mixed']:
+            for width in [10, 100] if quick else [10, 100, 500]:
+                doc = document(shape, width)
+                name = '%s_%d' % (shape, width)
+                report['gen_jsonpaths_%s' % name] = timed(
+                    lambda: Redshift.gen_jsonpaths(doc), runs)
+                for count in [1000] if quick else [1000, 10000]:
+                    data = [doc] * count
+
+                    def chunk():
+                        with Redshift.chunked_json_slices(
+                                data, 8, directory=directory):
+                            pass
+
+                    report['chunked_json_slices_%s_x%d' % (name, count)] = \
+                        timed(chunk, runs)
+    finally:
+        shutil.rmtree(directory)
+    return report
+
+
+def acl(grantees):
+    """Return an ACL string with *grantees* entries."""
+    entries = []
+    for i in range(grantees):
+        grantee = 'group team_%d' % i if i % 4 == 0 else 'user_%d' % i
+        entries.append('%s=%s/ops' % (
+            grantee, PRIVILEGE_CHARS[i % len(PRIVILEGE_CHARS)]))
+    return '\n'.join(entries)
+
+
+def bench_grants(runs, quick):
+    report = {}
+    for grantees in [10, 100] if quick else [10, 100, 1000, 5000]:
+        privileges = acl(grantees)
+        report['grants_from_privileges_%d' % grantees] = timed(
+            lambda: grants_from_privileges(privileges, 'sales.orders'), runs)
+    return report
+
+
+def fake_catalog(privileges):
+    """Return a fetchall answering catalog queries for table 'wide'."""
+    def fetchall(query, parameters=None):
+        if query == queries.all_privileges:
+            return [('public', 'wide', 'r', 'ops', privileges, 'table')]
+        return []
+    return fetchall
+
+
+def bench_sql_generation(runs, quick):
+    import sqlalchemy as sa
+
+    redshift = Redshift(aws_access_key_id='benchmark',
+                        aws_secret_access_key='benchmark')
+    redshift._fetchall = fake_catalog(acl(100))
+    types = [sa.Integer, sa.BigInteger, sa.Boolean, sa.String(256),
+             sa.Numeric(18, 2), sa.DateTime]
+    report = {}
+    for width in [10, 100] if quick else [10, 100, 400, 1600]:
+        table = sa.Table(
+            'wide', sa.MetaData(),
+            *[sa.Column('column_%d' % i, types[i % len(types)])
+              for i in range(width)],
+            redshift_diststyle='KEY', redshift_distkey='column_0',
+            redshift_sortkey=['column_1', 'column_2'])
+        report['table_definition_%d' % width] = timed(
+            lambda: redshift.table_definition(table), runs)
+        report['deep_copy_%d' % width] = timed(
+            lambda: redshift.deep_copy(table), runs)
+    return report
+
+
+class MemoryKey(object):
+
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+
+    def set_contents_from_filename(self, filename, encrypt_key=False):
+        with open(filename, 'rb') as f:
+            self.bucket.contents[self.name] = f.read()
+
+    def set_canned_acl(self, acl):
+        pass
+
+
+class MemoryBucket(object):
+    """Just enough of a boto bucket for `S3UploaderThread`."""
+
+    def __init__(self):
+        self.contents = {}
+
+    def new_key(self, name):
+        return MemoryKey(self, name)
+
+
+def bench_uploads(runs, quick):
+    report = {}
+    for files in [10] if quick else [10, 100]:
+        def upload():
+            directory = tempfile.mkdtemp()
+            try:
+                for i in range(files):
+                    with open(os.path.join(directory, '%05d' % i), 'wb') as f:
+                        f.write(os.urandom(64 * 1024))
+                thread = S3UploaderThread(directory, MemoryBucket(),
+                                          'bench/', None)
+                thread.finish_uploads_and_exit()
+                with quiet():
+                    thread.start()
+                    thread.join()
+                assert len(thread.s3_keys) == files
+            finally:
+                shutil.rmtree(directory)
+
+        # Includes the thread's one-second poll before it exits
+        report['s3_uploader_thread_%d_files' % files] = timed(upload, runs)
+    return report
+
+
+BENCHMARKS = [
+    ('json', bench_json),
+    ('grants', bench_grants),
+    ('sql_generation', bench_sql_generation),
+    ('uploads', bench_uploads),
+]
+
+
+def regressions(report, baseline, max_regression):
+    """Return descriptions of the medians that slowed down by more than
+    *max_regression*, as a fraction, since *baseline*."""
+    found = []
+    for group, results in report['results'].items():
+        for name, result in results.items():
+            before = baseline.get('results', {}).get(group, {}).get(name)
+            if not before or not before['median_seconds']:
+                continue
+            change = result['median_seconds'] / before['median_seconds'] - 1
+            if change > max_regression:
+                found.append('%s.%s is %.0f%% slower' %
+                             (group, name, change * 100))
+    return sorted(found)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--quick', action='store_true',
+                        help="Only run the smaller sizes")
+    parser.add_argument('--only', action='append',
+                        choices=[name for name, _ in BENCHMARKS])
+    parser.add_argument('--output')
+    parser.add_argument('--baseline')
+    parser.add_argument('--max-regression', type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    report = {
+        'benchmark': 'hot_paths',
+        'python': sys.version.split()[0],
+        'runs': args.runs,
+        'quick': args.quick,
+        'results': {},
+    }
+    for name, benchmark in BENCHMARKS:
+        if args.only and name not in args.only:
+            continue
+        report['results'][name] = benchmark(args.runs, args.quick)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            report['regressions'] = regressions(report, json.load(f),
+                                                args.max_regression)
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return 1 if report.get('regressions') else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
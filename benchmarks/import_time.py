@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+"""
+Benchmark the time taken by ``import shiftmanager`` in a fresh interpreter.
+
+Each run starts a new Python process so that nothing is already cached
+in ``sys.modules``. Results are printed as a JSON object; pass
+``--max-seconds`` to exit with a non-zero status when the median
+import time exceeds a budget, or if any heavy dependency was loaded
+eagerly.
+
+Usage::
+
+    python benchmarks/import_time.py --runs 10 --max-seconds 0.25
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import json
+import subprocess
+import sys
+
+# Modules that should only be imported once a method needing them runs
+LAZY_MODULES = ['boto', 'sqlalchemy', 'sqlalchemy_redshift',
+                'sqlalchemy_views', 'psycopg2.extras']
+
+SCRIPT = """
+import json, sys, time
+start = time.time()
+import shiftmanager
+elapsed = time.time() - start
+print(json.dumps({'seconds': elapsed,
+                  'loaded': [m for m in %r if m in sys.modules]}))
+""" % (LAZY_MODULES,)
+
+
+def time_import():
+    output = subprocess.check_output([sys.executable, '-c', SCRIPT])
+    return json.loads(output.decode('utf-8'))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--max-seconds', type=float, default=None)
+    args = parser.parse_args(argv)
+
+    results = [time_import() for _ in range(args.runs)]
+    timings = sorted(r['seconds'] for r in results)
+    loaded = sorted(set(m for r in results for m in r['loaded']))
+    report = {
+        'benchmark': 'import_shiftmanager',
+        'python': sys.version.split()[0],
+        'runs': args.runs,
+        'min_seconds': timings[0],
+        'median_seconds': timings[len(timings) // 2],
+        'max_seconds': timings[-1],
+        'eagerly_loaded': loaded,
+    }
+    print(json.dumps(report, indent=2, sort_keys=True))
+
+    if loaded:
+        return 1
+    if args.max_seconds is not None and \
+            report['median_seconds'] > args.max_seconds:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+"""
+Benchmark UNLOAD with JSON built in SQL against Redshift's native formats.
+
+Without ``--table``, only the size of the SELECT each mode sends to the
+leader node is measured, for synthetic tables of increasing width. With
+``--table`` and ``--bucket``, the table is also unloaded once per mode
+and run, connecting with the usual PG* and AWS_* environment variables.
+Results are printed as a JSON object.
+
+Usage::
+
+    python benchmarks/unload_formats.py
+    python benchmarks/unload_formats.py --table events --schema analytics \\
+        --bucket my-bucket --keypath tmp/bench --runs 3
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from shiftmanager import Redshift
+
+#: None builds JSON in SQL with ``to_json=True``
+MODES = [None, 'json', 'csv', 'parquet']
+WIDTHS = [10, 100, 400]
+TYPES = ['integer', 'boolean', 'character varying(256)', 'timestamp',
+         'numeric(18,2)']
+
+
+def mode_name(mode):
+    return mode or 'to_json'
+
+
+def select_sizes(redshift):
+    """Return the length of each mode's column list for synthetic tables."""
+    report = {}
+    for width in WIDTHS:
+        columns = [('column_%d' % i, TYPES[i % len(TYPES)])
+                   for i in range(width)]
+        start = time.time()
+        string_json = redshift._json_col_str(columns)
+        native = ', '.join('"%s"' % name for name, _ in columns)
+        report[width] = {
+            'to_json_chars': len(string_json),
+            'to_json_build_seconds': time.time() - start,
+            'native_chars': len(native),
+        }
+    return report
+
+
+def time_unloads(redshift, args):
+    """Return the median seconds each mode takes to unload the table."""
+    report = {}
+    for mode in MODES:
+        timings = []
+        for _ in range(args.runs):
+            start = time.time()
+            redshift.unload_table_to_s3(
+                args.bucket, os.path.join(args.keypath, mode_name(mode)),
+                args.table, schema=args.schema, to_json=mode is None,
+                file_format=mode)
+            timings.append(time.time() - start)
+        timings.sort()
+        report[mode_name(mode)] = {
+            'min_seconds': timings[0],
+            'median_seconds': timings[len(timings) // 2],
+        }
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--table')
+    parser.add_argument('--schema', default='public')
+    parser.add_argument('--bucket')
+    parser.add_argument('--keypath', default='shiftmanager-benchmarks')
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args(argv)
+    if args.table and not args.bucket:
+        parser.error("--table requires --bucket")
+
+    redshift = Redshift(
+        aws_access_key_id=os.environ.get('AWS_ACCESS_KEY_ID'),
+        aws_secret_access_key=os.environ.get('AWS_SECRET_ACCESS_KEY'),
+        security_token=os.environ.get('AWS_SESSION_TOKEN'))
+    report = {
+        'benchmark': 'unload_formats',
+        'python': sys.version.split()[0],
+        'select_sizes': select_sizes(redshift),
+    }
+    if args.table:
+        report['table'] = '%s.%s' % (args.schema, args.table)
+        report['runs'] = args.runs
+        report['unload'] = time_unloads(redshift, args)
+    print(json.dumps(report, indent=2, sort_keys=True))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -48,5 +48,10 @@ setup(
         "psycopg2>=2.5.4",
         "sqlalchemy-redshift>=0.7.0",
         "sqlalchemy-views>=0.2",
-    ]
+    ],
+    entry_points={
+        'console_scripts': [
+            'shiftmanager-dump-ddl = shiftmanager.dump:main',
+        ],
+    },
 )
@@ -5,6 +5,7 @@
 from shiftmanager import metadata
 from shiftmanager import redshift
 from shiftmanager.redshift import Redshift
+from shiftmanager.retry import RetryPolicy
 
 
 __version__ = metadata.version
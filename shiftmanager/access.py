@@ -0,0 +1,189 @@
+"""
+An inverted index of who can access which relations.
+
+Answering "what can this user read?" relation by relation takes a
+privilege lookup per relation and still misses access through groups.
+An `AccessIndex` instead scans the ACLs of every relation in a set of
+schemas with one query, reads group membership with two more, and keeps
+each grantee's privileges as a bitmask per relation (see
+`shiftmanager.privileges`) in both directions, so both user-to-relations
+and relation-to-users questions are answered from memory.
+
+`AccessIndex.refresh` rescans the loaded schemas and updates only the
+entries of relations whose owner or ACL changed.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+from shiftmanager import queries
+from shiftmanager.privileges import (PRIVILEGE_MASK, acl_masks,
+                                     mask_from_policy)
+from shiftmanager.users import current_state
+
+try:
+    string_types = basestring  # noqa: F821
+except NameError:
+    string_types = str
+
+
+class AccessIndex(object):
+    """
+    In-memory index of relation privileges by grantee and by relation,
+    resolving access through groups, PUBLIC, ownership and superusers.
+
+    Relations are keyed by (schema, name) pairs and grantees named as in
+    GRANT statements: 'PUBLIC', a user name, or 'GROUP name'.
+
+    Parameters
+    ----------
+    fetchall : callable
+        Function taking a query and parameters and returning all result rows
+    """
+
+    def __init__(self, fetchall):
+        self.fetchall = fetchall
+        self.schemas = set()
+        self._acls = {}
+        self._by_grantee = {}
+        self._owned = {}
+        self._users = {}
+        self._members = {}
+
+    def load(self, schemas):
+        """
+        Index every relation in *schemas*, and the users and groups,
+        replacing anything already indexed for them.
+
+        Parameters
+        ----------
+        schemas : str or list of str
+        """
+        if isinstance(schemas, string_types):
+            schemas = [schemas]
+        self.refresh(schemas)
+
+    def refresh(self, schemas=None):
+        """
+        Rescan *schemas*, or every loaded schema if None, along with the
+        users and groups, and update the entries of relations that were
+        created, dropped, or had their owner or ACL changed.
+
+        Returns
+        -------
+        set of the (schema, name) keys of relations whose entries changed
+        """
+        schemas = tuple(sorted(self.schemas if schemas is None
+                               else schemas))
+        self._load_membership()
+        if not schemas:
+            return set()
+        seen = {}
+        for schema, name, _, owner, privileges, _ in \
+                self.fetchall(queries.all_privileges, {'schemas': schemas}):
+            seen[(schema, name)] = (owner, privileges)
+        changed = set()
+        for key in list(self._acls):
+            if key[0] in schemas and key not in seen:
+                self._remove(key)
+                changed.add(key)
+        for key, acl in seen.items():
+            if self._acls.get(key, (None, None))[:2] != acl:
+                self._remove(key)
+                self._add(key, *acl)
+                changed.add(key)
+        self.schemas.update(schemas)
+        return changed
+
+    def _load_membership(self):
+        users, _ = current_state(self.fetchall(queries.users),
+                                 self.fetchall(queries.groups))
+        self._users = users
+        self._members = {}
+        for user in users.values():
+            for group in user.groups:
+                self._members.setdefault(group, set()).add(user.name)
+
+    def _add(self, key, owner, privileges):
+        masks = acl_masks(privileges)
+        self._acls[key] = (owner, privileges, masks)
+        self._owned.setdefault(owner, set()).add(key)
+        for grantee, mask in masks.items():
+            self._by_grantee.setdefault(grantee, {})[key] = mask
+
+    def _remove(self, key):
+        entry = self._acls.pop(key, None)
+        if entry is None:
+            return
+        owned = self._owned[entry[0]]
+        owned.discard(key)
+        if not owned:
+            del self._owned[entry[0]]
+        for grantee in entry[2]:
+            relations = self._by_grantee[grantee]
+            relations.pop(key, None)
+            if not relations:
+                del self._by_grantee[grantee]
+
+    def grants(self, grantee):
+        """
+        Return a dict mapping (schema, name) to the privilege bitmask
+        granted directly to *grantee*, not counting groups or PUBLIC.
+        """
+        return dict(self._by_grantee.get(grantee, {}))
+
+    def relations_for(self, user, privilege='SELECT'):
+        """
+        Return a dict mapping the (schema, name) of each relation *user*
+        holds *privilege* on, directly, through a group or PUBLIC, or by
+        owning it, to the bitmask of all privileges the user holds there.
+
+        Superusers hold every privilege on every indexed relation. Pass
+        None as *privilege* to include relations with any privilege.
+        """
+        wanted = self._privilege_mask(privilege)
+        state = self._users.get(user)
+        if state is not None and state.createuser:
+            return dict((key, PRIVILEGE_MASK) for key in self._acls)
+        grantees = [user, 'PUBLIC']
+        if state is not None:
+            grantees += ['GROUP ' + group for group in state.groups]
+        held = {}
+        for grantee in grantees:
+            for key, mask in self._by_grantee.get(grantee, {}).items():
+                held[key] = held.get(key, 0) | (mask & PRIVILEGE_MASK)
+        for key in self._owned.get(user, ()):
+            held[key] = PRIVILEGE_MASK
+        return dict((key, mask) for key, mask in held.items()
+                    if mask & wanted)
+
+    def users_for(self, relation, privilege='SELECT'):
+        """
+        Return the set of users holding *privilege* on *relation*, a
+        (schema, name) pair, directly, through a group or PUBLIC, by
+        owning it, or as superusers.
+        """
+        wanted = self._privilege_mask(privilege)
+        entry = self._acls.get(tuple(relation))
+        if entry is None:
+            raise KeyError("No privileges found for %s.%s" % tuple(relation))
+        owner, _, masks = entry
+        users = set(name for name, state in self._users.items()
+                    if state.createuser)
+        users.add(owner)
+        for grantee, mask in masks.items():
+            if not mask & wanted:
+                continue
+            if grantee == 'PUBLIC':
+                return set(self._users)
+            if grantee.startswith('GROUP '):
+                users.update(self._members.get(grantee[len('GROUP '):], ()))
+            else:
+                users.add(grantee)
+        return users
+
+    @staticmethod
+    def _privilege_mask(privilege):
+        if privilege is None:
+            return PRIVILEGE_MASK
+        return mask_from_policy([privilege])
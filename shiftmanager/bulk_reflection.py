@@ -0,0 +1,208 @@
+"""
+Reflect every table in a schema with a handful of bulk catalog queries.
+
+Autoloading a :class:`~sqlalchemy.schema.Table` issues several catalog
+queries per table. Here we instead fetch columns, encodings, dist/sort keys
+and constraints for a whole schema at once, then build the tables locally
+using the Redshift dialect's own type parsing. The raw catalog rows are
+plain lists, so they can be persisted to disk as JSON and reused until a
+fingerprint of the schema's catalog entries changes.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import hashlib
+import json
+import os
+import re
+
+import sqlalchemy
+from sqlalchemy_redshift.dialect import (FOREIGN_KEY_RE, PRIMARY_KEY_RE,
+                                         SQL_IDENTIFIER_RE)
+
+from shiftmanager import queries
+
+# Bump when the layout of cached rows changes
+CACHE_VERSION = 1
+
+UNIQUE_RE = re.compile(r'^UNIQUE\s*\((?P<columns>.*)\)')
+
+
+def _quote_search_path(schema):
+    """
+    Return *schema* quoted for setting ``search_path`` to it.
+    It is always quoted, so the name is kept exactly as given, even if
+    it is mixed case.
+
+    >>> print(_quote_search_path('my"schema'))
+    "my""schema"
+    """
+    return '"%s"' % schema.replace('"', '""')
+
+
+def schema_fingerprint(fetchall, schema):
+    """Return a hex digest that changes whenever tables, views, columns
+    or constraints in *schema* are created, dropped or altered, including
+    changes to column encodings and dist and sort keys."""
+    rows = fetchall(queries.schema_fingerprint, {'schema': schema})
+    digest = hashlib.md5()
+    for row in rows:
+        digest.update(repr(tuple(row)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def fetch_schema_rows(fetchall, schema):
+    """Return the raw catalog rows describing *schema*, as plain lists."""
+    params = {'schema': schema}
+    columns_query = queries.bulk_columns.format(
+        search_path=_quote_search_path(schema))
+    return {
+        'relations': [list(r) for r in
+                      fetchall(queries.bulk_relations, params)],
+        'columns': [list(r) for r in fetchall(columns_query, params)],
+        'constraints': [list(r) for r in
+                        fetchall(queries.bulk_constraints, params)],
+    }
+
+
+def load_cached_rows(path, fingerprint):
+    """Return rows cached at *path* if they match *fingerprint*,
+    otherwise None."""
+    try:
+        with open(path) as f:
+            cached = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    if cached.get('version') != CACHE_VERSION or \
+            cached.get('fingerprint') != fingerprint:
+        return None
+    return cached['rows']
+
+
+def save_cached_rows(path, fingerprint, rows):
+    """Persist *rows* to *path*, tagged with *fingerprint*."""
+    directory = os.path.dirname(path)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'version': CACHE_VERSION, 'fingerprint': fingerprint,
+                   'rows': rows}, f)
+    os.rename(tmp_path, path)
+
+
+def _identifiers(colstring):
+    return [ident.strip('"') for ident in SQL_IDENTIFIER_RE.findall(colstring)]
+
+
+def _sortkey_order(sortkey):
+    # Interleaved sort key positions are negative
+    return abs(int(sortkey))
+
+
+def build_tables(rows, schema, metadata, dialect):
+    """
+    Build a :class:`~sqlalchemy.schema.Table` in *metadata* for every
+    relation in *rows*, replacing any existing table of the same name.
+
+    Foreign keys are only reproduced when they refer to tables in the
+    same schema, since other schemas haven't been reflected.
+
+    Returns
+    -------
+    dict mapping relation names to tables
+    """
+    columns_by_relation = {}
+    for relname, name, encode, distkey, sortkey, notnull, format_type, \
+            default in rows['columns']:
+        columns_by_relation.setdefault(relname, []).append(dict(
+            name=name, encode=encode, distkey=distkey, sortkey=sortkey,
+            notnull=notnull, format_type=format_type, default=default))
+    constraints_by_relation = {}
+    for relname, contype, conname, condef in rows['constraints']:
+        constraints_by_relation.setdefault(relname, []).append(
+            (contype, conname, condef))
+    relation_names = set(r[0] for r in rows['relations'])
+
+    # Remove stale tables up front, so that foreign keys
+    # don't resolve to tables that are about to be replaced
+    for relname in relation_names:
+        key = schema + '.' + relname
+        if key in metadata.tables:
+            metadata.remove(metadata.tables[key])
+
+    tables = {}
+    for relname, relkind, diststyle in rows['relations']:
+        cols = columns_by_relation.get(relname)
+        if not cols:
+            continue
+        args = [_build_column(col, schema, dialect) for col in cols]
+        for contype, conname, condef in \
+                constraints_by_relation.get(relname, []):
+            constraint = _build_constraint(contype, conname, condef,
+                                           schema, relation_names)
+            if constraint is not None:
+                args.append(constraint)
+
+        kwargs = {}
+        if relkind == 'r':
+            sortkey_cols = sorted([c for c in cols if c['sortkey']],
+                                  key=lambda c: _sortkey_order(c['sortkey']))
+            sortkey = [c['name'] for c in sortkey_cols]
+            interleaved = any(int(c['sortkey']) < 0 for c in sortkey_cols)
+            distkeys = [c['name'] for c in cols if c['distkey']]
+            kwargs = dict(
+                redshift_diststyle=diststyle,
+                redshift_distkey=distkeys[0] if distkeys else None,
+                redshift_sortkey=None if interleaved else sortkey,
+                redshift_interleaved_sortkey=sortkey if interleaved else None,
+            )
+
+        tables[relname] = sqlalchemy.Table(relname, metadata, *args,
+                                           schema=schema, **kwargs)
+    return tables
+
+
+def _build_column(col, schema, dialect):
+    column_info = dialect._get_column_info(
+        name=col['name'], format_type=col['format_type'],
+        default=col['default'], notnull=col['notnull'], domains={},
+        enums=[], schema=schema, encode=col['encode'])
+    args = []
+    if column_info.get('default') is not None:
+        args.append(sqlalchemy.schema.DefaultClause(
+            sqlalchemy.text(column_info['default']), _reflected=True))
+    return sqlalchemy.Column(column_info['name'], column_info['type'], *args,
+                             nullable=column_info['nullable'],
+                             autoincrement=column_info.get('autoincrement',
+                                                           'auto'),
+                             info=column_info['info'])
+
+
+def _build_constraint(contype, conname, condef, schema, relation_names):
+    if contype == 'p':
+        m = PRIMARY_KEY_RE.match(condef)
+        if m:
+            return sqlalchemy.PrimaryKeyConstraint(
+                *_identifiers(m.group('columns')), name=conname)
+    elif contype == 'u':
+        m = UNIQUE_RE.match(condef)
+        if m:
+            # Unnamed, matching sqlalchemy-redshift's reflection
+            return sqlalchemy.UniqueConstraint(
+                *_identifiers(m.group('columns')))
+    elif contype == 'f':
+        m = FOREIGN_KEY_RE.match(condef)
+        if not m:
+            return None
+        referred_schema = (m.group('referred_schema') or schema).strip('"')
+        referred_table = m.group('referred_table').strip('"')
+        if referred_schema != schema or \
+                referred_table not in relation_names:
+            return None
+        referred = ['%s.%s.%s' % (referred_schema, referred_table, col)
+                    for col in _identifiers(m.group('referred_columns'))]
+        return sqlalchemy.ForeignKeyConstraint(
+            _identifiers(m.group('columns')), referred, name=conname)
+    return None
@@ -0,0 +1,197 @@
+"""
+A cached snapshot of Redshift catalog information.
+
+Looking up column types, distribution styles and identity columns one
+relation at a time costs a catalog query per call. A `CatalogSnapshot`
+instead loads everything it knows about a set of schemas in a few bulk
+queries and answers later lookups from memory until its entries expire
+or are explicitly invalidated. A `PrivilegeCache` does the same for the
+ownership and grants that `table_definition` reproduces; both share the
+loading and expiry of `SchemaCache`.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+from collections import namedtuple
+import time
+
+from shiftmanager import queries
+
+try:
+    string_types = basestring  # noqa: F821
+except NameError:
+    string_types = str
+
+# Redshift distribution styles, as stored in pg_class.reldiststyle
+DISTSTYLES_BY_INDEX = {
+    0: 'EVEN',
+    1: 'KEY',
+    8: 'ALL',
+}
+
+#: Catalog information about a single table or view.
+#: *columns* and *types* are parallel tuples in column order;
+#: *size* (in 1 MB blocks) and *rows* are None for views and empty tables.
+Relation = namedtuple('Relation', ['kind', 'diststyle', 'size', 'rows',
+                                   'columns', 'types', 'identity_columns'])
+
+
+class SchemaCache(object):
+    """
+    In-memory cache of per-relation information for one or more schemas.
+
+    Schemas are loaded in bulk on first lookup, or up front via `load`,
+    and are reloaded once they are older than *ttl* seconds. Subclasses
+    supply `_fetch`, which queries a set of schemas at once.
+
+    Parameters
+    ----------
+    fetchall : callable
+        Function taking a query and parameters and returning all result rows
+    ttl : int or float
+        Seconds after which a loaded schema is considered stale;
+        None disables expiry
+    on_invalidate : callable
+        Called with the schema, or None for every schema, whenever
+        `invalidate` discards cached information
+    """
+
+    def __init__(self, fetchall, ttl=300, on_invalidate=None):
+        self.fetchall = fetchall
+        self.ttl = ttl
+        self.on_invalidate = on_invalidate
+        self._schemas = {}
+
+    def load(self, schemas):
+        """
+        Load information for every relation in *schemas* in bulk,
+        replacing anything already cached for them.
+
+        Parameters
+        ----------
+        schemas : str or list of str
+        """
+        if isinstance(schemas, string_types):
+            schemas = [schemas]
+        schemas = tuple(schemas)
+        loaded_at = time.time()
+        relations = dict((schema, {}) for schema in schemas)
+        for schema, name, entry in self._fetch(schemas):
+            relations[schema][name] = entry
+        for schema in schemas:
+            self._schemas[schema] = (loaded_at, relations[schema])
+
+    def _fetch(self, schemas):
+        """Return (schema, name, entry) for every relation in *schemas*."""
+        raise NotImplementedError
+
+    def invalidate(self, schema=None):
+        """
+        Discard cached information for *schema*, or for all schemas
+        if *schema* is None.
+        """
+        if schema is None:
+            self._schemas.clear()
+        else:
+            self._schemas.pop(schema, None)
+        if self.on_invalidate is not None:
+            self.on_invalidate(schema)
+
+    def relations(self, schema):
+        """
+        Return a dict mapping relation names in *schema* to their
+        entries, loading the schema if it is absent or stale.
+        """
+        cached = self._schemas.get(schema)
+        if cached is None or self._expired(cached[0]):
+            self.load([schema])
+            cached = self._schemas[schema]
+        return cached[1]
+
+    def _expired(self, loaded_at):
+        return self.ttl is not None and time.time() - loaded_at > self.ttl
+
+
+class CatalogSnapshot(SchemaCache):
+    """
+    In-memory snapshot of catalog information for one or more schemas,
+    with a `Relation` for each table and view.
+
+    Parameters
+    ----------
+    fetchall : callable
+        Function taking a query and parameters and returning all result rows
+    ttl : int or float
+        Seconds after which a loaded schema is considered stale;
+        None disables expiry
+    """
+
+    def _fetch(self, schemas):
+        params = {'schemas': schemas}
+        kinds, table_info = {}, {}
+        for schema, name, kind, reldiststyle in self.fetchall(
+                queries.catalog_relations, params):
+            kinds[schema, name] = (kind, reldiststyle)
+        for schema, name, diststyle, size, rows in self.fetchall(
+                queries.catalog_table_info, params):
+            table_info[schema, name] = (diststyle, size, rows)
+        columns = {}
+        for schema, name, column, col_type, is_identity in self.fetchall(
+                queries.catalog_columns, params):
+            columns.setdefault((schema, name), []).append(
+                (column, col_type, is_identity))
+
+        for (schema, name), (kind, reldiststyle) in kinds.items():
+            diststyle, size, rows = table_info.get(
+                (schema, name), (None, None, None))
+            if kind == 'r' and diststyle is None:
+                diststyle = DISTSTYLES_BY_INDEX.get(reldiststyle)
+            cols = columns.get((schema, name), [])
+            yield schema, name, Relation(
+                kind=kind,
+                diststyle=diststyle,
+                size=size,
+                rows=rows,
+                columns=tuple(c[0] for c in cols),
+                types=tuple(c[1] for c in cols),
+                identity_columns=frozenset(c[0] for c in cols if c[2]),
+            )
+
+    def relation(self, name, schema='public'):
+        """Return the `Relation` for *name* in *schema*, or None."""
+        return self.relations(schema).get(name)
+
+
+#: Ownership and access privileges of a single relation;
+#: *privileges* is the relation's ACL in the format of psql's \z.
+RelationPrivileges = namedtuple('RelationPrivileges', [
+    'kind', 'owner_name', 'privileges', 'type'])
+
+
+class PrivilegeCache(SchemaCache):
+    """
+    In-memory cache of ownership and privileges for relations in
+    one or more schemas, with a `RelationPrivileges` for each relation
+    and one query per load.
+
+    Parameters
+    ----------
+    fetchall : callable
+        Function taking a query and parameters and returning all result rows
+    ttl : int or float
+        Seconds after which a loaded schema is considered stale;
+        None disables expiry
+    """
+
+    def _fetch(self, schemas):
+        for schema, name, kind, owner_name, privileges, type_ in \
+                self.fetchall(queries.all_privileges, {'schemas': schemas}):
+            yield schema, name, RelationPrivileges(
+                kind=kind, owner_name=owner_name,
+                privileges=privileges, type=type_)
+
+    def get(self, name, schema='public'):
+        """Return the `RelationPrivileges` for *name* in *schema*,
+        or None if there's no such relation."""
+        return self.relations(schema).get(name)
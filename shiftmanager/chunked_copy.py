@@ -0,0 +1,131 @@
+"""
+Helpers for copying a table in ranges of one column.
+
+A single ``INSERT ... SELECT`` of a multi-terabyte table sorts everything
+at once, using a great deal of query memory and spilling to disk.
+Splitting the copy into ranges of the leading sort key lets each INSERT
+sort only its own range, and recording which ranges are done in a small
+state file lets an interrupted copy pick up where it left off.
+The same kind of range, bounded by the values of a tracking column seen
+at two points in time, selects the rows written to a table in between.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import json
+import os
+
+from shiftmanager.rendering import quote_literal
+
+
+def bounds_query(column, table, chunks):
+    """
+    Return a query for the lower bound of each of *chunks* ranges of
+    *column*, holding roughly equal numbers of rows.
+
+    >>> print(bounds_query('"id"', 'public.events', 4))
+    SELECT MIN(value) FROM (
+      SELECT "id" AS value, NTILE(4) OVER (ORDER BY "id") AS bucket
+      FROM public.events WHERE "id" IS NOT NULL
+    ) GROUP BY bucket ORDER BY 1;
+    """
+    return ("SELECT MIN(value) FROM (\n"
+            "  SELECT {column} AS value, NTILE({chunks}) OVER "
+            "(ORDER BY {column}) AS bucket\n"
+            "  FROM {table} WHERE {column} IS NOT NULL\n"
+            ") GROUP BY bucket ORDER BY 1;"
+            .format(column=column, table=table, chunks=int(chunks)))
+
+
+def quote_bounds(values):
+    """Return distinct *values* as sorted SQL literals."""
+    distinct = []
+    for value in values:
+        if not distinct or value != distinct[-1]:
+            distinct.append(value)
+    return [quote_literal(value) for value in distinct]
+
+
+def chunk_conditions(column, bounds):
+    """
+    Return WHERE conditions that together select every row exactly once,
+    one per range starting at each of *bounds*, plus one for NULLs.
+
+    Parameters
+    ----------
+    column : str
+        Quoted column name
+    bounds : list of str
+        Ascending SQL literals, the first being the column's minimum
+
+    >>> for condition in chunk_conditions('"id"', ['1', '50', '90']):
+    ...     print(condition)
+    "id" < 50
+    "id" >= 50 AND "id" < 90
+    "id" >= 90
+    "id" IS NULL
+    """
+    conditions = []
+    for i, lower in enumerate(bounds):
+        parts = []
+        if i > 0:
+            parts.append('%s >= %s' % (column, lower))
+        if i + 1 < len(bounds):
+            parts.append('%s < %s' % (column, bounds[i + 1]))
+        if not parts:
+            parts.append('%s IS NOT NULL' % column)
+        conditions.append(' AND '.join(parts))
+    conditions.append('%s IS NULL' % column)
+    return conditions
+
+
+def delta_condition(column, after=None, upto=None, include_after=False):
+    """
+    Return a WHERE condition selecting rows whose *column* lies after
+    the literal *after* and up to *upto*, or None to select every row.
+
+    A bound of None leaves that end of the range open.
+
+    >>> print(delta_condition('"id"', after='10', upto='20'))
+    "id" > 10 AND "id" <= 20
+    >>> print(delta_condition('"updated_at"', after="'2016-01-01'",
+    ...                       include_after=True))
+    "updated_at" >= '2016-01-01'
+    >>> print(delta_condition('"id"', upto='20'))
+    "id" <= 20
+    """
+    parts = []
+    if after is not None:
+        parts.append('%s %s %s' % (column, '>=' if include_after else '>',
+                                   after))
+    if upto is not None:
+        parts.append('%s <= %s' % (column, upto))
+    if not parts:
+        return None
+    return ' AND '.join(parts)
+
+
+def load_state(path):
+    """Return the copy state saved at *path*, or None."""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(path, state):
+    """Atomically save the copy *state* to *path*."""
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.rename(tmp_path, path)
+
+
+def clear_state(path):
+    """Remove the copy state at *path*, if any."""
+    if os.path.exists(path):
+        os.remove(path)
@@ -0,0 +1,112 @@
+"""
+Recommended column encodings from ANALYZE COMPRESSION, kept on disk.
+
+ANALYZE COMPRESSION reads a sample of each slice of a table, and on large
+tables it can take longer than the deep copy it's meant to inform.
+Passing a smaller COMPROWS bounds the sample, and a `CompressionAdvice`
+store keeps each recommendation with the time it was made so later deep
+copies can reuse it rather than analyze the table again.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+from collections import namedtuple
+import json
+import os
+import threading
+import time
+
+#: Encodings recommended for one table. *encodings* maps column names
+#: to encodings, and *analyzed_at* is a Unix timestamp.
+Recommendation = namedtuple('Recommendation', [
+    'encodings', 'analyzed_at', 'comprows'])
+
+
+def analyze_compression_statement(table_name, comprows=None):
+    """
+    Return an ANALYZE COMPRESSION statement for *table_name*,
+    sampling *comprows* rows per slice if given.
+
+    >>> print(analyze_compression_statement('public.events', 100000))
+    ANALYZE COMPRESSION public.events COMPROWS 100000
+    """
+    statement = "ANALYZE COMPRESSION %s" % table_name
+    if comprows:
+        statement += " COMPROWS %d" % comprows
+    return statement
+
+
+def encodings_from_rows(rows):
+    """
+    Return a dict mapping columns to encodings from the result rows
+    of ANALYZE COMPRESSION, which are (table, column, encoding,
+    est_reduction_pct).
+    """
+    return dict((row[1], row[2]) for row in rows)
+
+
+class CompressionAdvice(object):
+    """
+    Compression recommendations indexed by (schema, table),
+    optionally persisted as JSON at *path*.
+
+    Safe to share between threads.
+
+    Parameters
+    ----------
+    path : str or None
+        File to load recommendations from and save them to;
+        None keeps them in memory only
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._recommendations = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                for key, value in json.load(f).items():
+                    self._recommendations[key] = Recommendation(**value)
+
+    def get(self, table, schema='public', max_age=None):
+        """
+        Return the `Recommendation` for *table*, or None if there is
+        none or it's more than *max_age* seconds old.
+        """
+        with self._lock:
+            recommendation = self._recommendations.get(
+                self._key(table, schema))
+        if recommendation is None:
+            return None
+        if max_age is not None and \
+                time.time() - recommendation.analyzed_at > max_age:
+            return None
+        return recommendation
+
+    def put(self, table, schema, encodings, comprows=None):
+        """Record *encodings* as the latest recommendation for *table*
+        and return it."""
+        recommendation = Recommendation(encodings=dict(encodings),
+                                        analyzed_at=time.time(),
+                                        comprows=comprows)
+        with self._lock:
+            self._recommendations[self._key(table, schema)] = recommendation
+            self._save()
+        return recommendation
+
+    def _save(self):
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(dict((key, r._asdict()) for key, r in
+                           self._recommendations.items()), f)
+        os.rename(tmp_path, self.path)
+
+    @staticmethod
+    def _key(table, schema):
+        return '%s.%s' % (schema, table)
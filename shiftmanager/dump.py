@@ -0,0 +1,201 @@
+"""
+Dump the DDL for whole schemas, a ``pg_dump --schema-only`` for Redshift.
+
+Reflecting a relation takes several round trips to the catalog, so
+relations are reflected concurrently, each worker thread using its own
+connection. Definitions are written to the output as soon as they're
+ready and in a stable order, with only a bounded number of relations in
+flight at once. Tables come first, then views in dependency order, so the
+dump can be replayed as is.
+
+Run ``shiftmanager-dump-ddl --help`` for the command line interface.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+from collections import deque
+import io
+import sys
+import threading
+from multiprocessing.pool import ThreadPool
+
+from shiftmanager import queries
+
+
+def order_views(views, dependencies):
+    """
+    Return *views* sorted so that each comes after the views it
+    depends on, breaking ties by name.
+
+    Parameters
+    ----------
+    views : iterable of (schema, name) tuples
+    dependencies : iterable of (view, referenced) pairs of (schema, name)
+        Dependencies on relations other than *views* are ignored
+
+    >>> order_views([('s', 'c'), ('s', 'b'), ('s', 'a')],
+    ...             [(('s', 'a'), ('s', 'c')), (('s', 'a'), ('s', 't'))])
+    [('s', 'b'), ('s', 'c'), ('s', 'a')]
+    """
+    views = sorted(views)
+    requires = dict((view, set()) for view in views)
+    for view, referenced in dependencies:
+        if view in requires and referenced in requires and \
+                view != referenced:
+            requires[view].add(referenced)
+    ordered, done = [], set()
+    while len(ordered) < len(views):
+        ready = [v for v in views
+                 if v not in done and requires[v] <= done]
+        if not ready:
+            # A cycle can't be created in Redshift, but don't loop forever
+            ready = [v for v in views if v not in done]
+        for view in ready:
+            ordered.append(view)
+            done.add(view)
+    return ordered
+
+
+def bounded_imap(pool, func, items, window):
+    """
+    Like ``pool.imap``, but with at most *window* items submitted and
+    not yet consumed, so results don't pile up in memory.
+    """
+    pending = deque()
+    for item in items:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def _terminate(batch):
+    return batch.strip().rstrip(';').rstrip() + ';\n\n'
+
+
+def dump_ddl(redshift, schemas, output, max_workers=4, copy_privileges=True):
+    """
+    Write CREATE statements for every table and view in *schemas*
+    to the file-like *output*, along with their owners and grants.
+
+    Parameters
+    ----------
+    redshift : `~shiftmanager.redshift.Redshift`
+        Used to list relations; each worker thread uses a clone of it
+    schemas : list of str
+    output : file-like
+        Receives text
+    max_workers : int
+        Number of relations to reflect concurrently
+    copy_privileges : bool
+        Include ownership and grants
+
+    Returns
+    -------
+    int, the number of relations written
+    """
+    redshift.catalog.load(schemas)
+    tables, views = [], []
+    for schema in schemas:
+        for name, relation in sorted(
+                redshift.catalog.relations(schema).items()):
+            if relation.kind == 'r':
+                tables.append((schema, name))
+            elif relation.kind == 'v':
+                views.append((schema, name))
+    dependencies = [((r[0], r[1]), (r[2], r[3])) for r in redshift._fetchall(
+        queries.view_dependencies, {'schemas': tuple(schemas)})]
+    views = order_views(views, dependencies)
+
+    local = threading.local()
+    workers = []
+    lock = threading.Lock()
+
+    def worker():
+        if not hasattr(local, 'redshift'):
+            local.redshift = redshift.clone()
+            if copy_privileges:
+                local.redshift.privileges.load(schemas)
+            with lock:
+                workers.append(local.redshift)
+        return local.redshift
+
+    def table_ddl(key):
+        schema, name = key
+        return worker().table_definition(
+            name, schema=schema, copy_privileges=copy_privileges)
+
+    def view_ddl(key):
+        schema, name = key
+        return worker().view_definition(
+            name, schema=schema, copy_privileges=copy_privileges)
+
+    for schema in schemas:
+        if schema != 'public':
+            output.write('CREATE SCHEMA IF NOT EXISTS %s;\n\n' %
+                         redshift.preparer.quote_schema(schema))
+
+    pool = ThreadPool(max_workers)
+    count = 0
+    try:
+        window = max_workers * 4
+        for func, keys in [(table_ddl, tables), (view_ddl, views)]:
+            for batch in bounded_imap(pool, func, keys, window):
+                output.write(_terminate(batch))
+                count += 1
+    finally:
+        pool.close()
+        pool.join()
+        for worker_redshift in workers:
+            worker_redshift._discard_connection()
+    return count
+
+
+def main(argv=None):
+    """Entry point for the ``shiftmanager-dump-ddl`` command."""
+    from shiftmanager.redshift import Redshift
+
+    parser = argparse.ArgumentParser(
+        description="Dump table and view definitions, owners and grants "
+                    "for Redshift schemas. Connection parameters default "
+                    "to the PGHOST, PGPORT, PGUSER, PGPASSWORD and "
+                    "PGDATABASE environment variables.")
+    parser.add_argument('schemas', nargs='*', default=['public'],
+                        help="schemas to dump (default: public)")
+    parser.add_argument('-o', '--output',
+                        help="file to write to (default: stdout)")
+    parser.add_argument('-j', '--jobs', type=int, default=4,
+                        help="relations to reflect concurrently")
+    parser.add_argument('--no-privileges', action='store_true',
+                        help="omit ownership and grants")
+    parser.add_argument('--host')
+    parser.add_argument('--port', type=int, default=5439)
+    parser.add_argument('--user')
+    parser.add_argument('--database')
+    args = parser.parse_args(argv)
+
+    redshift = Redshift(host=args.host, port=args.port, user=args.user,
+                        database=args.database)
+    stdout = sys.stdout
+    if args.output:
+        output = io.open(args.output, 'w', encoding='utf-8')
+    else:
+        output = stdout
+    # Keep progress messages out of a dump written to stdout
+    sys.stdout = sys.stderr
+    try:
+        count = dump_ddl(redshift, args.schemas, output,
+                         max_workers=args.jobs,
+                         copy_privileges=not args.no_privileges)
+    finally:
+        sys.stdout = stdout
+        if output is not stdout:
+            output.close()
+    print("Dumped %d relations" % count, file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
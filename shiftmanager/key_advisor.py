@@ -0,0 +1,292 @@
+"""
+Suggesting distribution and sort keys from a cluster's query history.
+
+Joins whose inputs aren't distributed on the join column have to
+redistribute (DS_DIST_*) or broadcast (DS_BCAST_INNER) rows between nodes
+at query time. The plans in stl_explain name the join columns of those
+steps and the tables scanned on either side of them, and
+svl_query_summary records how long the redistribution took, so together
+they show which column of each table would have saved the most time as
+its distkey.
+A candidate is only suggested if it has enough distinct values, and no
+single dominant value, to spread rows evenly across slices.
+
+Sort keys are suggested from the columns queries filter each table on
+most often, since a leading sort key lets those scans skip blocks.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+from collections import namedtuple
+import re
+
+#: Suggested keys for one table. *kwargs* are ready to pass to
+#: `reflected_table` or `deep_copy`; *expected_gain_seconds* is the time
+#: spent redistributing rows for joins the suggestion would have avoided,
+#: and *filtered_scans* is the number of scans the suggested sort key
+#: would have helped.
+KeyAdvice = namedtuple('KeyAdvice', [
+    'schema', 'table', 'kwargs', 'changed', 'expected_gain_seconds',
+    'redistributed_bytes', 'filtered_scans', 'reasons'])
+
+_IDENTIFIER = r'"?([A-Za-z_][\w$]*)"?'
+_QUALIFIER = r'(?:"?(\w+)"?\.)?'
+JOIN_CONDITION_RE = re.compile(
+    _QUALIFIER + _IDENTIFIER + r'\s*=\s*' + _QUALIFIER + _IDENTIFIER)
+REDISTRIBUTION_RE = re.compile(
+    r'\bDS_(?:BCAST_INNER|DIST_(?:INNER|OUTER|BOTH|ALL_INNER))\b')
+FILTER_COLUMN_RE = re.compile(
+    r'\(\s*(?:"?\w+"?\.)?' + _IDENTIFIER +
+    r'\s*(?:=|<>|!=|<=|>=|<|>|~~|!~~|IS\b|IN\b|BETWEEN\b)')
+SCAN_TABLE_RE = re.compile(r'Seq Scan on\s+' + _IDENTIFIER)
+
+
+def join_columns(info):
+    """
+    Return (side, column) for the columns on either side of the
+    equalities in a join condition from stl_explain, where *side* is
+    'outer' or 'inner', or None if the condition doesn't say.
+
+    >>> for side, column in join_columns(
+    ...         'Hash Cond: ("outer".customer_id = "inner".id)'):
+    ...     print(side, column)
+    outer customer_id
+    inner id
+    """
+    columns = []
+    for qualifier, left, other, right in JOIN_CONDITION_RE.findall(info):
+        columns += [(_side(qualifier), left), (_side(other), right)]
+    return columns
+
+
+def _side(qualifier):
+    return qualifier if qualifier in ('outer', 'inner') else None
+
+
+def filter_columns(info):
+    """
+    Return the set of columns compared in a scan filter from stl_explain.
+
+    >>> print(*sorted(filter_columns(
+    ...     "Filter: ((event_date >= '2016-01-01'::date) "
+    ...     "AND (status = 'open'::bpchar))")))
+    event_date status
+    """
+    return set(FILTER_COLUMN_RE.findall(info))
+
+
+def scanned_table(plannode):
+    """
+    Return the name of the table a scan plan node reads.
+
+    >>> print(scanned_table('XN Seq Scan on events e  (cost=0.00..1.00)'))
+    events
+    """
+    match = SCAN_TABLE_RE.search(plannode)
+    return match.group(1) if match else None
+
+
+def _scanned_tables(nodes, children, query, nodeid):
+    """Return the tables scanned by a plan step and the steps beneath it."""
+    tables = set()
+    pending = [nodeid]
+    while pending:
+        node = pending.pop()
+        table = scanned_table(nodes[(query, node)][0])
+        if table:
+            tables.add(table)
+        pending.extend(children.get((query, node), ()))
+    return tables
+
+
+def join_stats(plans, costs, columns_by_table):
+    """
+    Attribute the cost of redistributed joins to table columns.
+
+    Each join column is credited to the tables scanned on its side of
+    the join that have a column of that name. Where that leaves more
+    than one table, the cost is split evenly between them.
+
+    Parameters
+    ----------
+    plans : iterable of (query, nodeid, parentid, plannode, info)
+        Every step of the plans of queries with redistributing joins,
+        as from ``redistributed_join_plans``
+    costs : iterable of (query, bytes, microseconds)
+        Redistribution cost per query, as from ``redistribution_cost``
+    columns_by_table : dict
+        Maps table names to their sets of column names
+
+    Returns
+    -------
+    dict mapping table names to dicts mapping column names to stats
+    dicts with 'seconds', 'bytes', 'joins' and 'broadcasts'
+    """
+    cost_by_query = dict((query, (bytes_ or 0, (micros or 0) / 1e6))
+                         for query, bytes_, micros in costs)
+    nodes = {}
+    children = {}
+    for query, nodeid, parentid, plannode, info in plans:
+        nodes[(query, nodeid)] = (plannode, info)
+        children.setdefault((query, parentid), []).append(nodeid)
+    joins = sorted(key for key, (plannode, _) in nodes.items()
+                   if REDISTRIBUTION_RE.search(plannode))
+    joins_per_query = {}
+    for query, _ in joins:
+        joins_per_query[query] = joins_per_query.get(query, 0) + 1
+
+    stats = {}
+    for query, nodeid in joins:
+        plannode, info = nodes[(query, nodeid)]
+        bytes_, seconds = cost_by_query.get(query, (0, 0.0))
+        share = 1.0 / joins_per_query[query]
+        broadcast = 'DS_BCAST_INNER' in plannode
+        # The outer input is listed first
+        inputs = [_scanned_tables(nodes, children, query, child)
+                  for child in sorted(children.get((query, nodeid), ()))]
+        sides = {'outer': inputs[0] if inputs else set(),
+                 'inner': set().union(*inputs[1:])}
+        for side, column in join_columns(info or ''):
+            tables = sides[side] if side else sides['outer'] | sides['inner']
+            candidates = [table for table in sorted(tables)
+                          if column in columns_by_table.get(table, ())]
+            for table in candidates:
+                stat = stats.setdefault(table, {}).setdefault(
+                    column, {'seconds': 0.0, 'bytes': 0, 'joins': 0,
+                             'broadcasts': 0})
+                stat['seconds'] += seconds * share / len(candidates)
+                stat['bytes'] += int(bytes_ * share / len(candidates))
+                stat['joins'] += 1
+                stat['broadcasts'] += int(broadcast)
+    return stats
+
+
+def filter_stats(filters, columns_by_table):
+    """
+    Count how often each column of each table is filtered on.
+
+    Parameters
+    ----------
+    filters : iterable of (query, plannode, info)
+        Filtered scans, as from ``scan_filters``
+    columns_by_table : dict
+        Maps table names to their sets of column names
+
+    Returns
+    -------
+    dict mapping table names to dicts mapping column names to counts
+    """
+    stats = {}
+    for _, plannode, info in filters:
+        table = scanned_table(plannode)
+        if table not in columns_by_table:
+            continue
+        for column in filter_columns(info or ''):
+            if column in columns_by_table[table]:
+                counts = stats.setdefault(table, {})
+                counts[column] = counts.get(column, 0) + 1
+    return stats
+
+
+def skew(distinct, rows, max_count, slices):
+    """
+    Return how many slices' worth of rows the most common value holds;
+    values above 1 mean that value alone overloads its slice.
+
+    >>> skew(distinct=1000, rows=1000000, max_count=5000, slices=16)
+    0.08
+    """
+    if not rows or not slices:
+        return 0.0
+    return max_count * slices / float(rows)
+
+
+def advise(schema, table, current_diststyle, current_sortkey, rows,
+           joins, filters, profile, slices, max_skew=1.0,
+           min_distinct_per_slice=4, all_max_rows=5000000, sortkey_columns=2):
+    """
+    Return a `KeyAdvice` for one table.
+
+    Parameters
+    ----------
+    schema, table : str
+    current_diststyle : str
+        As in svv_table_info, like 'KEY(id)', 'EVEN' or 'ALL'
+    current_sortkey : str or None
+        The current leading sort key column
+    rows : int
+        Number of rows in the table
+    joins : dict
+        This table's column stats from `join_stats`
+    filters : dict
+        This table's column counts from `filter_stats`
+    profile : callable
+        Called with a column name, returning its (distinct, rows,
+        max_count); only called for distkey candidates
+    slices : int
+        Number of slices in the cluster
+    max_skew : float
+        Largest acceptable `skew` for a distkey
+    min_distinct_per_slice : int
+        Fewest distinct values per slice acceptable for a distkey
+    all_max_rows : int
+        Largest table to suggest DISTSTYLE ALL for when no distkey is
+        acceptable but the table is broadcast
+    sortkey_columns : int
+        Largest number of columns to suggest for a compound sort key
+    """
+    reasons = []
+    kwargs = {}
+    gain, redistributed = 0.0, 0
+    candidates = sorted(joins.items(),
+                        key=lambda item: (-item[1]['seconds'],
+                                          -item[1]['bytes'], item[0]))
+    for column, stat in candidates:
+        distinct, profiled_rows, max_count = profile(column)
+        column_skew = skew(distinct, profiled_rows, max_count, slices)
+        if distinct < slices * min_distinct_per_slice:
+            reasons.append("%s has too few distinct values (%d) to "
+                           "distribute on" % (column, distinct))
+            continue
+        if column_skew > max_skew:
+            reasons.append("%s is too skewed to distribute on "
+                           "(%.1f slices' worth in one value)" %
+                           (column, column_skew))
+            continue
+        kwargs['redshift_diststyle'] = 'KEY'
+        kwargs['redshift_distkey'] = column
+        gain, redistributed = stat['seconds'], stat['bytes']
+        reasons.append("%d joins on %s redistributed %d bytes in %.1f "
+                       "seconds" % (stat['joins'], column, stat['bytes'],
+                                    stat['seconds']))
+        break
+    else:
+        broadcasts = [s for s in joins.values() if s['broadcasts']]
+        if broadcasts and rows <= all_max_rows:
+            kwargs['redshift_diststyle'] = 'ALL'
+            gain = sum(s['seconds'] for s in broadcasts)
+            redistributed = sum(s['bytes'] for s in broadcasts)
+            reasons.append("small table broadcast in %d joins" %
+                           sum(s['broadcasts'] for s in broadcasts))
+
+    filtered_scans = 0
+    ranked = sorted(filters.items(), key=lambda item: (-item[1], item[0]))
+    sortkey = tuple(column for column, _ in ranked[:sortkey_columns])
+    if sortkey:
+        kwargs['redshift_sortkey'] = sortkey
+        filtered_scans = ranked[0][1]
+        reasons.append("%d scans filtered on %s" %
+                       (filtered_scans, sortkey[0]))
+
+    changed = False
+    if 'redshift_distkey' in kwargs:
+        changed = current_diststyle != 'KEY(%s)' % kwargs['redshift_distkey']
+    elif kwargs.get('redshift_diststyle') == 'ALL':
+        changed = current_diststyle != 'ALL'
+    if sortkey and sortkey[0] != current_sortkey:
+        changed = True
+    return KeyAdvice(schema=schema, table=table, kwargs=kwargs,
+                     changed=changed, expected_gain_seconds=gain,
+                     redistributed_bytes=redistributed,
+                     filtered_scans=filtered_scans, reasons=reasons)
@@ -0,0 +1,742 @@
+"""
+A local stand-in for Redshift and S3, for running whole load and unload
+pipelines offline.
+
+`LocalRedshift` talks to a local Postgres in Redshift's place and keeps
+"S3" in a directory, with a bucket per subdirectory and a file per key,
+through `FilesystemS3Connection`, `FilesystemBucket` and `FilesystemKey`,
+which implement the parts of boto's API shiftmanager uses. Statements
+Postgres doesn't understand are emulated by the connection:
+
+* ``COPY ... FROM 's3://...'`` reads the listed files, or those under the
+  prefix, from the bucket directory, gunzips them with GZIP, and loads
+  them with Postgres's own COPY; JSON is mapped onto columns by name
+  with JSON 'auto', or through a jsonpaths file
+* ``UNLOAD`` runs its SELECT and writes the rows to part files spread
+  over *slices*, as delimited text, CSV or JSON, optionally gzipped,
+  followed by a manifest with MANIFEST; CLEANPATH empties the
+  destination prefix first
+
+Parquet, PARTITION BY and compressions other than GZIP aren't emulated
+and raise NotImplementedError. The catalog queries behind `catalog` and
+`iter_table` are swapped for Postgres equivalents, which report every
+table as DISTSTYLE EVEN.
+
+Example::
+
+    redshift = LocalRedshift(database='shiftmanager', user='shiftmanager',
+                             s3_root='/tmp/local-s3')
+    redshift.copy_json_to_table('bucket', 'tmp/events', rows, jsonpaths,
+                                'events')
+    redshift.unload_table_to_s3('bucket', 'tmp/unloaded', 'events')
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import gzip
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+
+import psycopg2
+
+from shiftmanager import queries
+from shiftmanager.memoized_property import memoized_property
+from shiftmanager.redshift import Redshift
+from shiftmanager.unload import (ChunkReader, gunzip_chunks, iter_lines,
+                                 manifest_urls)
+
+
+class FilesystemKey(object):
+    """An S3 key stored as a file under its bucket's directory."""
+
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.canned_acl = None
+        self._file = None
+
+    @property
+    def path(self):
+        return self.bucket.path(self.name)
+
+    @property
+    def size(self):
+        return os.path.getsize(self.path)
+
+    def exists(self):
+        return os.path.isfile(self.path)
+
+    def set_contents_from_file(self, fp, **kwargs):
+        directory = os.path.dirname(self.path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(self.path, 'wb') as f:
+            while True:
+                chunk = fp.read(1024 * 1024)
+                if not chunk:
+                    break
+                if not isinstance(chunk, bytes):
+                    chunk = chunk.encode('utf-8')
+                f.write(chunk)
+        return self.size
+
+    def set_contents_from_string(self, data, **kwargs):
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        return self.set_contents_from_file(io.BytesIO(data))
+
+    def set_contents_from_filename(self, filename, **kwargs):
+        with open(filename, 'rb') as f:
+            return self.set_contents_from_file(f)
+
+    def set_canned_acl(self, acl):
+        self.canned_acl = acl
+
+    def get_contents_as_string(self):
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def get_contents_to_filename(self, filename):
+        shutil.copyfile(self.path, filename)
+
+    def read(self, size=-1):
+        if self._file is None:
+            self._file = open(self.path, 'rb')
+        return self._file.read(size)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def delete(self):
+        self.bucket.delete_key(self.name)
+
+
+class FilesystemBucket(object):
+    """An S3 bucket stored as a directory of files, one per key."""
+
+    def __init__(self, connection, name):
+        self.connection = connection
+        self.name = name
+        self.root = os.path.join(connection.root, name)
+
+    def path(self, name):
+        """Return the file path of the key *name*."""
+        parts = [part for part in name.split('/') if part]
+        if '..' in parts:
+            raise ValueError("Key names can't contain '..': %s" % name)
+        return os.path.join(self.root, *parts)
+
+    def new_key(self, name):
+        return FilesystemKey(self, name)
+
+    def get_key(self, name):
+        key = FilesystemKey(self, name)
+        return key if key.exists() else None
+
+    def delete_key(self, name):
+        path = self.path(getattr(name, 'name', name))
+        if os.path.isfile(path):
+            os.remove(path)
+
+    def delete_keys(self, keys):
+        for key in keys:
+            self.delete_key(key)
+
+    def list(self, prefix=''):
+        """Yield the keys whose names start with *prefix*, in order."""
+        names = []
+        for directory, _, files in os.walk(self.root):
+            relative = os.path.relpath(directory, self.root)
+            for filename in files:
+                name = filename if relative == '.' else \
+                    '/'.join(relative.split(os.sep) + [filename])
+                if name.startswith(prefix.lstrip('/')):
+                    names.append(name)
+        for name in sorted(names):
+            yield FilesystemKey(self, name)
+
+
+class FilesystemS3Connection(object):
+    """Stands in for a boto S3 connection, with buckets kept as
+    subdirectories of *root*."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def get_bucket(self, name, validate=True):
+        bucket = FilesystemBucket(self, name)
+        if not os.path.isdir(bucket.root):
+            os.makedirs(bucket.root)
+        return bucket
+
+    create_bucket = get_bucket
+
+
+def split_statements(batch):
+    """
+    Split a batch of SQL into statements, leaving semicolons within
+    quotes, dollar quotes and comments alone.
+
+    >>> batch = "SELECT ';'; UNLOAD ($$SELECT 1;$$) TO 'x';"
+    >>> for statement in split_statements(batch):
+    ...     print(statement)
+    SELECT ';'
+    UNLOAD ($$SELECT 1;$$) TO 'x'
+    """
+    statements = []
+    start = i = 0
+    quote = None
+    while i < len(batch):
+        if quote is not None:
+            end = batch.find(quote, i)
+            i = len(batch) if end < 0 else end + len(quote)
+            quote = None
+        elif batch.startswith('--', i):
+            end = batch.find('\n', i)
+            i = len(batch) if end < 0 else end
+        elif batch.startswith('$$', i):
+            quote = '$$'
+            i += 2
+        elif batch[i] in ('"', "'"):
+            quote = batch[i]
+            i += 1
+        elif batch[i] == ';':
+            statements.append(batch[start:i])
+            start = i = i + 1
+        else:
+            i += 1
+    statements.append(batch[start:])
+    return [s.strip() for s in statements if s.strip()]
+
+
+_S3_URL = r"'s3://(?P<bucket>[^/']+)/*(?P<key>[^']*)'"
+COPY_RE = re.compile(
+    r"^\s*COPY\s+(?P<table>[\w.$\"]+)\s*(?:\((?P<columns>[^)]*)\))?\s+"
+    r"FROM\s+" + _S3_URL + r"(?P<options>.*)$", re.I | re.S)
+UNLOAD_RE = re.compile(
+    r"^\s*UNLOAD\s*\(\s*(?:\$\$(?P<dollar>.*?)\$\$|'(?P<quoted>(?:[^']|'')*)')"
+    r"\s*\)\s*TO\s+" + _S3_URL + r"(?P<options>.*)$", re.I | re.S)
+EMULATED_RE = re.compile(r"\bUNLOAD\b|\bFROM\s+'s3://", re.I)
+_CREDENTIALS_RE = re.compile(
+    r"\b(?:CREDENTIALS|IAM_ROLE|ACCESS_KEY_ID|SECRET_ACCESS_KEY|"
+    r"SESSION_TOKEN)\s+(?:AS\s+)?'(?:[^']|'')*'", re.I)
+_JSONPATH_RE = re.compile(r"\['((?:[^'\\]|\\.)*)'\]|\[(\d+)\]|\.(\w+)")
+
+
+class CopyOptions(object):
+    """
+    The options of a COPY or UNLOAD statement, as far as they're emulated.
+
+    >>> options = CopyOptions("CREDENTIALS 'x' MANIFEST GZIP "
+    ...                       "NULL AS '\\\\N' FORMAT AS CSV")
+    >>> options.manifest, options.gzip, options.format, options.null
+    (True, True, 'csv', '\\\\N')
+    >>> print(CopyOptions("JSON 's3://b/paths'").jsonpaths)
+    s3://b/paths
+    """
+
+    def __init__(self, text):
+        text = _CREDENTIALS_RE.sub('', text)
+        self.text = text
+        self.manifest = self._flag('MANIFEST')
+        self.verbose = self._flag('VERBOSE')
+        self.gzip = self._flag('GZIP')
+        self.allow_overwrite = self._flag('ALLOWOVERWRITE')
+        self.clean_path = self._flag('CLEANPATH')
+        self.header = self._flag('HEADER')
+        self.add_quotes = self._flag('ADDQUOTES')
+        self.escape = self._flag('ESCAPE')
+        self.parallel = not re.search(r'\bPARALLEL\s+(?:OFF|FALSE)\b',
+                                      text, re.I)
+        for unsupported in ['PARQUET', 'PARTITION', 'BZIP2', 'ZSTD', 'LZOP',
+                            'ORC', 'AVRO', 'FIXEDWIDTH']:
+            if self._flag(unsupported):
+                raise NotImplementedError(
+                    "%s isn't emulated locally" % unsupported)
+        self.delimiter = self._quoted('DELIMITER')
+        self.null = self._quoted('NULL')
+        match = re.search(r"\bJSON(?:\s+(?:AS\s+)?'((?:[^']|'')*)')?",
+                          text, re.I)
+        self.jsonpaths = None
+        if match:
+            self.format = 'json'
+            if match.group(1) and match.group(1).lower() != 'auto':
+                self.jsonpaths = match.group(1)
+        elif self._flag('CSV'):
+            self.format = 'csv'
+        else:
+            self.format = 'text'
+        match = re.search(r'\bIGNOREHEADER\s+(?:AS\s+)?(\d+)', text, re.I)
+        self.ignore_header = int(match.group(1)) if match else 0
+        match = re.search(r'\bMAXFILESIZE\s+(?:AS\s+)?([\d.]+)\s*(MB|GB)?',
+                          text, re.I)
+        self.max_file_size = None
+        if match:
+            unit = 1024 ** (3 if (match.group(2) or '').upper() == 'GB'
+                            else 2)
+            self.max_file_size = int(float(match.group(1)) * unit)
+
+    def _flag(self, word):
+        return bool(re.search(r'\b%s\b' % word, self.text, re.I))
+
+    def _quoted(self, word):
+        match = re.search(r"\b%s\s+(?:AS\s+)?'((?:[^']|'')*)'" % word,
+                          self.text, re.I)
+        return match.group(1).replace("''", "'") if match else None
+
+
+def jsonpath_value(document, path):
+    """
+    Return the value at a jsonpaths expression in *document*,
+    or None if there's nothing there.
+
+    >>> doc = {'a': {'b': [1, 2]}, 'c': 3}
+    >>> jsonpath_value(doc, "$['a']['b'][1]"), jsonpath_value(doc, '$.c')
+    (2, 3)
+    >>> print(jsonpath_value(doc, "$['missing']"))
+    None
+    """
+    value = document
+    for name, index, attribute in _JSONPATH_RE.findall(path):
+        try:
+            value = value[int(index)] if index else value[name or attribute]
+        except (KeyError, IndexError, TypeError):
+            return None
+    return value
+
+
+def text_value(value):
+    """Return *value* as Redshift writes it in unloaded text."""
+    if value is True:
+        return 't'
+    if value is False:
+        return 'f'
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    return '%s' % value
+
+
+def csv_value(value, null='\\N'):
+    """
+    Return *value* as a CSV field, with None as *null*.
+
+    >>> print(csv_value('a "b", c'))
+    "a ""b"", c"
+    >>> print(csv_value(None))
+    \\N
+    """
+    if value is None:
+        return null
+    text = text_value(value)
+    if text == null or re.search(r'[,"\r\n]', text):
+        return '"%s"' % text.replace('"', '""')
+    return text
+
+
+class _PartWriter(object):
+    """Writes unloaded lines round-robin to one file per slice,
+    starting a new file per slice once *max_size* bytes are written."""
+
+    def __init__(self, bucket, prefix, slices, compress, max_size, header):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.slices = slices
+        self.compress = compress
+        self.max_size = max_size
+        self.header = header
+        self.open = {}
+        self.written = []
+        self.count = 0
+
+    def _name(self, slice_, part):
+        if self.slices == 1:
+            name = '%03d' % part
+        else:
+            name = '%04d_part_%02d' % (slice_, part)
+        return self.prefix + name + ('.gz' if self.compress else '')
+
+    def _file(self, slice_):
+        entry = self.open.get(slice_)
+        if entry is not None and self.max_size and \
+                entry['size'] >= self.max_size:
+            self._finish(slice_)
+            entry = None
+        if entry is None:
+            part = len([1 for s, _, _ in self.written if s == slice_])
+            raw = tempfile.TemporaryFile()
+            out = gzip.GzipFile(fileobj=raw, mode='wb') \
+                if self.compress else raw
+            entry = self.open[slice_] = {
+                'name': self._name(slice_, part), 'raw': raw, 'out': out,
+                'size': 0, 'rows': 0}
+            if self.header:
+                self._write(entry, self.header)
+        return entry
+
+    def _write(self, entry, line):
+        data = line.encode('utf-8')
+        entry['out'].write(data)
+        entry['size'] += len(data)
+
+    def write(self, line):
+        entry = self._file(self.count % self.slices)
+        self._write(entry, line)
+        entry['rows'] += 1
+        self.count += 1
+
+    def _finish(self, slice_):
+        entry = self.open.pop(slice_)
+        if self.compress:
+            entry['out'].close()
+        entry['raw'].seek(0)
+        key = self.bucket.new_key(entry['name'])
+        key.set_contents_from_file(entry['raw'])
+        entry['raw'].close()
+        self.written.append((slice_, key, entry['rows']))
+
+    def close(self):
+        """Finish every file, returning a list of (key, rows)."""
+        for slice_ in sorted(self.open):
+            self._finish(slice_)
+        return [(key, rows) for _, key, rows in sorted(
+            self.written, key=lambda item: item[1].name)]
+
+
+class Emulator(object):
+    """
+    Runs COPY from S3 and UNLOAD statements against a Postgres cursor,
+    with a `FilesystemS3Connection` standing in for S3.
+
+    Parameters
+    ----------
+    s3_connection : `FilesystemS3Connection`
+    slices : int
+        Number of files each UNLOAD writes, like a cluster's slices
+    batch_size : int
+        Rows to fetch at a time while unloading
+    """
+
+    def __init__(self, s3_connection, slices=2, batch_size=10000):
+        self.s3_connection = s3_connection
+        self.slices = slices
+        self.batch_size = batch_size
+
+    def execute(self, cursor, statement):
+        """Execute *statement*, emulating it if it's a COPY from S3
+        or an UNLOAD."""
+        match = COPY_RE.match(statement)
+        if match:
+            return self.copy(cursor, match)
+        match = UNLOAD_RE.match(statement)
+        if match:
+            return self.unload(cursor, match)
+        return cursor.execute(statement)
+
+    def _files(self, bucket, key, options):
+        if options.manifest:
+            manifest = bucket.get_key(key).get_contents_as_string()
+            return [(self.s3_connection.get_bucket(name), part)
+                    for name, part in manifest_urls(manifest)]
+        return [(bucket, k.name) for k in bucket.list(prefix=key)]
+
+    @staticmethod
+    def _read(key):
+        try:
+            while True:
+                chunk = key.read(1024 * 1024)
+                if not chunk:
+                    return
+                yield chunk
+        finally:
+            key.close()
+
+    def _chunks(self, bucket, name, options):
+        key = bucket.get_key(name)
+        if key is None:
+            raise psycopg2.InternalError(
+                "The specified S3 key does not exist: s3://%s/%s"
+                % (bucket.name, name))
+        chunks = self._read(key)
+        return gunzip_chunks(chunks) if options.gzip else chunks
+
+    @staticmethod
+    def _columns(cursor, table, columns):
+        if columns:
+            return [c.strip().strip('"') for c in columns.split(',')]
+        schema, _, name = table.replace('"', '').rpartition('.')
+        cursor.execute(
+            "SELECT column_name FROM information_schema.columns "
+            "WHERE table_schema = %s AND table_name = %s "
+            "ORDER BY ordinal_position", (schema or 'public', name))
+        return [row[0] for row in cursor.fetchall()]
+
+    def copy(self, cursor, match):
+        """Emulate ``COPY ... FROM 's3://...'``."""
+        options = CopyOptions(match.group('options'))
+        bucket = self.s3_connection.get_bucket(match.group('bucket'))
+        table = match.group('table')
+        columns = self._columns(cursor, table, match.group('columns'))
+        column_list = ', '.join('"%s"' % c for c in columns)
+        if options.format == 'json':
+            paths = None
+            if options.jsonpaths:
+                name, key = options.jsonpaths[len('s3://'):].split('/', 1)
+                paths = json.loads(self.s3_connection.get_bucket(name)
+                                   .get_key(key).get_contents_as_string()
+                                   .decode('utf-8'))['jsonpaths']
+            statement = ("COPY %s (%s) FROM STDIN WITH (FORMAT csv, "
+                         "NULL '\\N')" % (table, column_list))
+        else:
+            settings = ['FORMAT %s' % options.format]
+            delimiter = options.delimiter or \
+                (',' if options.format == 'csv' else '|')
+            settings.append("DELIMITER '%s'" % delimiter.replace("'", "''"))
+            if options.null is not None:
+                settings.append("NULL '%s'" % options.null.replace("'", "''"))
+            statement = "COPY %s (%s) FROM STDIN WITH (%s)" % (
+                table, column_list, ', '.join(settings))
+
+        for file_bucket, key in self._files(bucket, match.group('key'),
+                                            options):
+            lines = iter_lines(self._chunks(file_bucket, key, options))
+            for _ in range(options.ignore_header):
+                next(lines, None)
+            if options.format == 'json':
+                lines = self._json_to_csv(lines, columns, paths)
+            data = (line.encode('utf-8') for line in lines)
+            cursor.copy_expert(statement, ChunkReader(data))
+
+    @staticmethod
+    def _json_to_csv(lines, columns, paths):
+        for line in lines:
+            if not line.strip():
+                continue
+            document = json.loads(line)
+            if paths is None:
+                lowered = dict((k.lower(), v) for k, v in document.items())
+                values = [lowered.get(c.lower()) for c in columns]
+            else:
+                values = [jsonpath_value(document, p) for p in paths]
+            yield ','.join(csv_value(v) for v in values) + '\n'
+
+    def unload(self, cursor, match):
+        """Emulate ``UNLOAD (...) TO 's3://...'``."""
+        options = CopyOptions(match.group('options'))
+        select = match.group('dollar')
+        if select is None:
+            select = match.group('quoted').replace("''", "'")
+        bucket = self.s3_connection.get_bucket(match.group('bucket'))
+        prefix = match.group('key')
+        if options.clean_path:
+            bucket.delete_keys(list(bucket.list(prefix=prefix)))
+        elif not options.allow_overwrite and \
+                next(iter(bucket.list(prefix=prefix)), None) is not None:
+            raise psycopg2.InternalError(
+                "Specified unload destination on S3 is not empty: s3://%s/%s"
+                % (bucket.name, prefix))
+
+        cursor.execute(select)
+        names = [column[0] for column in cursor.description or ()]
+        null = options.null if options.null is not None else ''
+        if options.format == 'json':
+            def line(row):
+                return json.dumps(dict(zip(names, row)), default=text_value)
+        elif options.format == 'csv':
+            delimiter = options.delimiter or ','
+
+            def line(row):
+                return delimiter.join(csv_value(v, null) for v in row)
+        else:
+            delimiter = options.delimiter or '|'
+            escaped = ['\\', delimiter, '\n', '\r', '"', "'"]
+
+            def field(value):
+                if value is None:
+                    return null
+                text = text_value(value)
+                if options.escape:
+                    for char in escaped:
+                        text = text.replace(char, '\\' + char)
+                if options.add_quotes:
+                    text = '"%s"' % text
+                return text
+
+            def line(row):
+                return delimiter.join(field(v) for v in row)
+
+        header = None
+        if options.header and options.format != 'json':
+            header = (options.delimiter or
+                      (',' if options.format == 'csv' else '|')
+                      ).join(names) + '\n'
+        writer = _PartWriter(bucket, prefix,
+                             self.slices if options.parallel else 1,
+                             options.gzip, options.max_file_size, header)
+        while True:
+            rows = cursor.fetchmany(self.batch_size)
+            if not rows:
+                break
+            for row in rows:
+                writer.write(line(row) + '\n')
+        parts = writer.close()
+
+        if options.manifest:
+            entries = []
+            for key, rows in parts:
+                entry = {'url': 's3://%s/%s' % (bucket.name, key.name)}
+                if options.verbose:
+                    entry['meta'] = {'content_length': key.size,
+                                     'record_count': rows}
+                entries.append(entry)
+            bucket.new_key(prefix + 'manifest').set_contents_from_string(
+                json.dumps({'entries': entries}))
+
+
+class EmulatedCursor(object):
+    """A psycopg2 cursor that hands COPY from S3 and UNLOAD statements
+    to an `Emulator` and everything else to Postgres."""
+
+    def __init__(self, cursor, emulator):
+        self._cursor = cursor
+        self._emulator = emulator
+
+    def execute(self, batch, parameters=None):
+        if not EMULATED_RE.search(batch):
+            return self._cursor.execute(batch, parameters)
+        if parameters is not None:
+            batch = self._cursor.mogrify(batch, parameters)
+            if isinstance(batch, bytes):
+                batch = batch.decode('utf-8')
+        for statement in split_statements(batch):
+            self._emulator.execute(self._cursor, statement)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        self._cursor.__enter__()
+        return self
+
+    def __exit__(self, *args):
+        return self._cursor.__exit__(*args)
+
+
+class EmulatedConnection(object):
+    """Wraps a psycopg2 connection so its cursors are `EmulatedCursor`."""
+
+    def __init__(self, connection, emulator):
+        self._connection = connection
+        self._emulator = emulator
+
+    @property
+    def autocommit(self):
+        return self._connection.autocommit
+
+    @autocommit.setter
+    def autocommit(self, value):
+        self._connection.autocommit = value
+
+    def cursor(self, *args, **kwargs):
+        return EmulatedCursor(self._connection.cursor(*args, **kwargs),
+                              self._emulator)
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def __enter__(self):
+        self._connection.__enter__()
+        return self
+
+    def __exit__(self, *args):
+        return self._connection.__exit__(*args)
+
+
+# Postgres equivalents of the Redshift catalog queries the pipelines use
+_CATALOG_STAND_INS = {
+    queries.catalog_relations: queries.catalog_relations.replace(
+        'c.reldiststyle', '0 AS "reldiststyle"'),
+    queries.catalog_table_info: """\
+SELECT n.nspname, c.relname, 'EVEN', NULL, c.reltuples::bigint
+FROM pg_catalog.pg_class c
+     JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+WHERE c.relkind = 'r'
+  AND n.nspname IN %(schemas)s;
+""",
+    queries.catalog_columns: queries.catalog_columns.replace(
+        'd.adsrc', 'pg_catalog.pg_get_expr(d.adbin, d.adrelid)'),
+    queries.table_stats: """\
+SELECT pg_catalog.pg_total_relation_size(c.oid) / 1048576,
+       c.reltuples::bigint, NULL
+FROM pg_catalog.pg_class c
+     JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+WHERE n.nspname = %(schema)s AND c.relname = %(table)s
+  AND c.relkind = 'r';
+""",
+}
+
+
+class LocalRedshift(Redshift):
+    """
+    A `Redshift` that runs against a local Postgres, keeping S3 in a
+    directory and emulating COPY from S3 and UNLOAD.
+
+    Parameters
+    ----------
+    s3_root : str
+        Directory holding a subdirectory per bucket; defaults to
+        $SHIFTMANAGER_LOCAL_S3 or $HOME/.shiftmanager/local_s3/
+    slices : int
+        Number of files each UNLOAD writes
+    port : int
+        Defaults to Postgres's 5432
+    kwargs :
+        As for `Redshift`; AWS credentials default to placeholders
+    """
+
+    def __init__(self, s3_root=None, slices=2, port=5432, **kwargs):
+        kwargs.setdefault('aws_access_key_id', 'local')
+        kwargs.setdefault('aws_secret_access_key', 'local')
+        Redshift.__init__(self, port=port, **kwargs)
+        self.s3_root = s3_root or os.environ.get('SHIFTMANAGER_LOCAL_S3') or \
+            os.path.join(os.path.expanduser("~"), ".shiftmanager", "local_s3")
+        self.slices = slices
+        self.s3_conn = self.get_s3_connection()
+
+    @memoized_property
+    def connection(self):
+        """A psycopg2 connection to the local Postgres, emulating COPY
+        from S3 and UNLOAD."""
+        print("Connecting to local Postgres at %s..." % self.host)
+        conn = psycopg2.connect(user=self.user,
+                                host=self.host,
+                                port=self.port,
+                                database=self.database,
+                                password=self.password,
+                                **self.pgkwargs)
+        return EmulatedConnection(conn, Emulator(self.s3_conn, self.slices))
+
+    def get_s3_connection(self, ordinary_calling_fmt=False):
+        return FilesystemS3Connection(self.s3_root)
+
+    def clone(self):
+        other = Redshift.clone(self)
+        other.s3_root = self.s3_root
+        other.slices = self.slices
+        other.s3_conn = other.get_s3_connection()
+        return other
+
+    def _fetchall(self, query, parameters=None):
+        return Redshift._fetchall(self, _CATALOG_STAND_INS.get(query, query),
+                                  parameters)
@@ -0,0 +1,272 @@
+"""
+Planning and running table maintenance across a schema.
+
+Tables whose rows are largely unsorted are cheaper to rebuild with a
+deep copy than to vacuum, tables with a small unsorted region are best
+vacuumed, and tables whose statistics are merely stale only need an
+ANALYZE. `plan_maintenance` makes that decision for every table
+reported by svv_table_info and ranks the results by how much each table
+stands to gain. `run_within_budget` then works through the plan with a
+bounded number of threads, never starting a rebuild that could push the
+total temporary disk usage over a budget.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+from collections import namedtuple
+import threading
+import time
+
+DEEP_COPY = 'deep_copy'
+VACUUM = 'vacuum'
+ANALYZE = 'analyze'
+
+#: A maintenance action for one table.
+#: *size* is in 1 MB blocks, *unsorted* and *stats_off* are percentages,
+#: and *required_space* is the disk space (in 1 MB blocks) the action
+#: may temporarily consume.
+MaintenanceTask = namedtuple('MaintenanceTask', [
+    'schema', 'table', 'action', 'size', 'unsorted', 'stats_off',
+    'required_space'])
+
+#: The outcome of running a `MaintenanceTask`; *size_after* and
+#: *reclaimed* are None and *error* is set if the action failed.
+MaintenanceResult = namedtuple('MaintenanceResult', [
+    'task', 'seconds', 'size_after', 'reclaimed', 'error'])
+
+
+def choose_action(unsorted, stats_off, has_sortkey=True,
+                  deep_copy_unsorted=20.0, vacuum_unsorted=5.0,
+                  analyze_stats_off=10.0):
+    """
+    Return the maintenance action a table needs, or None.
+
+    >>> print(choose_action(unsorted=45.0, stats_off=0.0))
+    deep_copy
+    >>> print(choose_action(unsorted=8.0, stats_off=0.0))
+    vacuum
+    >>> print(choose_action(unsorted=None, stats_off=30.0,
+    ...                     has_sortkey=False))
+    analyze
+    >>> print(choose_action(unsorted=1.0, stats_off=2.0))
+    None
+    """
+    unsorted = unsorted or 0.0
+    stats_off = stats_off or 0.0
+    if has_sortkey and unsorted >= deep_copy_unsorted:
+        return DEEP_COPY
+    if has_sortkey and unsorted >= vacuum_unsorted:
+        return VACUUM
+    if stats_off >= analyze_stats_off:
+        return ANALYZE
+    return None
+
+
+def plan_maintenance(health_rows, deep_copy_unsorted=20.0,
+                     vacuum_unsorted=5.0, analyze_stats_off=10.0):
+    """
+    Return a list of `MaintenanceTask` for the tables that need one,
+    most beneficial first.
+
+    Tasks are ranked by the number of unsorted blocks they'd sort
+    (size times the unsorted fraction), then by how stale their
+    statistics are, then by size.
+
+    Parameters
+    ----------
+    health_rows : iterable
+        Rows of (schema, table, size, tbl_rows, unsorted, stats_off,
+        sortkey1) as returned by the ``table_health`` query
+    deep_copy_unsorted : float
+        Percentage of unsorted rows at or above which a table is rebuilt
+        with a deep copy rather than vacuumed
+    vacuum_unsorted : float
+        Percentage of unsorted rows at or above which a table is vacuumed
+    analyze_stats_off : float
+        Staleness of statistics at or above which a table is analyzed
+    """
+    tasks = []
+    for schema, table, size, _, unsorted, stats_off, sortkey1 in health_rows:
+        action = choose_action(unsorted, stats_off,
+                               has_sortkey=sortkey1 is not None,
+                               deep_copy_unsorted=deep_copy_unsorted,
+                               vacuum_unsorted=vacuum_unsorted,
+                               analyze_stats_off=analyze_stats_off)
+        if action is None:
+            continue
+        size = size or 0
+        if action == DEEP_COPY:
+            required_space = estimate_deep_copy(
+                schema, table, size, None, True, 0, 0).required_space
+        elif action == VACUUM:
+            # A vacuum may write a full sorted copy of the table
+            # before the old blocks are released
+            required_space = size
+        else:
+            required_space = 0
+        tasks.append(MaintenanceTask(
+            schema=schema, table=table, action=action, size=size,
+            unsorted=float(unsorted or 0), stats_off=float(stats_off or 0),
+            required_space=required_space))
+    tasks.sort(key=lambda t: (-t.size * t.unsorted, -t.stats_off, -t.size))
+    return tasks
+
+
+def disk_budget(capacity, used, reserve_fraction=0.2):
+    """
+    Return how many 1 MB blocks maintenance may temporarily consume
+    while leaving *reserve_fraction* of the cluster's capacity free.
+
+    >>> disk_budget(capacity=1000, used=500, reserve_fraction=0.2)
+    300
+    >>> disk_budget(capacity=1000, used=900)
+    0
+    """
+    return max(0, int(capacity - used - capacity * reserve_fraction))
+
+
+#: Estimated cost of deep copying a table. Sizes are in 1 MB blocks;
+#: *seconds* is None when there's no history to estimate from.
+DeepCopyEstimate = namedtuple('DeepCopyEstimate', [
+    'schema', 'table', 'size', 'rows', 'required_space', 'free_space',
+    'capacity', 'fits', 'seconds'])
+
+
+def estimate_deep_copy(schema, table, size, rows, has_sortkey, capacity,
+                       used, rows_per_second=None, reserve_fraction=0.1):
+    """
+    Return a `DeepCopyEstimate` for a table of *size* blocks and *rows*.
+
+    The new copy takes about as much space as the original, and
+    sorting it on the way in can spill about as much again to disk.
+    The copy *fits* if it leaves at least *reserve_fraction* of
+    *capacity* free.
+
+    >>> estimate = estimate_deep_copy('public', 'events', 100, 10000, True,
+    ...                               capacity=1000, used=600,
+    ...                               rows_per_second=500)
+    >>> estimate.required_space, estimate.fits, estimate.seconds
+    (200, True, 20.0)
+    >>> estimate_deep_copy('public', 'events', 350, 10000, False,
+    ...                    capacity=1000, used=600).fits
+    False
+    """
+    size = size or 0
+    rows = rows or 0
+    required_space = size * 2 if has_sortkey else size
+    free_space = capacity - used
+    fits = free_space - required_space >= capacity * reserve_fraction
+    seconds = None
+    if rows_per_second:
+        seconds = rows / float(rows_per_second)
+    return DeepCopyEstimate(schema=schema, table=table, size=size, rows=rows,
+                            required_space=required_space,
+                            free_space=free_space, capacity=capacity,
+                            fits=fits, seconds=seconds)
+
+
+def run_within_budget(tasks, func, max_workers=2, budget=None):
+    """
+    Call *func* on every task in *tasks*, in order of preference,
+    using up to *max_workers* threads at a time.
+
+    A task only starts once the *required_space* of every running task
+    plus its own fits within *budget*; a task that's next in line but
+    doesn't fit is passed over for a smaller one. Tasks that can never
+    fit are not run at all.
+
+    Parameters
+    ----------
+    tasks : list of `MaintenanceTask`
+    func : callable
+        Called with a task and returning its result; if it raises,
+        a failed `MaintenanceResult` carrying the exception is
+        recorded instead
+    max_workers : int
+        Maximum number of tasks to run at once
+    budget : int or None
+        Disk space in 1 MB blocks available to running tasks;
+        None is unlimited
+
+    Returns
+    -------
+    tuple of (results, skipped), where *results* lists the return values
+    of *func* in order of completion and *skipped* lists tasks that
+    exceeded the budget on their own
+    """
+    if budget is None:
+        runnable, skipped = list(tasks), []
+    else:
+        runnable = [t for t in tasks if t.required_space <= budget]
+        skipped = [t for t in tasks if t.required_space > budget]
+
+    condition = threading.Condition()
+    state = {'pending': runnable, 'in_use': 0}
+    results = []
+
+    def next_task():
+        # Called with the condition held; returns None when done
+        while state['pending']:
+            for i, task in enumerate(state['pending']):
+                if budget is None or \
+                        state['in_use'] + task.required_space <= budget:
+                    state['in_use'] += task.required_space
+                    return state['pending'].pop(i)
+            condition.wait()
+        return None
+
+    def worker():
+        while True:
+            with condition:
+                task = next_task()
+            if task is None:
+                return
+            start = time.time()
+            try:
+                result = func(task)
+            except Exception as e:
+                result = MaintenanceResult(task=task,
+                                           seconds=time.time() - start,
+                                           size_after=None, reclaimed=None,
+                                           error=e)
+            finally:
+                with condition:
+                    state['in_use'] -= task.required_space
+                    condition.notify_all()
+            with condition:
+                results.append(result)
+
+    threads = [threading.Thread(target=worker)
+               for _ in range(max(1, min(max_workers, len(runnable))))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, skipped
+
+
+def format_report(results, skipped=()):
+    """Return a plain-text table summarizing maintenance *results*."""
+    lines = ["%-40s %-10s %9s %10s %10s" %
+             ("table", "action", "seconds", "size (MB)", "reclaimed")]
+    total_seconds, total_reclaimed = 0.0, 0
+    for result in results:
+        task = result.task
+        name = '%s.%s' % (task.schema, task.table)
+        total_seconds += result.seconds
+        if result.error is not None:
+            lines.append("%-40s %-10s %9.1f  failed: %s" %
+                         (name, task.action, result.seconds, result.error))
+            continue
+        total_reclaimed += result.reclaimed or 0
+        lines.append("%-40s %-10s %9.1f %10d %10d" %
+                     (name, task.action, result.seconds, task.size,
+                      result.reclaimed or 0))
+    for task in skipped:
+        lines.append("%-40s %-10s  skipped: needs %d MB of disk" %
+                     ('%s.%s' % (task.schema, task.table), task.action,
+                      task.required_space))
+    lines.append("%-40s %-10s %9.1f %10s %10d" %
+                 ("total", "", total_seconds, "", total_reclaimed))
+    return '\n'.join(lines)
@@ -0,0 +1,186 @@
+"""
+Copying tables from one Redshift cluster to another.
+
+Each table is recreated on the target from the source's reflected
+definition, along with its owner and grants, then its rows are moved
+through S3: UNLOAD on the source writes Parquet files and a manifest,
+and COPY on the target loads them. Parquet keeps every value's type
+exactly, so nothing needs escaping or parsing on the way. Tables are
+migrated concurrently, each worker thread using its own connections to
+both clusters. Once each table is loaded, its row count on the target
+is compared with the number of rows the UNLOAD wrote, as recorded in its
+manifest, so rows written to the source in the meantime don't count.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+import os
+import threading
+import time
+
+from shiftmanager.rendering import quote_identifier
+from shiftmanager.unload import manifest_record_count
+
+#: The outcome of migrating one table. *source_rows* is the number of
+#: rows unloaded from the source. *target_rows* and *source_rows*
+#: are None and *error* is set if the migration failed.
+MigrationResult = namedtuple('MigrationResult', [
+    'schema', 'table', 'source_rows', 'target_rows', 'seconds', 'error'])
+
+
+def verified(result):
+    """Return whether *result* migrated every row of its table."""
+    return result.error is None and result.source_rows == result.target_rows
+
+
+def parse_tables(tables):
+    """
+    Return (schema, table) pairs for tables given as names,
+    'schema.table' strings or pairs.
+
+    >>> parse_tables(['events', 'sales.orders', ('sales', 'returns')])
+    [('public', 'events'), ('sales', 'orders'), ('sales', 'returns')]
+    """
+    pairs = []
+    for table in tables:
+        if isinstance(table, (list, tuple)):
+            pairs.append(tuple(table))
+        elif '.' in table:
+            pairs.append(tuple(table.split('.', 1)))
+        else:
+            pairs.append(('public', table))
+    return pairs
+
+
+def copy_statement(table, manifest_url, credentials, explicit_ids=False):
+    """
+    Return a COPY statement loading the Parquet files listed in the
+    manifest at *manifest_url* into *table*.
+
+    >>> print(copy_statement('sales.orders', 's3://b/sales/orders/manifest',
+    ...                      'aws_iam_role=arn:aws:iam::1:role/r'))
+    COPY sales.orders
+    FROM 's3://b/sales/orders/manifest'
+    CREDENTIALS 'aws_iam_role=arn:aws:iam::1:role/r'
+    FORMAT AS PARQUET
+    MANIFEST;
+    """
+    statement = ("COPY {table}\nFROM '{manifest_url}'\n"
+                 "CREDENTIALS '{credentials}'\nFORMAT AS PARQUET\nMANIFEST"
+                 .format(table=table, manifest_url=manifest_url,
+                         credentials=credentials))
+    if explicit_ids:
+        statement += "\nEXPLICIT_IDS"
+    return statement + ';'
+
+
+def migrate_tables(source, target, tables, bucket, keypath, max_workers=4,
+                   copy_privileges=True, replace=False, cleanup_s3=True):
+    """
+    Copy *tables*, with their definitions and rows, from the *source*
+    cluster to the *target* cluster.
+
+    Parameters
+    ----------
+    source, target : `~shiftmanager.redshift.Redshift`
+        Each worker thread uses clones of them
+    tables : list
+        Table names, 'schema.table' strings or (schema, table) pairs
+    bucket : str
+        S3 bucket to stage the data in, readable by both clusters
+    keypath : str
+        S3 key path to stage the data under
+    max_workers : int
+        Number of tables to migrate concurrently
+    copy_privileges : bool
+        Carry owners and grants over; they must already exist on *target*
+    replace : bool
+        Drop tables that already exist on *target*; otherwise their
+        migration fails
+    cleanup_s3 : bool
+        Delete each table's staged files once it's loaded
+
+    Returns
+    -------
+    list of `MigrationResult`, in the order of *tables*
+    """
+    pairs = parse_tables(tables)
+    for schema in sorted(set(schema for schema, _ in pairs)):
+        if schema != 'public':
+            target.execute("CREATE SCHEMA IF NOT EXISTS %s" %
+                           quote_identifier(schema))
+
+    local = threading.local()
+    workers = []
+    lock = threading.Lock()
+
+    def connections():
+        if not hasattr(local, 'source'):
+            local.source = source.clone()
+            local.target = target.clone()
+            with lock:
+                workers.extend([local.source, local.target])
+        return local.source, local.target
+
+    def migrate(pair):
+        schema, table = pair
+        name = '%s.%s' % (schema, table)
+        quoted = '%s.%s' % (quote_identifier(schema), quote_identifier(table))
+        start = time.time()
+        try:
+            src, dst = connections()
+            exists = dst.table_exists(table, schema)
+            if exists and not replace:
+                raise ValueError("%s already exists on the target" % name)
+            definition = src.table_definition(
+                table, schema, copy_privileges=copy_privileges)
+            table_keypath = os.path.join(keypath, schema)
+            print("Unloading %s from the source..." % name)
+            src.unload_table_to_s3(
+                bucket, table_keypath, table, schema=schema,
+                options='MANIFEST VERBOSE ALLOWOVERWRITE',
+                file_format='parquet')
+            table_prefix = os.path.join(table_keypath, table, '')
+            manifest_url = 's3://%s/%smanifest' % (bucket, table_prefix)
+            bukkit = src.get_bucket(bucket)
+            # The rows in this UNLOAD's snapshot of the table
+            source_rows = manifest_record_count(bukkit.get_key(
+                table_prefix + 'manifest').get_contents_as_string())
+            explicit_ids = bool(src._get_identity_columns(table, schema))
+            print("Loading %s into the target..." % name)
+            with dst.transaction():
+                if exists:
+                    dst.execute("DROP TABLE %s" % quoted)
+                dst.execute(definition)
+                dst.execute(copy_statement(quoted, manifest_url,
+                                           dst.aws_credentials,
+                                           explicit_ids))
+            target_rows = dst._fetchall(
+                "SELECT COUNT(*) FROM %s" % quoted)[0][0]
+            if source_rows != target_rows:
+                print("%s unloaded %s rows from the source but has %d on "
+                      "the target" % (name, source_rows, target_rows))
+            if cleanup_s3:
+                bukkit.delete_keys([key.name for key in
+                                    bukkit.list(prefix=table_prefix)])
+            return MigrationResult(schema, table, source_rows, target_rows,
+                                   time.time() - start, None)
+        except Exception as e:
+            print("Migrating %s failed: %s" % (name, e))
+            return MigrationResult(schema, table, None, None,
+                                   time.time() - start, e)
+
+    pool = ThreadPool(max(1, min(max_workers, len(pairs))))
+    try:
+        return pool.map(migrate, pairs)
+    finally:
+        pool.close()
+        pool.join()
+        for worker in workers:
+            worker._discard_connection()
+        # The workers' clones each had their own catalog
+        for schema in set(schema for schema, _ in pairs):
+            target.catalog.invalidate(schema)
@@ -2,6 +2,9 @@ import functools
 import random
 import string
 
+from shiftmanager import queries
+from shiftmanager.users import current_state, reconcile
+
 
 def random_password(length=64):
     """Return a strong password valid for Redshift.
@@ -147,3 +150,47 @@ class AdminMixin(object):
                 options.append("SET %s = %s" % (param, value))
         statement += ' '.join(options)
         return self.mogrify(statement, data, execute)
+
+    def reconcile_users(self,
+                        desired,
+                        groups=(),
+                        drop_users=False,
+                        drop_groups=False,
+                        ignore=('rdsdb',),
+                        execute=False):
+        """Return a SQL str bringing users and groups in line with a spec.
+
+        The current users, settings and group memberships are read in two
+        queries, and only the differences are emitted, so syncing
+        thousands of accounts takes one batch rather than a round trip
+        and commit per user. Executing the batch runs it as a single
+        transaction.
+
+        Parameters
+        ----------
+        desired : dict
+            Maps user names to dicts of any of 'createdb', 'createuser',
+            'valid_until', 'groups', 'config' and 'password'; only the
+            keys given are reconciled. User and group names are
+            lower-cased, as Redshift stores them. See `shiftmanager.users`.
+        groups : list of str
+            Groups that must exist even if no user belongs to them.
+        drop_users : boolean
+            Drop users missing from *desired*; superusers are kept.
+        drop_groups : boolean
+            Drop groups not mentioned in *desired* or *groups*.
+        ignore : list of str
+            Users never to alter or drop.
+        execute : boolean
+            Execute the batch in addition to returning it.
+        """
+        users, current_groups = current_state(
+            self._fetchall(queries.users), self._fetchall(queries.groups))
+        statements = reconcile(desired, users, current_groups,
+                               extra_groups=groups, drop_users=drop_users,
+                               drop_groups=drop_groups, ignore=ignore)
+        batch = ';\n'.join(statements)
+        if execute and batch:
+            with self.transaction():
+                self.execute(batch)
+        return batch
@@ -18,7 +18,6 @@ from threading import Thread
 import time
 
 import psycopg2
-import psycopg2.extras
 
 from shiftmanager.memoized_property import memoized_property
 from shiftmanager.mixins.s3 import S3Mixin
@@ -226,7 +225,8 @@ libpq-connect.html#LIBPQ-PARAMKEYWORDS
                                delete_statement=None,
                                manifest_max_keys=None,
                                line_bytes=104857600,
-                               canned_acl=None):
+                               canned_acl=None,
+                               retry_policy=None):
         """
         Writes the contents of a Postgres table to Redshift.
 
@@ -275,6 +275,9 @@ libpq-connect.html#LIBPQ-PARAMKEYWORDS
             (before compression); defaults to 100 MB
         canned_acl: str
             A canned ACL to apply to objects uploaded to S3
+        retry_policy: `~shiftmanager.retry.RetryPolicy` or None
+            Policy for retrying each COPY transaction on transient errors;
+            defaults to the instance's *retry_policy*
         """
         backfill_timestamp = datetime.datetime.utcnow().strftime(
             "%Y-%m-%d_%H%M%S")
@@ -321,7 +324,7 @@ libpq-connect.html#LIBPQ-PARAMKEYWORDS
 
             print('Copying from S3 to Redshift...')
             try:
-                self.execute(statements)
+                self.execute(statements, retry_policy=retry_policy)
                 start_idx = end_idx
             except:
                 # Clean up S3 bucket in the event of any exception
@@ -331,6 +334,149 @@ libpq-connect.html#LIBPQ-PARAMKEYWORDS
                         bucket.delete_key(key)
                 raise
 
+    def copy_table_to_postgres(self,
+                               table,
+                               pg_table_name,
+                               bucket_name,
+                               key_prefix,
+                               schema='public',
+                               col_str='*',
+                               where=None,
+                               max_workers=4,
+                               copy_privileges=True,
+                               cascade=False,
+                               analyze=True,
+                               cleanup_s3=True,
+                               retry_policy=None):
+        """
+        Replaces the contents of a Postgres table with a Redshift table.
+
+        The Redshift table is unloaded to S3 as gzipped CSV. Each part is
+        then streamed from S3, decompressed and fed to
+        ``COPY ... FROM STDIN``, with up to *max_workers* parts loading at
+        once over separate Postgres connections, so nothing is written to
+        local disk. Rows are loaded into a new ``<pg_table_name>$incoming``
+        table created ``LIKE`` the existing one, which replaces it in a
+        single transaction once every part has loaded; readers see either
+        the old contents or the new.
+
+        Postgres connection parameters are taken from
+        `create_pg_connection`. The existing table mustn't own sequences,
+        since they'd be dropped along with it.
+
+        Parameters
+        ----------
+        table: str
+            Redshift table to read from
+        pg_table_name: str
+            Existing Postgres table to replace, optionally as 'schema.table'
+        bucket_name: str
+            The name of the S3 bucket to unload to
+        key_prefix: str
+            The key path within the bucket to unload to
+        schema: str
+            Redshift schema that *table* resides in
+        col_str: str
+            Comma separated string of columns to copy, which must exist
+            in both tables; defaults to '*', in which case the tables'
+            columns must be in the same order
+        where: str
+            SQL where clause string to filter the rows copied
+        max_workers: int
+            Number of parts to load at once
+        copy_privileges: bool
+            Carry the existing table's owner and grants over
+        cascade: bool
+            Drop any dependent views when dropping the existing table
+        analyze: bool
+            ANALYZE the new table once it's swapped in
+        cleanup_s3: bool
+            Delete the unloaded files once they're loaded or on failure
+        retry_policy: `~shiftmanager.retry.RetryPolicy` or None
+            Policy for retrying the UNLOAD on transient errors;
+            defaults to the instance's *retry_policy*
+        """
+        from multiprocessing.pool import ThreadPool
+        from shiftmanager import queries
+        from shiftmanager.privileges import grants_from_privileges
+        from shiftmanager.unload import ChunkReader, NULL_MARKER, \
+            gunzip_chunks
+
+        pg_simple_name = pg_table_name.split('.')[-1]
+        incoming_name = pg_table_name + '$incoming'
+        outgoing_name = pg_table_name + '$outgoing'
+        columns = '' if col_str == '*' else ' (%s)' % col_str
+        copy_statement = ("COPY %s%s FROM STDIN WITH (FORMAT csv, NULL '%s')"
+                          % (incoming_name, columns, NULL_MARKER))
+
+        bukkit, keys, parts = self._unload_csv(
+            table, bucket_name, key_prefix, schema, col_str, where,
+            retry_policy)
+        local = threading.local()
+        connections = []
+        lock = threading.Lock()
+
+        def load(part):
+            if not hasattr(local, 'connection'):
+                local.connection = psycopg2.connect(**self.pg_args)
+                with lock:
+                    connections.append(local.connection)
+            print("Loading %s into Postgres..." % part[1])
+            chunks = gunzip_chunks(self._s3_chunks(bukkit, part[1]))
+            with local.connection as conn:
+                with conn.cursor() as cur:
+                    cur.copy_expert(copy_statement, ChunkReader(chunks))
+
+        try:
+            self.pg_execute_and_commit_single_statement(
+                "CREATE TABLE %s (LIKE %s INCLUDING ALL)" %
+                (incoming_name, pg_table_name))
+            try:
+                pool = ThreadPool(max(1, min(max_workers, len(parts))))
+                try:
+                    pool.map(load, parts)
+                finally:
+                    pool.close()
+                    pool.join()
+                    for connection in connections:
+                        connection.close()
+
+                statements = [
+                    "ALTER TABLE %s RENAME TO %s" %
+                    (pg_table_name, pg_simple_name + '$outgoing'),
+                    "ALTER TABLE %s RENAME TO %s" %
+                    (incoming_name, pg_simple_name),
+                ]
+                if copy_privileges:
+                    with self.pg_connection as conn:
+                        with conn.cursor() as cur:
+                            cur.execute(queries.pg_table_privileges,
+                                        {'table': pg_table_name})
+                            owner, privileges = cur.fetchone()
+                    statements.append("ALTER TABLE %s OWNER TO %s" %
+                                      (pg_table_name, owner))
+                    statements += grants_from_privileges(privileges,
+                                                         pg_table_name)
+                drop_statement = "DROP TABLE %s" % outgoing_name
+                if cascade:
+                    drop_statement += " CASCADE"
+                statements.append(drop_statement)
+                if analyze:
+                    statements.append("ANALYZE %s" % pg_table_name)
+                print("Swapping %s into place..." % incoming_name)
+                self.pg_execute_and_commit_single_statement(
+                    ';\n'.join(statements) + ';')
+            except Exception:
+                print("Error loading into Postgres; dropping " +
+                      incoming_name)
+                self.pg_execute_and_commit_single_statement(
+                    "DROP TABLE IF EXISTS %s" % incoming_name)
+                raise
+        finally:
+            if cleanup_s3:
+                print("Cleaning up S3...")
+                bukkit.delete_keys(keys)
+
 
 class S3UploaderThread(Thread):
     """
@@ -1,20 +1,11 @@
+import os
 import re
-
-import sqlalchemy
-from sqlalchemy.schema import CreateTable
-from sqlalchemy_views import CreateView
+import time
 
 from shiftmanager import queries
+from shiftmanager.catalog import DISTSTYLES_BY_INDEX  # noqa: F401
 from shiftmanager.memoized_property import memoized_property
-from shiftmanager.privileges import grants_from_privileges
-
-# Redshift distribution styles
-DISTSTYLES_BY_INDEX = {
-    0: 'EVEN',
-    1: 'KEY',
-    8: 'ALL',
-}
-
+from shiftmanager.privileges import grants_from_privileges, privilege_changes
 
 # Regex for SQL identifiers (valid table and column names)
 SQL_IDENTIFIER_RE = re.compile(r"""
@@ -24,13 +15,6 @@ SQL_IDENTIFIER_RE = re.compile(r"""
 """, re.VERBOSE)
 
 
-def _get_relation_key(name, schema):
-    if schema is None:
-        return name
-    else:
-        return schema + "." + name
-
-
 def _get_schema_and_relation(key):
     if '.' not in key:
         return (None, key)
@@ -43,12 +27,17 @@ def _get_schema_and_relation(key):
 
 
 class ReflectionMixin(object):
-    """The database reflection base class for `Redshift`."""
+    """The database reflection base class for `Redshift`.
+
+    SQLAlchemy and its extensions are imported when first needed
+    rather than at module level, keeping ``import shiftmanager`` fast.
+    """
 
     @memoized_property
     def engine(self):
         """A sqlalchemy.engine which wraps `connection`.
         """
+        import sqlalchemy
         return sqlalchemy.create_engine("redshift+psycopg2://",
                                         poolclass=sqlalchemy.pool.StaticPool,
                                         creator=lambda: self.connection)
@@ -58,6 +47,7 @@ class ReflectionMixin(object):
         """A :class:`~sqlalchemy.schema.MetaData` instance used for
         reflection calls.
         """
+        import sqlalchemy
         meta = sqlalchemy.MetaData()
         meta.bind = self.engine
         return meta
@@ -98,14 +88,16 @@ class ReflectionMixin(object):
         and ``sqlalchemy-redshift``'s `DDLCompiler docs
         <http://redshift-sqlalchemy.readthedocs.org/en/latest/ddl-compiler.html>`_
         """
+        import sqlalchemy
         kw = kwargs.copy()
         kw['schema'] = kw.get('schema', 'public')
         analyze_compression = kwargs.pop('analyze_compression', None)
         kw['autoload'] = True
         kw['extend_existing'] = kw.get('extend_existing', True)
         # Run once with autoload enabled to reflect existing structure
-        # into self.meta
-        sqlalchemy.Table(name, self.meta, *args, **kw)
+        # into self.meta, unless reflect_schema already put it there
+        if (kw['schema'], name) not in self._bulk_reflected:
+            sqlalchemy.Table(name, self.meta, *args, **kw)
         kw['autoload'] = False
         # And run again without autoload to make sure overrides (like distkey)
         # are applied.
@@ -116,6 +108,143 @@ class ReflectionMixin(object):
                 col.info['encode'] = 'raw'
         return table
 
+    def reflect_schema(self, schema='public', use_disk_cache=True,
+                       cache_dir=None):
+        """
+        Reflect every table in *schema* into `meta` using a few bulk
+        catalog queries, rather than several queries per table.
+
+        Later calls to `reflected_table`, `table_definition` and
+        `deep_copy` for these tables reuse the reflected structure until
+        ``catalog.invalidate`` is called for the schema.
+
+        Parameters
+        ----------
+        schema : `str`
+            The database schema to reflect
+        use_disk_cache : `bool`
+            Reuse catalog rows persisted by an earlier session if a
+            fingerprint of the schema's catalog entries is unchanged,
+            and persist freshly fetched rows for next time
+        cache_dir : `str`
+            Directory for persisted rows.
+            Defaults to $HOME/.shiftmanager/cache/
+
+        Returns
+        -------
+        dict mapping table names to :class:`~sqlalchemy.schema.Table`
+        """
+        from shiftmanager import bulk_reflection
+        from shiftmanager.util import cache_path
+        rows = None
+        if use_disk_cache:
+            if not cache_dir:
+                cache_dir = os.path.join(os.path.expanduser("~"),
+                                         ".shiftmanager", "cache")
+            path = cache_path(cache_dir, self.host, self.port,
+                              self.database, schema)
+            fingerprint = bulk_reflection.schema_fingerprint(
+                self._fetchall, schema)
+            rows = bulk_reflection.load_cached_rows(path, fingerprint)
+        if rows is None:
+            rows = bulk_reflection.fetch_schema_rows(self._fetchall, schema)
+            if use_disk_cache:
+                bulk_reflection.save_cached_rows(path, fingerprint, rows)
+        tables = bulk_reflection.build_tables(rows, schema, self.meta,
+                                              self.engine.dialect)
+        self._bulk_reflected.update((schema, name) for name in tables)
+        return tables
+
+    def _forget_bulk_reflected(self, schema=None):
+        """Remove the tables `reflect_schema` put in `meta` for *schema*,
+        or for every schema if None, so `reflected_table` reflects their
+        current structure instead. Called when `catalog` is invalidated.
+        """
+        for key in list(self._bulk_reflected):
+            if schema is None or key[0] == schema:
+                self._bulk_reflected.discard(key)
+                table = self.meta.tables.get('%s.%s' % key)
+                if table is not None:
+                    self.meta.remove(table)
+
+    @memoized_property
+    def compression_advice(self):
+        """A `~shiftmanager.compression.CompressionAdvice` holding the
+        encodings recommended by ANALYZE COMPRESSION for each table,
+        persisted under $HOME/.shiftmanager/compression/.
+        """
+        from shiftmanager.compression import CompressionAdvice
+        from shiftmanager.util import cache_path
+        directory = os.path.join(os.path.expanduser("~"), ".shiftmanager",
+                                 "compression")
+        return CompressionAdvice(cache_path(directory, self.host, self.port,
+                                            self.database))
+
+    def analyze_compression(self, tables, schema='public', comprows=None,
+                            max_workers=4, max_age=None):
+        """
+        Run ANALYZE COMPRESSION on each of *tables*, several at a time on
+        separate connections, and record the recommended encodings in
+        `compression_advice` for later use by `table_definition` and
+        `deep_copy`.
+
+        Parameters
+        ----------
+        tables : `list` of `str`
+            Names of the tables to analyze; names may be qualified
+            as 'schema.table'
+        schema : `str`
+            The database schema for unqualified table names
+        comprows : `int` or `None`
+            Number of rows per slice to sample; Redshift's default
+            of 100,000 if None
+        max_workers : `int`
+            Number of tables to analyze concurrently
+        max_age : `int` or `None`
+            Skip tables with a recommendation at most this many
+            seconds old
+
+        Returns
+        -------
+        dict mapping (schema, table) to
+        `~shiftmanager.compression.Recommendation`
+        """
+        from multiprocessing.pool import ThreadPool
+        keys = []
+        for name in tables:
+            if '.' in name:
+                keys.append(tuple(name.split('.', 1)))
+            else:
+                keys.append((schema, name))
+        advice = self.compression_advice
+        results = {}
+        pending = []
+        for key in keys:
+            recommendation = advice.get(key[1], key[0], max_age)
+            if recommendation is None:
+                pending.append(key)
+            else:
+                results[key] = recommendation
+
+        def analyze(key):
+            worker = self.clone()
+            worker._compression_advice = advice
+            try:
+                worker._recommended_encodings(key[1], key[0], comprows)
+            finally:
+                worker._discard_connection()
+            return key, advice.get(key[1], key[0])
+
+        if pending:
+            print("Analyzing compression of %d tables..." % len(pending))
+            pool = ThreadPool(max(1, min(max_workers, len(pending))))
+            try:
+                results.update(pool.imap_unordered(analyze, pending))
+            finally:
+                pool.close()
+                pool.join()
+        return results
+
     def reflected_privileges(self, relation, schema='public', use_cache=True):
         """Return a SQL str which recreates all privileges for *relation*.
 
@@ -132,9 +261,53 @@ class ReflectionMixin(object):
         db_object = self._pass_or_reflect(relation, schema)
         return ';\n'.join(self._privilege_statements(db_object, use_cache))
 
+    def reconcile_privileges(self, policy, ignore=(), use_cache=True,
+                             execute=False):
+        """Return a SQL str of the GRANT and REVOKE statements needed to
+        bring privileges in line with *policy*.
+
+        The ACLs of every relation in the policy's schemas are read in one
+        query and compared with the policy as bitmasks, so only privileges
+        that differ are changed, and changes shared by every table in a
+        schema become a single ``ON ALL TABLES IN SCHEMA`` statement.
+
+        Parameters
+        ----------
+        policy : `dict`
+            Maps (schema, relation) pairs, with '*' as the relation for
+            every relation in the schema, to dicts mapping grantees
+            ('PUBLIC', a user name or 'GROUP name') to their privileges,
+            as relacl characters like 'r*w' or lists of words like
+            ['SELECT', 'INSERT']. See
+            `shiftmanager.privileges.privilege_changes`.
+        ignore : `list` of `str`
+            Grantees whose privileges are never changed
+        use_cache : `bool`
+            Use cached results for the privilege query, if available
+        execute : `bool`
+            Execute the batch in a single transaction in addition to
+            returning it
+        """
+        schemas = sorted(set(schema for schema, _ in policy))
+        if not use_cache:
+            for schema in schemas:
+                self.privileges.invalidate(schema)
+        relations = {}
+        for schema in schemas:
+            for name, info in self.privileges.relations(schema).items():
+                relations[(schema, name)] = info
+        batch = ';\n'.join(privilege_changes(relations, policy, ignore))
+        if execute and batch:
+            with self.transaction():
+                self.execute(batch)
+            for schema in schemas:
+                self.privileges.invalidate(schema)
+        return batch
+
     def table_definition(self, table, schema='public',
                          copy_privileges=True, use_cache=True,
-                         analyze_compression=False):
+                         analyze_compression=False, comprows=None,
+                         compression_max_age=None):
         """
         Return a str containing the necessary SQL statements
         to recreate *table*.
@@ -151,14 +324,24 @@ class ReflectionMixin(object):
             and include them in the return value
         use_cache : `bool`
             Use cached results for the privilege query, if available
+        analyze_compression : `bool`
+            Set column encodings to those recommended by
+            ANALYZE COMPRESSION
+        comprows : `int` or `None`
+            Number of rows per slice for ANALYZE COMPRESSION to sample
+        compression_max_age : `int` or `None`
+            Reuse a recommendation from `compression_advice` if it is
+            at most this many seconds old, rather than analyzing again
         """
+        from sqlalchemy.schema import CreateTable
         table = self._pass_or_reflect(table, schema=schema)
-        table_name = self.preparer.format_table(table)
         if analyze_compression:
-            result = self.engine.execute("ANALYZE COMPRESSION %s" % table_name)
-            encodings = dict((r.Column, r.Encoding) for r in result)
+            encodings = self._recommended_encodings(
+                table.name, table.schema or 'public', comprows,
+                compression_max_age)
             for col in table.columns:
-                col.info['encode'] = encodings[col.key]
+                col.info['encode'] = encodings.get(col.key,
+                                                   col.info.get('encode'))
         batch = str(CreateTable(table).compile(self.engine)).strip()
         if copy_privileges:
             batch += ';\n'
@@ -192,6 +375,7 @@ class ReflectionMixin(object):
             Additional keyword arguments will be passed unchanged to
             :meth:`~sqlalchemy_redshift.dialect.RedshiftDialect.get_view_definition`
         """
+        from sqlalchemy_views import CreateView
         view = self._pass_or_reflect(view, schema)
         definition = self.engine.dialect.get_view_definition(
             self.engine, view.name, view.schema, **kwargs)
@@ -209,9 +393,14 @@ class ReflectionMixin(object):
                   copy_privileges=True, use_cache=True,
                   cascade=False, distinct=False,
                   analyze_compression=False,
+                  comprows=None,
+                  compression_max_age=None,
                   analyze=True,
                   deduplicate_partition_by=None,
                   deduplicate_order_by=None,
+                  preflight=None,
+                  reserve_fraction=0.1,
+                  use_append=False,
                   execute=False,
                   **kwargs):
         """Return a SQL str defining a deep copy of *table*.
@@ -242,6 +431,12 @@ class ReflectionMixin(object):
         analyze_compression : `bool`
             Update the column compression encodings based on results of an
             ANALYZE COMPRESSION statement on the table.
+        comprows : `int` or `None`
+            Number of rows per slice for ANALYZE COMPRESSION to sample
+        compression_max_age : `int` or `None`
+            Reuse a recommendation from `compression_advice` if it is
+            at most this many seconds old, rather than analyzing again;
+            see `analyze_compression`
         analyze: `bool`
             Add an 'ANALYZE table' command at the end of the batch to update
             statistics, since this is not done automatically for INSERTs
@@ -256,6 +451,23 @@ class ReflectionMixin(object):
             passed to the 'PARTITION BY' clause for deduplication, with
             the first row in sort order being the one retained;
             will be ignored if *deduplicate_partition_by* is not also set
+        preflight : `str` or `None`
+            When executing, first check with `deep_copy_estimate` that the
+            cluster has room for the copy, and either 'raise' a ValueError
+            or 'warn' if it doesn't; None, the default, skips the check
+        reserve_fraction : `float`
+            Fraction of the cluster's disk capacity the preflight check
+            requires to remain free once the copy is made
+        use_append : `bool`
+            Move the data with ALTER TABLE APPEND, which moves existing
+            blocks rather than rewriting them, when the new table has
+            exactly the same columns, encodings and keys as the existing
+            one and no deduplication or compression analysis is requested;
+            otherwise fall back to INSERT. ALTER TABLE APPEND can't run in
+            a transaction, so when executed the statements run one at a
+            time and the original table is restored if the append fails.
+            Appended rows keep their existing sort order, so this doesn't
+            sort the table.
         execute : `bool`
             Execute the command in addition to returning it.
         kwargs :
@@ -263,28 +475,31 @@ class ReflectionMixin(object):
             `reflected_table` method.
         """
         table = self._pass_or_reflect(table, schema=schema, **kwargs)
+        append = False
+        if use_append:
+            reason = self._append_blocker(
+                table, distinct or deduplicate_partition_by or
+                analyze_compression)
+            if reason:
+                print("Using INSERT rather than ALTER TABLE APPEND, "
+                      "since %s" % reason)
+            else:
+                append = True
+        if execute and preflight and not append:
+            self._deep_copy_preflight(table, preflight, reserve_fraction)
         table_name = self.preparer.format_table(table)
         outgoing_name = table_name + '$outgoing'
         outgoing_name_simple = table.name + '$outgoing'
         table_definition = '\n' + self.table_definition(
-            table, schema, copy_privileges, use_cache, analyze_compression)
-        insert_statement = "\nINSERT INTO {table_name} \nSELECT "
-        identity_cols = self._get_identity_columns(table.name) or {}
-        col_str = ',\n\t'.join('"%s"' % col.name
-                               for col in table.columns
-                               if col.name not in identity_cols)
-        if distinct:
-            insert_statement += "DISTINCT "
-        if deduplicate_partition_by:
-            inner = "\tSELECT *, ROW_NUMBER() \n"
-            inner += "\tOVER (PARTITION BY {deduplicate_partition_by}"
-            if deduplicate_order_by:
-                inner += " ORDER BY {deduplicate_order_by}"
-            inner += ")\n\tFROM {outgoing_name}\n"
-            insert_statement += ("\n\t" + col_str + "\nFROM (\n" +
-                                 inner + ") WHERE row_number = 1")
+            table, schema, copy_privileges, use_cache, analyze_compression,
+            comprows, compression_max_age)
+        if append:
+            insert_statement = \
+                "\nALTER TABLE {table_name} APPEND FROM {outgoing_name}"
         else:
-            insert_statement += "\n\t" + col_str + "\nFROM {outgoing_name}"
+            insert_statement = self._insert_statement(
+                table, distinct, deduplicate_partition_by,
+                deduplicate_order_by)
         drop_statement = "\nDROP TABLE {outgoing_name}"
         if cascade:
             drop_statement += " CASCADE"
@@ -297,26 +512,635 @@ class ReflectionMixin(object):
         ]
         if analyze:
             statements.append("ANALYZE {table_name}")
-        batch = ';\n'.join(statements).format(
+        if append:
+            # A lock wouldn't outlive its own statement outside a transaction
+            statements.pop(0)
+        statements = [statement.format(
             table_name=table_name, outgoing_name=outgoing_name,
             outgoing_name_simple=outgoing_name_simple,
             deduplicate_partition_by=deduplicate_partition_by,
             deduplicate_order_by=deduplicate_order_by,
-        ) + ';'
+        ) for statement in statements]
+        batch = ';\n'.join(statements) + ';'
+        if execute:
+            self.catalog.invalidate(table.schema or 'public')
+            if append:
+                self._execute_append(statements, table_name, table.name,
+                                     outgoing_name)
+                return batch
         return self.mogrify(batch, None, execute)
 
-    def _cache_privileges(self, schema='public'):
-        result = self.engine.execute(queries.all_privileges.format(search_path=schema))
+    def chunked_deep_copy(self, table, schema='public', chunks=10,
+                          chunk_column=None,
+                          copy_privileges=True, use_cache=True,
+                          cascade=False, distinct=False,
+                          analyze=True,
+                          deduplicate_partition_by=None,
+                          deduplicate_order_by=None,
+                          preflight='raise',
+                          reserve_fraction=0.1,
+                          state_dir=None,
+                          **kwargs):
+        """
+        Deep copy *table* with several bounded INSERT statements, each
+        covering one range of the leading sort key, rather than a single
+        INSERT of the whole table.
+
+        Rows are copied into a new ``<table>$incoming`` table, one range
+        per transaction. Once every range is copied, the tables are
+        swapped in a single transaction like `deep_copy` does.
+        Progress is recorded in a state file after each range, so calling
+        this again after an interruption resumes with the next range.
+        Writes made to *table* while its ranges are being copied are
+        not carried over, so pause writers for the duration.
+
+        Unlike `deep_copy`, this always executes.
+
+        Parameters
+        ----------
+        table : `str` or :class:`~sqlalchemy.schema.Table`
+            The table to reflect
+        schema : `str`
+            The database schema in which to look for *table*
+            (only used if *table* is str)
+        chunks : `int`
+            Number of ranges to split the table into
+        chunk_column : `str` or `None`
+            Column whose ranges to copy; defaults to the leading sort key
+        copy_privileges, use_cache, cascade, distinct, analyze, \
+deduplicate_partition_by, deduplicate_order_by, preflight, reserve_fraction :
+            As for `deep_copy`. *deduplicate_partition_by* must include
+            *chunk_column* so that duplicates never span two ranges.
+        state_dir : `str`
+            Directory for the state file.
+            Defaults to $HOME/.shiftmanager/deep_copy/
+        kwargs :
+            Additional keyword arguments will be passed unchanged to the
+            `reflected_table` method.
+
+        Returns
+        -------
+        int, the number of ranges copied by this call
+        """
+        import sqlalchemy
+        from shiftmanager import chunked_copy
+        from shiftmanager.util import cache_path
+        table = self._pass_or_reflect(table, schema=schema, **kwargs)
+        schema = table.schema or 'public'
+        if chunk_column is None:
+            chunk_column = self._leading_sortkey(table)
+        if deduplicate_partition_by and chunk_column not in [
+                c.strip().strip('"')
+                for c in deduplicate_partition_by.split(',')]:
+            raise ValueError("deduplicate_partition_by must include the "
+                             "chunk column %s" % chunk_column)
+
+        table_name = self.preparer.format_table(table)
+        incoming_simple = table.name + '$incoming'
+        incoming_name = table_name + '$incoming'
+        column = self.preparer.quote(chunk_column)
+        if not state_dir:
+            state_dir = os.path.join(os.path.expanduser("~"),
+                                     ".shiftmanager", "deep_copy")
+        state_path = cache_path(state_dir, self.host, self.port,
+                                self.database, schema, table.name)
+        state = chunked_copy.load_state(state_path)
+        incoming_exists = self.table_exists(incoming_simple, schema)
+
+        if state is None:
+            if incoming_exists:
+                raise ValueError("%s already exists, but there's no record "
+                                 "of a copy in progress" % incoming_name)
+            if preflight:
+                self._deep_copy_preflight(table, preflight, reserve_fraction)
+            bounds = chunked_copy.quote_bounds(
+                row[0] for row in self._fetchall(
+                    chunked_copy.bounds_query(column, table_name, chunks)))
+            definition = self.table_definition(
+                table.tometadata(sqlalchemy.MetaData(), name=incoming_simple),
+                copy_privileges=False)
+            self.execute(definition)
+            state = {'column': chunk_column, 'bounds': bounds, 'done': []}
+            chunked_copy.save_state(state_path, state)
+        elif not incoming_exists:
+            raise ValueError("The copy recorded in %s is missing its "
+                             "table %s" % (state_path, incoming_name))
+        else:
+            print("Resuming copy of %s after %d ranges..." %
+                  (table_name, len(state['done'])))
+
+        conditions = chunked_copy.chunk_conditions(
+            self.preparer.quote(state['column']), state['bounds'])
+        copied = 0
+        for i, condition in enumerate(conditions):
+            if i in state['done']:
+                continue
+            insert = self._insert_statement(
+                table, distinct, deduplicate_partition_by,
+                deduplicate_order_by, where=condition).format(
+                    table_name=incoming_name, outgoing_name=table_name,
+                    deduplicate_partition_by=deduplicate_partition_by,
+                    deduplicate_order_by=deduplicate_order_by)
+            # A range may have been committed before an interruption
+            # kept it from being recorded, so clear it first
+            delete = "DELETE FROM %s WHERE %s" % (incoming_name, condition)
+            print("Copying range %d of %d of %s..." %
+                  (i + 1, len(conditions), table_name))
+            with self.transaction():
+                self.execute(delete)
+                self.execute(insert)
+            state['done'].append(i)
+            chunked_copy.save_state(state_path, state)
+            copied += 1
+
+        outgoing_simple = table.name + '$outgoing'
+        statements = [
+            "LOCK TABLE %s" % table_name,
+            "ALTER TABLE %s RENAME TO %s" % (table_name, outgoing_simple),
+            "ALTER TABLE %s RENAME TO %s" % (incoming_name, table.name),
+        ]
+        if copy_privileges:
+            statements += self._privilege_statements(table, use_cache)
+        drop_statement = "DROP TABLE %s$outgoing" % table_name
+        if cascade:
+            drop_statement += " CASCADE"
+        statements.append(drop_statement)
+        if analyze:
+            statements.append("ANALYZE %s" % table_name)
+        self.execute(';\n'.join(statements) + ';')
+        chunked_copy.clear_state(state_path)
+        self.catalog.invalidate(schema)
+        return copied
+
+    def online_deep_copy(self, table, key_column, schema='public',
+                         updated_column=None, catch_up_passes=2,
+                         copy_privileges=True, use_cache=True,
+                         cascade=False, analyze=True,
+                         preflight='raise',
+                         reserve_fraction=0.1,
+                         **kwargs):
+        """
+        Deep copy *table* while it stays available to readers and writers,
+        locking it only for a short final step.
+
+        Rows are first copied into a new ``<table>$incoming`` table
+        without taking a lock, up to the current maximum of a tracking
+        column. Each catch-up pass then copies the rows whose tracking
+        column has passed the previous maximum in the meantime. Finally
+        *table* is locked, the last few changed rows are copied, and the
+        tables are swapped in a single transaction, so other sessions
+        only wait for that final delta rather than the whole copy.
+
+        The tracking column is *updated_column* if given, and otherwise
+        *key_column*. Without *updated_column*, *table* must only receive
+        inserts, with ever-increasing values of *key_column* such as an
+        identity column. With it, every insert and update must set
+        *updated_column* to a non-decreasing value such as the current
+        timestamp, and each changed row replaces the earlier copy with the
+        same *key_column*. Rows deleted from *table* during the copy are
+        not deleted from the new one.
+
+        Unlike `deep_copy`, this always executes. If a step fails, the
+        ``$incoming`` table is dropped and *table* is left as it was.
+
+        Parameters
+        ----------
+        table : `str` or :class:`~sqlalchemy.schema.Table`
+            The table to reflect
+        key_column : `str`
+            Column uniquely identifying each row of *table*
+        schema : `str`
+            The database schema in which to look for *table*
+            (only used if *table* is str)
+        updated_column : `str` or `None`
+            Column recording when each row was last inserted or updated
+        catch_up_passes : `int`
+            Number of catch-up passes to make before taking the lock
+        copy_privileges, use_cache, cascade, analyze, preflight, \
+reserve_fraction :
+            As for `deep_copy`
+        kwargs :
+            Additional keyword arguments will be passed unchanged to the
+            `reflected_table` method.
+        """
+        import sqlalchemy
+        from shiftmanager.chunked_copy import delta_condition
+        from shiftmanager.rendering import quote_literal
+        table = self._pass_or_reflect(table, schema=schema, **kwargs)
+        schema = table.schema or 'public'
+        table_name = self.preparer.format_table(table)
+        incoming_simple = table.name + '$incoming'
+        incoming_name = table_name + '$incoming'
+        key = self.preparer.quote(key_column)
+        tracking = self.preparer.quote(updated_column or key_column)
+        replace = updated_column is not None
+
+        if self.table_exists(incoming_simple, schema):
+            raise ValueError("%s already exists" % incoming_name)
+        if preflight:
+            self._deep_copy_preflight(table, preflight, reserve_fraction)
+
+        def watermark():
+            value = self._fetchall("SELECT MAX(%s) FROM %s" %
+                                   (tracking, table_name))[0][0]
+            return None if value is None else quote_literal(value)
+
+        def copy(condition):
+            if replace:
+                self.execute(
+                    "DELETE FROM %s WHERE %s IN (SELECT %s FROM %s WHERE %s)"
+                    % (incoming_name, key, key, table_name, condition))
+            self.execute(self._insert_statement(table, where=condition)
+                         .format(table_name=incoming_name,
+                                 outgoing_name=table_name))
+
+        definition = self.table_definition(
+            table.tometadata(sqlalchemy.MetaData(), name=incoming_simple),
+            copy_privileges=False)
+        outgoing_simple = table.name + '$outgoing'
+        swap = [
+            "ALTER TABLE %s RENAME TO %s" % (table_name, outgoing_simple),
+            "ALTER TABLE %s RENAME TO %s" % (incoming_name, table.name),
+        ]
+        if copy_privileges:
+            swap += self._privilege_statements(table, use_cache)
+        drop_statement = "DROP TABLE %s$outgoing" % table_name
+        if cascade:
+            drop_statement += " CASCADE"
+        swap.append(drop_statement)
+
+        try:
+            high = watermark()
+            print("Copying %s up to %s = %s..." % (table_name, tracking, high))
+            snapshot = "%s IS NULL" % tracking
+            if high is not None:
+                snapshot = "%s <= %s OR %s" % (tracking, high, snapshot)
+            with self.transaction():
+                self.execute(definition)
+                self.execute(self._insert_statement(table, where=snapshot)
+                             .format(table_name=incoming_name,
+                                     outgoing_name=table_name))
+            for i in range(catch_up_passes):
+                low, high = high, watermark()
+                if high == low:
+                    continue
+                print("Catching up %s from %s = %s (pass %d of %d)..." %
+                      (table_name, tracking, low, i + 1, catch_up_passes))
+                with self.transaction():
+                    copy(delta_condition(tracking, low, high, replace))
+            print("Locking %s to copy its last changes and swap..." %
+                  table_name)
+            with self.transaction():
+                self.execute("LOCK TABLE %s" % table_name)
+                copy(delta_condition(tracking, high, None, replace) or
+                     "%s IS NOT NULL" % tracking)
+                self.execute(';\n'.join(swap) + ';')
+        except Exception:
+            print("Online deep copy of %s failed; dropping %s" %
+                  (table_name, incoming_name))
+            self.execute("DROP TABLE IF EXISTS %s" % incoming_name)
+            raise
+        finally:
+            self.catalog.invalidate(schema)
+        if analyze:
+            self.execute("ANALYZE %s" % table_name)
+
+    def deep_copy_estimate(self, table, schema='public',
+                           reserve_fraction=0.1, history_days=7):
+        """
+        Estimate the disk space and time a `deep_copy` of *table* needs.
+
+        Space comes from the table's size in svv_table_info, doubled for
+        sorted tables to allow for the sort spilling to disk, compared
+        against free space in stv_partitions. Time comes from the rate at
+        which INSERT ... SELECT statements wrote rows over the last
+        *history_days* days, and is None if there were none.
+
+        Parameters
+        ----------
+        table : `str`
+            The name of the table to copy
+        schema : `str`
+            The database schema in which to look for *table*
+        reserve_fraction : `float`
+            Fraction of the cluster's disk capacity that must remain free
+            once the copy is made for the estimate to report that it *fits*
+        history_days : `int`
+            How far back to look for INSERT throughput
+
+        Returns
+        -------
+        `~shiftmanager.maintenance.DeepCopyEstimate`
+        """
+        from shiftmanager.maintenance import estimate_deep_copy
+        stats = self._fetchall(queries.table_stats,
+                               {'schema': schema, 'table': table})
+        size, rows, sortkey1 = stats[0] if stats else (0, 0, None)
+        capacity, used = self._fetchall(queries.disk_space)[0]
+        history = self._fetchall(queries.insert_throughput,
+                                 {'days': history_days})
+        rows_per_second = None
+        if history and history[0][0] and history[0][1]:
+            rows_per_second = history[0][0] / (history[0][1] / 1000.0)
+        return estimate_deep_copy(schema, table, size, rows,
+                                  sortkey1 is not None, capacity, used,
+                                  rows_per_second, reserve_fraction)
+
+    def advise_keys(self, schema='public', days=7, tables=None, **kwargs):
+        """
+        Suggest distribution and sort keys for the tables in *schema*
+        from the last *days* days of query history.
+
+        A distkey is suggested on the column whose joins spent the most
+        time redistributing or broadcasting rows (DS_DIST_* and
+        DS_BCAST_INNER steps), as long as it has enough distinct values
+        and no dominant value; small broadcast tables are suggested
+        DISTSTYLE ALL instead. A compound sortkey is suggested on the
+        columns most often filtered on.
+
+        Each suggestion's ``kwargs`` can be passed straight to
+        `reflected_table` or `deep_copy`::
+
+            for advice in redshift.advise_keys('my_schema'):
+                if advice.changed:
+                    redshift.deep_copy(advice.table, schema='my_schema',
+                                       **advice.kwargs)
+
+        Query history identifies tables by name alone, so tables sharing
+        a name across schemas share their history.
+
+        Parameters
+        ----------
+        schema : `str`
+            The database schema whose tables to advise on
+        days : `int`
+            How much query history to consider
+        tables : `list` of `str` or `None`
+            Only advise on these tables
+        kwargs :
+            Thresholds passed to `~shiftmanager.key_advisor.advise`
+
+        Returns
+        -------
+        list of `~shiftmanager.key_advisor.KeyAdvice`,
+        largest expected gain first
+        """
+        from shiftmanager import key_advisor
+        relations = self.catalog.relations(schema)
+        columns_by_table = dict(
+            (name, set(relation.columns))
+            for name, relation in relations.items()
+            if relation.kind == 'r' and (tables is None or name in tables))
+        params = {'days': days}
+        joins = key_advisor.join_stats(
+            self._fetchall(queries.redistributed_join_plans, params),
+            self._fetchall(queries.redistribution_cost, params),
+            columns_by_table)
+        filters = key_advisor.filter_stats(
+            self._fetchall(queries.scan_filters, params), columns_by_table)
+        slices = self._fetchall(queries.slice_count)[0][0]
+        current = dict((row[0], row[1:]) for row in self._fetchall(
+            queries.table_keys, {'schema': schema}))
+
+        advice = []
+        for table in sorted(columns_by_table):
+            if table not in joins and table not in filters:
+                continue
+            table_name = '%s.%s' % (self.preparer.quote_schema(schema),
+                                    self.preparer.quote(table))
+
+            def profile(column, table_name=table_name):
+                return self._fetchall(queries.column_profile.format(
+                    column=self.preparer.quote(column),
+                    table=table_name))[0]
+
+            diststyle, sortkey1, rows = current.get(table, (None, None, 0))
+            advice.append(key_advisor.advise(
+                schema, table, diststyle, sortkey1, rows or 0,
+                joins.get(table, {}), filters.get(table, {}), profile,
+                slices, **kwargs))
+        advice.sort(key=lambda a: -a.expected_gain_seconds)
+        return advice
+
+    def dump_ddl(self, output, schemas='public', max_workers=4,
+                 copy_privileges=True):
+        """
+        Write the definitions of every table and view in *schemas*,
+        with their owners and grants, to *output*.
+
+        Relations are reflected concurrently on *max_workers* separate
+        connections, and each definition is written as soon as it's
+        ready. Tables come first, then views ordered so that each follows
+        the views it selects from, so the output can be replayed to
+        recreate the schemas.
+
+        The ``shiftmanager-dump-ddl`` command does the same from the
+        command line.
+
+        Parameters
+        ----------
+        output : `str` or file-like
+            Path of the file to write, or a file-like object accepting text
+        schemas : `str` or `list` of `str`
+            The database schemas to dump
+        max_workers : `int`
+            Number of relations to reflect concurrently
+        copy_privileges : `bool`
+            Include ownership and grants for each relation
+
+        Returns
+        -------
+        int, the number of relations written
+        """
+        import io
+        from shiftmanager.dump import dump_ddl
+        if not isinstance(schemas, (list, tuple)):
+            schemas = [schemas]
+        if hasattr(output, 'write'):
+            return dump_ddl(self, schemas, output, max_workers,
+                            copy_privileges)
+        with io.open(output, 'w', encoding='utf-8') as f:
+            return dump_ddl(self, schemas, f, max_workers, copy_privileges)
+
+    def migrate_tables(self, target, tables, bucket, keypath,
+                       max_workers=4, copy_privileges=True, replace=False,
+                       cleanup_s3=True):
+        """
+        Copy *tables* from this cluster to the *target* cluster.
 
-        self._all_privileges = {}
-        for r in result:
-            key = _get_relation_key(r.relname, r.schema)
-            self._all_privileges[key] = r
+        Each table is created on *target* from its definition here, with
+        its owner and grants, then unloaded here as Parquet and copied
+        into *target* through S3 in the same transaction as its creation.
+        Up to *max_workers* tables are migrated at once, each on its own
+        pair of connections, and once each table is loaded its row count
+        on *target* is compared with the rows the UNLOAD wrote.
+
+        Parameters
+        ----------
+        target : `~shiftmanager.redshift.Redshift`
+            The cluster to copy the tables to
+        tables : `list`
+            Table names, 'schema.table' strings or (schema, table) pairs
+        bucket : `str`
+            S3 bucket to stage the data in, readable by both clusters
+        keypath : `str`
+            S3 key path to stage the data under
+        max_workers : `int`
+            Number of tables to migrate concurrently
+        copy_privileges : `bool`
+            Carry owners and grants over; the users and groups they name
+            must already exist on *target*
+        replace : `bool`
+            Replace tables that already exist on *target*; otherwise
+            their migration fails
+        cleanup_s3 : `bool`
+            Delete each table's staged files once it's loaded
+
+        Returns
+        -------
+        list of `~shiftmanager.migrate.MigrationResult`, in the order of
+        *tables*; use `~shiftmanager.migrate.verified` to check each
+        """
+        from shiftmanager.migrate import migrate_tables
+        return migrate_tables(self, target, tables, bucket, keypath,
+                              max_workers, copy_privileges, replace,
+                              cleanup_s3)
+
+    def table_maintenance_plan(self, schemas='public',
+                               deep_copy_unsorted=20.0, vacuum_unsorted=5.0,
+                               analyze_stats_off=10.0):
+        """
+        Return a ranked list of the tables in *schemas* that need a
+        `deep_copy`, a VACUUM or an ANALYZE, based on svv_table_info.
+
+        Heavily unsorted tables are rebuilt with a deep copy, which is
+        much faster than vacuuming them; moderately unsorted tables are
+        vacuumed; tables that are sorted but have stale statistics are
+        analyzed. Tables that stand to gain the most come first.
+
+        Parameters
+        ----------
+        schemas : `str` or `list` of `str`
+            The database schemas to inspect
+        deep_copy_unsorted : `float`
+            Percentage of unsorted rows at or above which a table
+            is deep copied rather than vacuumed
+        vacuum_unsorted : `float`
+            Percentage of unsorted rows at or above which a table
+            is vacuumed
+        analyze_stats_off : `float`
+            Staleness of statistics (svv_table_info.stats_off)
+            at or above which a table is analyzed
+
+        Returns
+        -------
+        list of `~shiftmanager.maintenance.MaintenanceTask`
+        """
+        from shiftmanager.maintenance import plan_maintenance
+        if not isinstance(schemas, (list, tuple)):
+            schemas = [schemas]
+        rows = self._fetchall(queries.table_health,
+                              {'schemas': tuple(schemas)})
+        return plan_maintenance(rows, deep_copy_unsorted=deep_copy_unsorted,
+                                vacuum_unsorted=vacuum_unsorted,
+                                analyze_stats_off=analyze_stats_off)
+
+    def run_table_maintenance(self, plan, max_workers=2, disk_budget=None,
+                              reserve_fraction=0.2, **kwargs):
+        """
+        Run the tasks in *plan*, as returned by `table_maintenance_plan`,
+        on up to *max_workers* separate connections at once.
+
+        A deep copy or VACUUM temporarily needs about as much free disk
+        as the table occupies, so a task only starts when it fits in the
+        disk budget alongside every task already running. Tasks too large
+        for the budget are skipped. A failed task is reported rather than
+        stopping the run.
+
+        Prints a report of each table's elapsed time and space reclaimed.
+
+        Parameters
+        ----------
+        plan : `list` of `~shiftmanager.maintenance.MaintenanceTask`
+            The tasks to run, in order of preference
+        max_workers : `int`
+            Maximum number of tasks to run concurrently
+        disk_budget : `int` or `None`
+            Disk space in 1 MB blocks that running tasks may consume;
+            by default, whatever is free in stv_partitions beyond
+            *reserve_fraction* of the cluster's capacity
+        reserve_fraction : `float`
+            Fraction of the cluster's disk capacity to leave free
+            when *disk_budget* is not given
+        kwargs :
+            Additional keyword arguments passed to `deep_copy`
+
+        Returns
+        -------
+        list of `~shiftmanager.maintenance.MaintenanceResult`
+        """
+        from shiftmanager import maintenance
+        if disk_budget is None:
+            capacity, used = self._fetchall(queries.disk_space)[0]
+            disk_budget = maintenance.disk_budget(capacity, used,
+                                                  reserve_fraction)
+        print("Running maintenance on %d tables with up to %d workers "
+              "and %d MB of disk..." % (len(plan), max_workers, disk_budget))
+
+        def run(task):
+            return self._run_maintenance_task(task, **kwargs)
+
+        results, skipped = maintenance.run_within_budget(
+            plan, run, max_workers=max_workers, budget=disk_budget)
+        for schema in set(task.schema for task in plan):
+            self.catalog.invalidate(schema)
+        print(maintenance.format_report(results, skipped))
+        return results
+
+    def _run_maintenance_task(self, task, **kwargs):
+        from shiftmanager.maintenance import (ANALYZE, DEEP_COPY,
+                                              MaintenanceResult)
+        worker = self.clone()
+        table_name = '%s.%s' % (worker.preparer.quote_schema(task.schema),
+                                worker.preparer.quote(task.table))
+        print("Starting %s of %s..." % (task.action, table_name))
+        start = time.time()
+        try:
+            if task.action == DEEP_COPY:
+                worker.deep_copy(task.table, schema=task.schema,
+                                 execute=True, **kwargs)
+            elif task.action == ANALYZE:
+                worker.execute("ANALYZE %s" % table_name)
+            else:
+                with worker.autocommit():
+                    worker.execute("VACUUM FULL %s" % table_name)
+                    worker.execute("ANALYZE %s" % table_name)
+            rows = worker._fetchall(queries.table_size,
+                                    {'schema': task.schema,
+                                     'table': task.table})
+        except Exception as e:
+            print("%s of %s failed: %s" % (task.action, table_name, e))
+            return MaintenanceResult(task=task, seconds=time.time() - start,
+                                     size_after=None, reclaimed=None,
+                                     error=e)
+        finally:
+            worker._discard_connection()
+        size_after = rows[0][0] if rows else 0
+        seconds = time.time() - start
+        print("Finished %s of %s in %.1f seconds" %
+              (task.action, table_name, seconds))
+        return MaintenanceResult(task=task, seconds=seconds,
+                                 size_after=size_after,
+                                 reclaimed=task.size - size_after,
+                                 error=None)
 
     def _privilege_statements(self, relation, use_cache):
-        if not use_cache or not self._all_privileges:
-            self._cache_privileges(relation.schema)
-        priv_info = self._all_privileges[relation.key]
+        schema = relation.schema or 'public'
+        if not use_cache:
+            self.privileges.invalidate(schema)
+        priv_info = self.privileges.get(relation.name, schema)
+        if priv_info is None:
+            raise KeyError("No privileges found for %s" % relation.key)
         relation_name = self.preparer.format_table(relation)
         statements = [("ALTER {type} {relation_name} OWNER TO {owner}"
                        .format(type=priv_info.type.upper(),
@@ -327,6 +1151,7 @@ class ReflectionMixin(object):
         return statements
 
     def _pass_or_reflect(self, table, schema, **kwargs):
+        from sqlalchemy.schema import CreateTable
         try:
             # This is already a sqlalchemy.Table object; return it unchanged.
             CreateTable(table)
@@ -334,16 +1159,120 @@ class ReflectionMixin(object):
             table = self.reflected_table(table, schema=schema, **kwargs)
         return table
 
-    def _get_identity_columns(self, table_name):
-        query = sqlalchemy.sql.text("""
-            SELECT a.attname AS identity_col
-            FROM pg_class c, pg_attribute a, pg_attrdef d
-            WHERE c.oid = a.attrelid
-                AND c.relkind = 'r'
-                AND a.attrelid = d.adrelid
-                AND a.attnum = d.adnum
-                AND d.adsrc LIKE '%%identity%%'
-                AND c.relname = :tbl;
-        """)
-        results = self.engine.execute(query, {'tbl': table_name})
-        return {id_col[0] for id_col in results}
+    def _append_blocker(self, table, rewrite_requested):
+        """Return why *table* can't be filled with ALTER TABLE APPEND
+        from the existing table of the same name, or None if it can."""
+        import sqlalchemy
+        from sqlalchemy.schema import CreateTable
+        if rewrite_requested:
+            return "deduplication or compression analysis rewrites the rows"
+        existing = sqlalchemy.Table(table.name, sqlalchemy.MetaData(),
+                                    schema=table.schema, autoload=True,
+                                    autoload_with=self.engine)
+        if str(CreateTable(existing).compile(self.engine)) != \
+                str(CreateTable(table).compile(self.engine)):
+            return "the table's columns, encodings or keys are changing"
+        return None
+
+    def _execute_append(self, statements, table_name, table_name_simple,
+                        outgoing_name):
+        rename, definition, append = statements[:3]
+        with self.autocommit():
+            self.execute(rename)
+            # Until the append succeeds, the data is only in $outgoing,
+            # so put it back if recreating the table or appending fails
+            try:
+                self.execute(definition)
+                self.execute(append)
+            except Exception:
+                print("Deep copy by APPEND failed; restoring %s" % table_name)
+                self.execute("DROP TABLE IF EXISTS %s" % table_name)
+                self.execute("ALTER TABLE %s RENAME TO %s" %
+                             (outgoing_name, table_name_simple))
+                raise
+            for statement in statements[3:]:
+                self.execute(statement)
+
+    def _leading_sortkey(self, table):
+        options = table.dialect_options['redshift']
+        sortkey = options['sortkey'] or options['interleaved_sortkey']
+        if not sortkey:
+            raise ValueError("%s has no sort key; pass a chunk_column"
+                             % table.key)
+        if isinstance(sortkey, (list, tuple)):
+            sortkey = sortkey[0]
+        return getattr(sortkey, 'name', sortkey)
+
+    def _insert_statement(self, table, distinct=False,
+                          deduplicate_partition_by=None,
+                          deduplicate_order_by=None, where=None):
+        """Return a template for an INSERT into {table_name}
+        from {outgoing_name}, optionally restricted by *where*."""
+        insert_statement = "\nINSERT INTO {table_name} \nSELECT "
+        identity_cols = self._get_identity_columns(
+            table.name, table.schema or 'public') or {}
+        col_str = ',\n\t'.join('"%s"' % col.name
+                               for col in table.columns
+                               if col.name not in identity_cols)
+        where_str = ''
+        if where:
+            # Literals in the condition mustn't be taken as placeholders
+            where_str = "WHERE " + where.replace('{', '{{').replace('}', '}}')
+        if distinct:
+            insert_statement += "DISTINCT "
+        if deduplicate_partition_by:
+            inner = "\tSELECT *, ROW_NUMBER() \n"
+            inner += "\tOVER (PARTITION BY {deduplicate_partition_by}"
+            if deduplicate_order_by:
+                inner += " ORDER BY {deduplicate_order_by}"
+            inner += ")\n\tFROM {outgoing_name}\n"
+            if where_str:
+                inner += "\t" + where_str + "\n"
+            insert_statement += ("\n\t" + col_str + "\nFROM (\n" +
+                                 inner + ") WHERE row_number = 1")
+        else:
+            insert_statement += "\n\t" + col_str + "\nFROM {outgoing_name}"
+            if where_str:
+                insert_statement += "\n" + where_str
+        return insert_statement
+
+    def _deep_copy_preflight(self, table, preflight, reserve_fraction):
+        import warnings
+        estimate = self.deep_copy_estimate(table.name,
+                                           table.schema or 'public',
+                                           reserve_fraction)
+        if estimate.fits:
+            return
+        message = ("A deep copy of %s.%s needs about %d MB of disk but only "
+                   "%d MB of %d MB is free, leaving less than %d%% headroom"
+                   % (estimate.schema, estimate.table,
+                      estimate.required_space, estimate.free_space,
+                      estimate.capacity, reserve_fraction * 100))
+        if preflight == 'warn':
+            warnings.warn(message)
+        else:
+            raise ValueError(message)
+
+    def _recommended_encodings(self, table_name, schema, comprows=None,
+                               max_age=None):
+        from shiftmanager.compression import (analyze_compression_statement,
+                                              encodings_from_rows)
+        recommendation = None
+        if max_age is not None:
+            recommendation = self.compression_advice.get(table_name, schema,
+                                                         max_age)
+        if recommendation is None:
+            quoted = '%s.%s' % (self.preparer.quote_schema(schema),
+                                self.preparer.quote(table_name))
+            print("Analyzing compression of %s..." % quoted)
+            rows = self._fetchall(analyze_compression_statement(quoted,
+                                                                comprows))
+            recommendation = self.compression_advice.put(
+                table_name, schema, encodings_from_rows(rows), comprows)
+        return recommendation.encodings
+
+    def _get_identity_columns(self, table_name, schema='public'):
+        relation = self.catalog.relation(table_name, schema)
+        if relation is None:
+            return set()
+        return set(relation.identity_columns)
@@ -11,9 +11,6 @@ import os
 import gzip
 from functools import wraps
 
-from boto.s3.connection import S3Connection
-from boto.s3.connection import OrdinaryCallingFormat
-
 from shiftmanager import util, queries
 
 
@@ -81,6 +78,10 @@ class S3Mixin(object):
         ordinary_calling_fmt : bool
             Initialize connection with OrdinaryCallingFormat
         """
+        # Imported here since boto is slow to import and only
+        # needed once we talk to S3
+        from boto.s3.connection import S3Connection
+        from boto.s3.connection import OrdinaryCallingFormat
 
         args = []
         kwargs = {}
@@ -319,7 +320,7 @@ class S3Mixin(object):
     @check_s3_connection
     def copy_json_to_table(self, bucket, keypath, data, jsonpaths, table,
                            slices=32, clean_up_s3=True, local_path=None,
-                           clean_up_local=True):
+                           clean_up_local=True, retry_policy=None):
         """
         Given a list of JSON-able dicts, COPY them to the given *table_name*
 
@@ -350,6 +351,9 @@ class S3Mixin(object):
             $HOME/.shiftmanager/tmp/
         clean_up_local : bool
             Clean up local chunked JSON after COPY completes.
+        retry_policy : `~shiftmanager.retry.RetryPolicy` or None
+            Policy for retrying the COPY on transient errors;
+            defaults to the instance's *retry_policy*
         """
 
         print("Fetching S3 bucket {}...".format(bucket))
@@ -414,7 +418,7 @@ class S3Mixin(object):
                 creds=creds, jpaths_key=jpaths_complete_path)
 
             print("Performing COPY...")
-            self.execute(statement)
+            self.execute(statement, retry_policy=retry_policy)
 
         finally:
             if clean_up_s3:
@@ -423,7 +427,9 @@ class S3Mixin(object):
     @check_s3_connection
     def unload_table_to_s3(self, bucket, keypath, table,
                            schema='public', col_str='*', where=None,
-                           to_json=True, options=None):
+                           to_json=True, options=None, retry_policy=None,
+                           file_format=None, compression=None,
+                           max_file_size=None, partition_by=None):
         """
         Given a table in Redshift, UNLOAD it to S3
 
@@ -445,34 +451,45 @@ class S3Mixin(object):
             SQL where clause string to filter select statement in unload
             Defaults to None, meaning no WHERE clause is applied
         to_json: boolean
+            Build each row into a JSON string in SQL;
+            ignored if *file_format* is given.
             Defaults to True
         options : str
             Additional options to be included in UNLOAD command
             Defaults to None and the following options are used:
             - MANIFEST
-            - GZIP
+            - GZIP (or the given *compression*)
             - ALLOWOVERWRITE
+        retry_policy : `~shiftmanager.retry.RetryPolicy` or None
+            Policy for retrying the UNLOAD on transient errors;
+            defaults to the instance's *retry_policy*
+        file_format : str or None
+            'csv', 'json' or 'parquet' to have Redshift write that format
+            natively, which is much faster than *to_json* for wide tables
+        compression : str, False or None
+            'gzip', 'bzip2' or 'zstd', or False for uncompressed files;
+            defaults to GZIP, except for Parquet, which is always
+            compressed with Snappy
+        max_file_size : int, str or None
+            Largest file for UNLOAD to write, in MB or as a string
+            like '1 GB'; Redshift's default is 6.2 GB
+        partition_by : str, list or None
+            Columns to lay the output out by, in Hive-style
+            ``column=value/`` key prefixes that can be read independently
         """
+        from shiftmanager.unload import unload_options
 
         # leaving this without schema name to not break backwards compatibility
         s3_table_path = 's3://' + os.path.join(bucket, keypath, table + '/')
 
-        if self.aws_role_name:
-            creds = "aws_iam_role={};".format(self.aws_role_name)
-        else:
-            creds = ("aws_access_key_id={};aws_secret_access_key={}"
-                     .format(self.aws_access_key_id,
-                             self.aws_secret_access_key))
-            if self.security_token:
-                creds += ';token={}'.format(self.security_token)
-
-        if not options:
-            options = "MANIFEST GZIP ALLOWOVERWRITE"
+        options = unload_options(file_format, compression, max_file_size,
+                                 options or None, partition_by)
         if self._diststyle(table, schema) == 'ALL':
             options += ' PARALLEL OFF'
 
-        if to_json:
-            columns_and_types = self._get_columns_and_types(table, col_str)
+        if to_json and not file_format:
+            columns_and_types = self._get_columns_and_types(table, schema,
+                                                            col_str)
             cols = self._json_col_str(columns_and_types)
         else:
             cols = col_str
@@ -483,30 +500,358 @@ class S3Mixin(object):
         if where is not None:
             select += where
 
-        statement = """
+        statement = self._unload_statement(select, s3_table_path, options)
+        print("Performing UNLOAD...")
+        self.execute(statement, retry_policy=retry_policy)
+
+    @check_s3_connection
+    def unload_table_ranges(self, bucket, keypath, table, schema='public',
+                            column=None, ranges=8, change_column=None,
+                            col_str='*', where=None, max_workers=4,
+                            only_changed=True, file_format=None,
+                            compression=None, max_file_size=None,
+                            partition_by=None, retry_policy=None):
+        """
+        UNLOAD a table to S3 in several ranges of one column, running up
+        to *max_workers* UNLOADs at once on separate connections.
+
+        Each range is written under its own ``range=NNNN/`` prefix of
+        ``s3://<bucket>/<keypath>/<table>/`` with its own manifest, so
+        downstream consumers can read ranges independently. A
+        ``ranges.json`` file alongside them records each range's
+        condition, prefix, manifest and fingerprint: its row count and, if
+        *change_column* is given, its greatest value of that column.
+        When called again with the same arguments, the range bounds in
+        ``ranges.json`` are reused and only the ranges whose fingerprint
+        changed are unloaded, with CLEANPATH, so no files from an earlier
+        unload of a range are left under its prefix.
+        Without *change_column*, an update that leaves a range's row
+        count unchanged goes unnoticed.
+
+        Parameters
+        ----------
+        bucket, keypath, table, schema, col_str, where, file_format, \
+compression, max_file_size, partition_by, retry_policy :
+            As for `unload_table_to_s3`
+        column : str or None
+            Column whose ranges to unload; defaults to the leading sort key
+        ranges : int
+            Number of ranges to split the table into, holding roughly
+            equal numbers of rows
+        change_column : str or None
+            Column whose value grows whenever a row is inserted or
+            updated, such as a last-updated timestamp
+        max_workers : int
+            Number of UNLOADs to run at once
+        only_changed : bool
+            Skip ranges whose fingerprint is unchanged; if False, every
+            range is unloaded and the bounds are recomputed
+
+        Returns
+        -------
+        dict, the contents of ``ranges.json``, plus an 'unloaded' list of
+        the indexes of the ranges unloaded by this call
+        """
+        import re
+        import threading
+        from multiprocessing.pool import ThreadPool
+        from shiftmanager import chunked_copy, unload
+
+        # A range unloaded again may write fewer parts or partitions, so
+        # clear out its earlier files rather than overwriting them
+        options = unload.unload_options(file_format, compression,
+                                        max_file_size, None, partition_by,
+                                        clean_path=True)
+        table_name = "{schema}.{table}".format(schema=schema, table=table)
+        if column is None:
+            stats = self._fetchall(queries.table_stats,
+                                   {'schema': schema, 'table': table})
+            column = stats[0][2] if stats else None
+            if column is None:
+                raise ValueError("%s has no sort key; pass a column"
+                                 % table_name)
+        quoted_column = self.preparer.quote(column)
+        quoted_change = (self.preparer.quote(change_column)
+                         if change_column else None)
+        if where:
+            where = re.sub(r'^\s*WHERE\s+', '', where.strip(),
+                           flags=re.IGNORECASE)
+
+        bukkit = self.get_bucket(bucket)
+        prefix = os.path.join(keypath, table) + '/'
+        state_key = prefix + 'ranges.json'
+        previous = None
+        if only_changed:
+            existing = bukkit.get_key(state_key)
+            if existing is not None:
+                previous = json.loads(
+                    existing.get_contents_as_string().decode('utf-8'))
+                # Different ranges or output can't be compared
+                if [previous.get(k) for k in ('column', 'where',
+                                              'change_column', 'col_str',
+                                              'options')] != \
+                        [column, where, change_column, col_str, options]:
+                    previous = None
+
+        if previous is not None:
+            bounds = previous['bounds']
+        else:
+            bounds = chunked_copy.quote_bounds(
+                row[0] for row in self._fetchall(chunked_copy.bounds_query(
+                    quoted_column, table_name, ranges)))
+        conditions = chunked_copy.chunk_conditions(quoted_column, bounds)
+        fingerprints = dict(
+            (row[0], [row[1], None if row[2] is None else str(row[2])])
+            for row in self._fetchall(unload.fingerprint_query(
+                table_name, conditions, quoted_change, where)))
+        old = {}
+        if previous is not None:
+            old = dict((entry['index'], entry['fingerprint'])
+                       for entry in previous['ranges'])
+
+        entries, pending, statements = [], [], {}
+        for i, condition in enumerate(conditions):
+            range_path = 's3://%s/%srange=%04d/' % (bucket, prefix, i)
+            entry = {'index': i, 'condition': condition,
+                     'prefix': range_path,
+                     'manifest': range_path + 'manifest',
+                     'fingerprint': fingerprints.get(i, [0, None])}
+            entries.append(entry)
+            if old.get(i) == entry['fingerprint']:
+                continue
+            if where:
+                condition = "(%s) AND (%s)" % (where, condition)
+            select = "SELECT {col_str} FROM {table} WHERE {condition}".format(
+                col_str=col_str, table=table_name, condition=condition)
+            statements[i] = self._unload_statement(select, range_path,
+                                                   options)
+            pending.append(entry)
+
+        local = threading.local()
+        workers = []
+        lock = threading.Lock()
+
+        def run(entry):
+            if not hasattr(local, 'redshift'):
+                local.redshift = self.clone()
+                with lock:
+                    workers.append(local.redshift)
+            print("Unloading range %d of %d of %s..." %
+                  (entry['index'] + 1, len(entries), table_name))
+            try:
+                local.redshift.execute(statements[entry['index']],
+                                       retry_policy=retry_policy)
+            except Exception as e:
+                return entry, e
+            return entry, None
+
+        errors = []
+        if pending:
+            pool = ThreadPool(max(1, min(max_workers, len(pending))))
+            try:
+                for entry, error in pool.imap_unordered(run, pending):
+                    if error is not None:
+                        # Retried on the next call
+                        entry['fingerprint'] = None
+                        errors.append(error)
+            finally:
+                pool.close()
+                pool.join()
+                for worker in workers:
+                    worker._discard_connection()
+
+        state = {'table': table_name, 'column': column, 'where': where,
+                 'change_column': change_column, 'col_str': col_str,
+                 'options': options, 'bounds': bounds, 'ranges': entries}
+        bukkit.new_key(state_key).set_contents_from_string(
+            json.dumps(state, indent=2, sort_keys=True))
+        if errors:
+            raise errors[0]
+        state['unloaded'] = [entry['index'] for entry in pending]
+        return state
+
+    def _unload_statement(self, select, s3_path, options):
+        if self.aws_role_name:
+            creds = "aws_iam_role={};".format(self.aws_role_name)
+        else:
+            creds = ("aws_access_key_id={};aws_secret_access_key={}"
+                     .format(self.aws_access_key_id,
+                             self.aws_secret_access_key))
+            if self.security_token:
+                creds += ';token={}'.format(self.security_token)
+
+        return """
         UNLOAD ($${select}$$)
         TO '{s3_path}'
         CREDENTIALS '{creds}'
         {options};
-        """.format(select=select.strip(), s3_path=s3_table_path, creds=creds,
+        """.format(select=select.strip(), s3_path=s3_path, creds=creds,
                    options=options)
 
-        print("Performing UNLOAD...")
-        self.execute(statement)
+    def iter_table(self, table, bucket=None, keypath=None, schema='public',
+                   col_str='*', where=None, batch_size=10000,
+                   columnar=False, max_workers=4, max_pending=None,
+                   cursor_max_rows=100000, clean_up=True,
+                   retry_policy=None):
+        """
+        Iterate over the rows of a table in Redshift.
+
+        Large tables are unloaded to S3 as gzipped CSV, and the parts
+        listed in the UNLOAD manifest are downloaded, decompressed and
+        parsed in worker threads as the iterator is consumed, with only a
+        bounded number of batches held in memory at once. Tables of at
+        most *cursor_max_rows* rows, going by svv_table_info, are fetched
+        with a plain query instead, since an UNLOAD isn't worth its
+        overhead for them. Views, which svv_table_info leaves out, are
+        sized by the planner's estimate from EXPLAIN.
+
+        Either way, values are converted to the types a cursor would
+        return for integer, floating point, numeric, boolean, date and
+        timestamp columns; other values are strings. Rows from an UNLOAD
+        come in no particular order.
+
+        Parameters
+        ----------
+        table : str
+            Table name
+        bucket : str
+            S3 bucket to unload to; required unless the table is small
+        keypath : str
+            S3 key path to unload to
+        schema : str
+            Schema that table resides in
+            Defaults to 'public'
+        col_str : str
+            Comma separated string of columns to fetch
+            Defaults to '*'
+        where : str
+            SQL where clause string to filter the rows
+        batch_size : int
+            Number of rows parsed at a time by each worker
+        columnar : bool
+            Yield batches as dicts mapping each column name to a list
+            of values, rather than yielding rows one at a time
+        max_workers : int
+            Number of parts to download and parse at once
+        max_pending : int or None
+            Number of parsed batches that may wait to be consumed;
+            defaults to twice *max_workers*
+        cursor_max_rows : int
+            Largest table to fetch with a query rather than an UNLOAD
+        clean_up : bool
+            Delete the unloaded files once iteration finishes
+        retry_policy : `~shiftmanager.retry.RetryPolicy` or None
+            Policy for retrying the UNLOAD on transient errors;
+            defaults to the instance's *retry_policy*
+        """
+        from shiftmanager import unload
+
+        columns_and_types = self._get_columns_and_types(table, schema,
+                                                        col_str)
+        if col_str == '*':
+            names = [col for col, _ in columns_and_types]
+        else:
+            names = [c.strip().strip('\'"') for c in col_str.split(',')]
+        types = dict(columns_and_types)
+        converters = [unload.column_converter(types[name])
+                      if name in types else None for name in names]
+
+        select = "SELECT {col_str} FROM {schema}.{table} {where}".format(
+            col_str=col_str, schema=schema, table=table,
+            where=where or '').strip()
+        stats = self._fetchall(queries.table_stats,
+                               {'schema': schema, 'table': table})
+        if stats:
+            rows = stats[0][1]
+        elif self._is_view(table, schema):
+            rows = unload.explained_rows(self._fetchall("EXPLAIN " + select))
+            rows = cursor_max_rows + 1 if rows is None else rows
+        else:
+            # svv_table_info leaves out empty tables
+            rows = 0
+        if rows <= cursor_max_rows:
+            batches = [self._fetchall(select)]
+        else:
+            if bucket is None:
+                raise ValueError("%s.%s has too many rows to fetch with a "
+                                 "query; pass a bucket to unload it to"
+                                 % (schema, table))
+            batches = self._unloaded_batches(
+                table, bucket, keypath or '', schema, col_str, where,
+                batch_size, max_workers, max_pending, converters,
+                clean_up, retry_policy)
+
+        for batch in batches:
+            if columnar:
+                for start in range(0, len(batch), batch_size):
+                    chunk = batch[start:start + batch_size]
+                    yield dict(zip(names, [list(values)
+                                           for values in zip(*chunk)]))
+            else:
+                for row in batch:
+                    yield tuple(row)
+
+    def _unloaded_batches(self, table, bucket, keypath, schema, col_str,
+                          where, batch_size, max_workers, max_pending,
+                          converters, clean_up, retry_policy):
+        from shiftmanager import unload
+
+        bukkit, keys, parts = self._unload_csv(
+            table, bucket, keypath, schema, col_str, where, retry_policy)
+        try:
+            for batch in unload.read_parts(
+                    lambda part: self._s3_chunks(bukkit, part[1]), parts,
+                    max_workers, batch_size, max_pending, converters):
+                yield batch
+        finally:
+            if clean_up:
+                bukkit.delete_keys(keys)
+
+    def _unload_csv(self, table, bucket, keypath, schema, col_str, where,
+                    retry_policy):
+        """UNLOAD *table* as gzipped CSV with
+        `~shiftmanager.unload.NULL_MARKER` for NULLs, returning the bucket,
+        every key written, and the (bucket, key) of each part."""
+        from shiftmanager import unload
+
+        options = "MANIFEST GZIP ALLOWOVERWRITE NULL AS '%s'" % \
+            unload.NULL_MARKER
+        self.unload_table_to_s3(bucket, keypath, table, schema=schema,
+                                col_str=col_str, where=where,
+                                options=options, retry_policy=retry_policy,
+                                file_format='csv')
+        bukkit = self.get_bucket(bucket)
+        manifest_key = os.path.join(keypath, table + '/') + 'manifest'
+        manifest = bukkit.get_key(manifest_key)
+        parts = unload.manifest_urls(manifest.get_contents_as_string())
+        return bukkit, [key for _, key in parts] + [manifest_key], parts
+
+    def _s3_chunks(self, bukkit, key_name, chunk_size=1024 * 1024):
+        key = bukkit.get_key(key_name)
+        try:
+            while True:
+                chunk = key.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+        finally:
+            key.close()
+
+    def _is_view(self, table, schema='public'):
+        relation = self.catalog.relation(table, schema)
+        return relation is not None and relation.kind == 'v'
 
     def _get_columns_and_types(self, table, schema='public', col_str='*'):
-        query = """
-        SELECT "column", "type"
-        FROM pg_table_def
-        WHERE tablename = '{table}'
-        AND schemaname = '{schema}'
-        """.format(table=table, schema=schema)
+        relation = self.catalog.relation(table, schema)
+        if relation is None:
+            return []
+        columns_and_types = list(zip(relation.columns, relation.types))
         if col_str != '*':
-            query += """AND "column" IN ({columns})""".format(columns=col_str)
-        with self.connection as conn:
-            with conn.cursor() as cur:
-                cur.execute(query)
-                return cur.fetchall()
+            wanted = set(c.strip().strip('\'"') for c in col_str.split(','))
+            columns_and_types = [(col, col_type)
+                                 for col, col_type in columns_and_types
+                                 if col in wanted]
+        return columns_and_types
 
     def _json_col_str(self, columns_and_types):
         cases = [self._case_statement(col, col_type)
@@ -556,12 +901,6 @@ class S3Mixin(object):
                    for no_quote_type in no_quote_types)
 
     def _diststyle(self, table, schema='public'):
-        query = """
-        SELECT diststyle
-        FROM svv_table_info
-        WHERE "table" = '{table}'
-        AND "schema" = '{schema}'
-        """
-        with self.connection as conn, conn.cursor() as cur:
-            cur.execute(query.format(table=table, schema=schema))
-            return cur.fetchone()[0]
+        relation = self.catalog.relation(table, schema)
+        if relation is not None:
+            return relation.diststyle
@@ -17,6 +17,7 @@ The entries shown by \z are interpreted thus ::
                   w -- UPDATE ("write")
                   a -- INSERT ("append")
                   d -- DELETE
+                  D -- TRUNCATE (Postgres)
                   R -- RULE
                   x -- REFERENCES
                   t -- TRIGGER
@@ -33,12 +34,15 @@ The entries shown by \z are interpreted thus ::
 
 import re
 
+from shiftmanager.rendering import quote_identifier
+
 
 RELACL_CHARS_TO_WORDS = {
     'r': 'SELECT',
     'w': 'UPDATE',
     'a': 'INSERT',
     'd': 'DELETE',
+    'D': 'TRUNCATE',
     'R': 'RULE',
     'x': 'REFERENCES',
     't': 'TRIGGER',
@@ -48,7 +52,7 @@ RELACL_CHARS_TO_WORDS = {
     'T': 'TEMPORARY',
 }
 
-WITH_GRANT_OPTION_RE = re.compile(r'[arwdRxtXUCT]\*')
+WITH_GRANT_OPTION_RE = re.compile(r'[arwdDRxtXUCT]\*')
 
 
 def grants_from_privileges(privileges, relation):
@@ -122,3 +126,285 @@ def words_from_relacl_chars(chars):
         word = RELACL_CHARS_TO_WORDS[char]
         words.append(word)
     return (words, words_with_grant_option)
+
+
+# Reconciling privileges with a policy
+#
+# Each grantee's privileges on a relation are held as one int, with a bit
+# per relacl character and the same bits shifted left by GRANT_OPTION_SHIFT
+# for privileges held WITH GRANT OPTION, so comparing a relation's ACL with
+# its policy is a handful of bitwise operations per grantee.
+
+RELACL_CHARS = 'arwdDRxtXUCT'
+PRIVILEGE_BITS = dict((char, 1 << i) for i, char in enumerate(RELACL_CHARS))
+GRANT_OPTION_SHIFT = 16
+PRIVILEGE_MASK = (1 << GRANT_OPTION_SHIFT) - 1
+
+WORDS_TO_RELACL_CHARS = dict((word, char) for char, word
+                             in RELACL_CHARS_TO_WORDS.items())
+
+# Relation kinds that GRANT ... ON ALL TABLES IN SCHEMA applies to
+TABLE_KINDS = ('r', 'v')
+
+
+def mask_from_chars(chars):
+    """
+    Return the privilege bitmask of relacl characters like 'ar*w'.
+
+    >>> mask_from_chars('r') == PRIVILEGE_BITS['r']
+    True
+    >>> chars_from_mask(mask_from_chars('ar*w'))
+    'ar*w'
+    """
+    mask = 0
+    bit = 0
+    for char in chars:
+        if char == '*':
+            mask |= bit << GRANT_OPTION_SHIFT
+        else:
+            bit = PRIVILEGE_BITS[char]
+            mask |= bit
+    return mask
+
+
+def chars_from_mask(mask):
+    """
+    Return the relacl characters of a privilege bitmask.
+
+    >>> chars_from_mask(mask_from_chars('rwa*'))
+    'a*rw'
+    """
+    chars = ''
+    for char in RELACL_CHARS:
+        bit = PRIVILEGE_BITS[char]
+        if mask & bit:
+            chars += char
+            if mask & (bit << GRANT_OPTION_SHIFT):
+                chars += '*'
+    return chars
+
+
+def mask_from_policy(value):
+    """
+    Return the privilege bitmask of a policy entry, given as relacl
+    characters, a list of privilege words, or a bitmask.
+
+    >>> chars_from_mask(mask_from_policy(['SELECT', 'INSERT']))
+    'ar'
+    >>> chars_from_mask(mask_from_policy(['ALL']))
+    'arwdRxt'
+    """
+    if isinstance(value, int):
+        return value
+    if hasattr(value, 'upper'):
+        return mask_from_chars(value)
+    chars = ''
+    for word in value:
+        word = word.upper()
+        chars += ('arwdRxt' if word in ('ALL', 'ALL PRIVILEGES')
+                  else WORDS_TO_RELACL_CHARS[word])
+    return mask_from_chars(chars)
+
+
+def words_from_mask(mask):
+    """
+    Return the privilege words for the privileges in *mask*,
+    ignoring grant options.
+
+    >>> words_from_mask(mask_from_chars('rwa'))
+    ['INSERT', 'SELECT', 'UPDATE']
+    >>> words_from_mask(mask_from_chars('arwdRxt'))
+    ['ALL']
+    """
+    mask &= PRIVILEGE_MASK
+    if mask == mask_from_chars('arwdRxt'):
+        return ['ALL']
+    return [RELACL_CHARS_TO_WORDS[char] for char in RELACL_CHARS
+            if mask & PRIVILEGE_BITS[char]]
+
+
+def grantee_name(grantee):
+    """
+    Return a relacl grantee as it's written in GRANT statements.
+
+    >>> grantee_name(''), grantee_name('group finance'), grantee_name('ann')
+    ('PUBLIC', 'GROUP finance', 'ann')
+    """
+    if not grantee:
+        return 'PUBLIC'
+    if grantee.startswith('group '):
+        return 'GROUP ' + _unquote(grantee[len('group '):])
+    return _unquote(grantee)
+
+
+def _unquote(name):
+    """
+    Return a name as written in an ACL without its double quotes.
+
+    >>> print(_unquote('"Ann ""A"" Lee"'))
+    Ann "A" Lee
+    """
+    if len(name) > 1 and name.startswith('"') and name.endswith('"'):
+        return name[1:-1].replace('""', '"')
+    return name
+
+
+def quote_grantee(grantee):
+    """
+    Return a grantee as it's written in SQL, quoting user and group names
+    that need it.
+
+    >>> print(quote_grantee('PUBLIC'))
+    PUBLIC
+    >>> print(quote_grantee('GROUP Analysts'))
+    GROUP "Analysts"
+    >>> print(quote_grantee('ann'))
+    ann
+    """
+    if grantee == 'PUBLIC':
+        return grantee
+    if grantee.startswith('GROUP '):
+        return 'GROUP ' + quote_identifier(grantee[len('GROUP '):])
+    return quote_identifier(grantee)
+
+
+def acl_masks(privileges):
+    """
+    Return a dict mapping each grantee in an ACL to its privilege bitmask.
+
+    >>> masks = acl_masks('=r/ops\\ngroup finance=r*w/ops')
+    >>> sorted((grantee, chars_from_mask(mask))
+    ...        for grantee, mask in masks.items())
+    [('GROUP finance', 'r*w'), ('PUBLIC', 'r')]
+    """
+    masks = {}
+    if privileges:
+        for entry in privileges.split('\n'):
+            grantee, _, rest = entry.partition('=')
+            chars = rest.partition('/')[0]
+            grantee = grantee_name(grantee)
+            masks[grantee] = masks.get(grantee, 0) | mask_from_chars(chars)
+    return masks
+
+
+def _privilege_deltas(have, want):
+    have_option = have >> GRANT_OPTION_SHIFT
+    want_option = want >> GRANT_OPTION_SHIFT
+    have &= PRIVILEGE_MASK
+    want &= PRIVILEGE_MASK
+    return {
+        'revoke': have & ~want,
+        'revoke_option': have_option & ~want_option & want,
+        'grant': want & ~have & ~want_option,
+        'grant_option': want_option & ~have_option,
+    }
+
+
+_STATEMENTS = [
+    ('revoke', "REVOKE {words} ON {target} FROM {grantee}"),
+    ('revoke_option',
+     "REVOKE GRANT OPTION FOR {words} ON {target} FROM {grantee}"),
+    ('grant', "GRANT {words} ON {target} TO {grantee}"),
+    ('grant_option', "GRANT {words} ON {target} TO {grantee} "
+                     "WITH GRANT OPTION"),
+]
+
+
+def privilege_changes(relations, policy, ignore=()):
+    """
+    Return the GRANT and REVOKE statements that bring the privileges on
+    *relations* in line with *policy*.
+
+    Only relations the policy covers are changed, and only the privileges
+    that differ are granted or revoked. Where every table and view in a
+    schema needs the same change for a grantee, one statement
+    ``ON ALL TABLES IN SCHEMA`` replaces the per-relation ones, so
+    *relations* should hold every relation of the schemas involved.
+    Owners' privileges are left alone.
+
+    Parameters
+    ----------
+    relations : dict
+        Maps (schema, name) to `~shiftmanager.catalog.RelationPrivileges`
+    policy : dict
+        Maps (schema, name) to dicts mapping grantees ('PUBLIC', a user
+        name, or 'GROUP name') to the privileges they should have, as
+        relacl characters like 'r*w', lists of words like ['SELECT'],
+        or bitmasks. A name of '*' applies to every relation in the
+        schema; grantees for a named relation override it. Grantees
+        missing from a covered relation's policy lose their privileges.
+        Only users can hold grant options; giving one to a group or
+        PUBLIC raises ValueError.
+    ignore : iterable of str
+        Grantees whose privileges are never changed
+
+    >>> from shiftmanager.catalog import RelationPrivileges
+    >>> relations = {
+    ...     ('sales', 'orders'): RelationPrivileges(
+    ...         'r', 'ops', 'ops=arwdRxt/ops\\nann=rw/ops', 'table'),
+    ...     ('sales', 'returns'): RelationPrivileges(
+    ...         'r', 'ops', 'ops=arwdRxt/ops', 'table')}
+    >>> for s in privilege_changes(relations, {
+    ...         ('sales', '*'): {'GROUP analysts': 'r'},
+    ...         ('sales', 'orders'): {'GROUP analysts': 'r', 'ann': 'r'}}):
+    ...     print(s)
+    REVOKE UPDATE ON sales.orders FROM ann
+    GRANT SELECT ON ALL TABLES IN SCHEMA sales TO GROUP analysts
+    """
+    ignore = set(ignore)
+    for schema, name in policy:
+        if name != '*' and (schema, name) not in relations:
+            raise KeyError("No privileges found for %s.%s" % (schema, name))
+
+    # deltas[(kind, schema, grantee)][name] = bits
+    deltas = {}
+    tables_by_schema = {}
+    for (schema, name), info in relations.items():
+        if info.kind in TABLE_KINDS:
+            tables_by_schema.setdefault(schema, set()).add(name)
+        if (schema, '*') not in policy and (schema, name) not in policy:
+            continue
+        wanted = {}
+        for key in [(schema, '*'), (schema, name)]:
+            for grantee, value in policy.get(key, {}).items():
+                wanted[grantee] = mask_from_policy(value)
+                if wanted[grantee] >> GRANT_OPTION_SHIFT and (
+                        grantee == 'PUBLIC' or grantee.startswith('GROUP ')):
+                    raise ValueError("Privileges can't be granted to %s "
+                                     "WITH GRANT OPTION" % grantee)
+        current = acl_masks(info.privileges)
+        skip = ignore | set([info.owner_name])
+        for grantee in set(wanted) | set(current):
+            if grantee in skip:
+                continue
+            changes = _privilege_deltas(current.get(grantee, 0),
+                                        wanted.get(grantee, 0))
+            for kind, bits in changes.items():
+                if bits:
+                    deltas.setdefault((kind, schema, grantee), {})[name] = bits
+
+    statements = []
+    for kind, template in _STATEMENTS:
+        keys = sorted(key for key in deltas if key[0] == kind)
+        for _, schema, grantee in keys:
+            by_name = deltas[(kind, schema, grantee)]
+            quoted_schema = quote_identifier(schema)
+            quoted_grantee = quote_grantee(grantee)
+            tables = tables_by_schema.get(schema, ())
+            common = PRIVILEGE_MASK if len(tables) > 1 else 0
+            for name in tables:
+                common &= by_name.get(name, 0)
+            if common:
+                statements.append(template.format(
+                    words=', '.join(words_from_mask(common)),
+                    target='ALL TABLES IN SCHEMA %s' % quoted_schema,
+                    grantee=quoted_grantee))
+            for name in sorted(by_name):
+                bits = by_name[name] & ~common
+                if bits:
+                    statements.append(template.format(
+                        words=', '.join(words_from_mask(bits)),
+                        target='%s.%s' % (quoted_schema,
+                                          quote_identifier(name)),
+                        grantee=quoted_grantee))
+    return statements
@@ -11,21 +11,295 @@ MANIFEST GZIP TIMEFORMAT 'auto'
 """
 
 all_privileges = """\
-SET search_path={search_path};
 SELECT
-  c.relkind,
-  n.oid as "schema_oid",
-  n.nspname as "schema",
-  c.oid as "rel_oid",
+  n.nspname AS "schema",
   c.relname,
-  c.relowner AS "owner_id",
+  c.relkind,
   u.usename AS "owner_name",
   pg_catalog.array_to_string(c.relacl, '\n') AS "privileges",
   CASE c.relkind WHEN 'r' THEN 'table' WHEN 'v' THEN 'view' END AS "type"
 FROM pg_catalog.pg_class c
-     LEFT JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+     JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
      JOIN pg_catalog.pg_user u ON u.usesysid = c.relowner
 WHERE c.relkind IN ('r', 'v', 'm', 'S', 'f')
-  AND n.nspname !~ '^pg_' AND pg_catalog.pg_table_is_visible(c.oid)
-ORDER BY c.relkind, n.oid, n.nspname;
+  AND n.nspname IN %(schemas)s;
+"""
+
+table_exists = """\
+SELECT COUNT(*)
+FROM pg_catalog.pg_class c
+     JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+WHERE c.relkind = 'r'
+  AND c.relname = %(table)s
+  AND CASE WHEN %(schema)s IS NULL
+           THEN pg_catalog.pg_table_is_visible(c.oid)
+           ELSE n.nspname = %(schema)s END;
+"""
+
+catalog_relations = """\
+SELECT
+  n.nspname AS "schema",
+  c.relname AS "relation",
+  c.relkind,
+  c.reldiststyle
+FROM pg_catalog.pg_class c
+     JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+WHERE c.relkind IN ('r', 'v')
+  AND n.nspname IN %(schemas)s;
+"""
+
+catalog_table_info = """\
+SELECT "schema", "table", diststyle, size, tbl_rows
+FROM svv_table_info
+WHERE "schema" IN %(schemas)s;
+"""
+
+catalog_columns = """\
+SELECT
+  n.nspname AS "schema",
+  c.relname AS "relation",
+  a.attname AS "column",
+  pg_catalog.format_type(a.atttypid, a.atttypmod) AS "type",
+  COALESCE(d.adsrc LIKE '%%identity%%', false) AS "is_identity"
+FROM pg_catalog.pg_attribute a
+     JOIN pg_catalog.pg_class c ON c.oid = a.attrelid
+     JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+     LEFT JOIN pg_catalog.pg_attrdef d
+       ON d.adrelid = a.attrelid AND d.adnum = a.attnum
+WHERE a.attnum > 0 AND NOT a.attisdropped
+  AND c.relkind IN ('r', 'v')
+  AND n.nspname IN %(schemas)s
+ORDER BY n.nspname, c.relname, a.attnum;
+"""
+
+# One row per column and one per constraint, so that changing a column's
+# encoding or dist/sort key, or adding or dropping a constraint,
+# changes the fingerprint as well as structural changes do.
+schema_fingerprint = """\
+SELECT
+  c.relname,
+  c.oid,
+  c.relkind,
+  c.reldiststyle,
+  a.attnum,
+  a.attname,
+  a.atttypid,
+  a.atttypmod,
+  a.attnotnull,
+  a.attsortkeyord,
+  a.attisdistkey,
+  a.attencodingtype,
+  NULL AS "conname",
+  NULL AS "contype",
+  NULL AS "conkey"
+FROM pg_catalog.pg_class c
+     JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+     LEFT JOIN pg_catalog.pg_attribute a
+       ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+WHERE c.relkind IN ('r', 'v')
+  AND n.nspname = %(schema)s
+UNION ALL
+SELECT
+  c.relname,
+  c.oid,
+  c.relkind,
+  c.reldiststyle,
+  NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL,
+  t.conname,
+  t.contype,
+  pg_catalog.array_to_string(t.conkey, ',') || ' -> ' ||
+    COALESCE(t.confrelid::text || ':' ||
+             pg_catalog.array_to_string(t.confkey, ','), '')
+FROM pg_catalog.pg_constraint t
+     JOIN pg_catalog.pg_class c ON c.oid = t.conrelid
+     JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+WHERE n.nspname = %(schema)s
+ORDER BY 1, 5, 13;
+"""
+
+bulk_relations = """\
+SELECT
+  c.relname,
+  c.relkind,
+  CASE c.reldiststyle
+    WHEN 0 THEN 'EVEN' WHEN 1 THEN 'KEY' WHEN 8 THEN 'ALL' END
+    AS "diststyle"
+FROM pg_catalog.pg_class c
+     JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+WHERE c.relkind IN ('r', 'v')
+  AND n.nspname = %(schema)s
+ORDER BY c.relname;
+"""
+
+# pg_table_def only shows schemas on the search_path,
+# so we set it for the duration of the transaction.
+bulk_columns = """\
+SET LOCAL search_path TO {search_path};
+SELECT
+  c.relname,
+  d."column" AS "name",
+  d.encoding AS "encode",
+  d.distkey,
+  d.sortkey,
+  d."notnull",
+  pg_catalog.format_type(a.atttypid, a.atttypmod) AS "format_type",
+  pg_catalog.pg_get_expr(ad.adbin, ad.adrelid) AS "default"
+FROM pg_catalog.pg_class c
+     JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+     JOIN pg_catalog.pg_table_def d
+       ON (d.schemaname, d.tablename) = (n.nspname, c.relname)
+     JOIN pg_catalog.pg_attribute a
+       ON (a.attrelid, a.attname) = (c.oid, d."column")
+     LEFT JOIN pg_catalog.pg_attrdef ad
+       ON (a.attrelid, a.attnum) = (ad.adrelid, ad.adnum)
+WHERE n.nspname = %(schema)s
+ORDER BY c.relname, a.attnum;
+"""
+
+bulk_constraints = """\
+SELECT
+  c.relname,
+  t.contype,
+  t.conname,
+  pg_catalog.pg_get_constraintdef(t.oid, true) AS "condef"
+FROM pg_catalog.pg_constraint t
+     JOIN pg_catalog.pg_class c ON c.oid = t.conrelid
+     JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+WHERE n.nspname = %(schema)s
+  AND t.contype IN ('p', 'u', 'f')
+ORDER BY c.relname, t.conname;
+"""
+
+table_health = """\
+SELECT "schema", "table", size, tbl_rows, unsorted, stats_off, sortkey1
+FROM svv_table_info
+WHERE "schema" IN %(schemas)s;
+"""
+
+table_size = """\
+SELECT size
+FROM svv_table_info
+WHERE "schema" = %(schema)s AND "table" = %(table)s;
+"""
+
+# Each disk appears once per mirror, so only count the primary partitions
+disk_space = """\
+SELECT SUM(capacity) AS "capacity", SUM(used) AS "used"
+FROM stv_partitions
+WHERE part_begin = 0;
+"""
+
+# Views depend on the relations their rewrite rules reference
+view_dependencies = """\
+SELECT DISTINCT
+  vn.nspname AS "view_schema",
+  v.relname AS "view",
+  tn.nspname AS "referenced_schema",
+  t.relname AS "referenced"
+FROM pg_catalog.pg_depend d
+     JOIN pg_catalog.pg_rewrite r ON r.oid = d.objid
+     JOIN pg_catalog.pg_class v ON v.oid = r.ev_class
+     JOIN pg_catalog.pg_namespace vn ON vn.oid = v.relnamespace
+     JOIN pg_catalog.pg_class t ON t.oid = d.refobjid
+     JOIN pg_catalog.pg_namespace tn ON tn.oid = t.relnamespace
+WHERE v.relkind = 'v'
+  AND t.oid <> v.oid
+  AND vn.nspname IN %(schemas)s;
+"""
+
+table_stats = """\
+SELECT size, tbl_rows, sortkey1
+FROM svv_table_info
+WHERE "schema" = %(schema)s AND "table" = %(table)s;
+"""
+
+# Rows written per millisecond by recent INSERT ... SELECT statements,
+# a rough guide to how long a deep copy will take
+insert_throughput = """\
+SELECT SUM(i.rows), SUM(DATEDIFF(ms, q.starttime, q.endtime))
+FROM stl_query q
+     JOIN (SELECT query, SUM(rows) AS "rows"
+           FROM stl_insert GROUP BY query) i ON i.query = q.query
+WHERE q.aborted = 0
+  AND q.starttime > DATEADD(day, -%(days)s, GETDATE())
+  AND q.querytxt ILIKE 'INSERT INTO%%SELECT%%';
+"""
+
+table_keys = """\
+SELECT "table", diststyle, sortkey1, tbl_rows
+FROM svv_table_info
+WHERE "schema" = %(schema)s;
+"""
+
+slice_count = """\
+SELECT COUNT(*) FROM stv_slices;
+"""
+
+# Every step of the plans of recent queries with a join that redistributed
+# or broadcast rows, so each join's inputs can be traced to the tables
+# scanned beneath it
+redistributed_join_plans = """\
+SELECT e.query, e.nodeid, e.parentid, e.plannode, e.info
+FROM stl_explain e
+     JOIN stl_query q ON q.query = e.query
+WHERE q.userid > 1
+  AND q.starttime > DATEADD(day, -%(days)s, GETDATE())
+  AND e.query IN (
+    SELECT query FROM stl_explain
+    WHERE plannode LIKE '%%DS_BCAST_INNER%%'
+       OR plannode LIKE '%%DS_DIST_INNER%%'
+       OR plannode LIKE '%%DS_DIST_OUTER%%'
+       OR plannode LIKE '%%DS_DIST_BOTH%%'
+       OR plannode LIKE '%%DS_DIST_ALL_INNER%%');
+"""
+
+# Time and bytes spent redistributing or broadcasting, per query
+redistribution_cost = """\
+SELECT s.query, SUM(s.bytes), SUM(s.maxtime)
+FROM svl_query_summary s
+     JOIN stl_query q ON q.query = s.query
+WHERE q.userid > 1
+  AND q.starttime > DATEADD(day, -%(days)s, GETDATE())
+  AND (s.label LIKE 'dist%%' OR s.label LIKE 'bcast%%')
+GROUP BY s.query;
+"""
+
+# Filters applied while scanning tables
+scan_filters = """\
+SELECT e.query, e.plannode, e.info
+FROM stl_explain e
+     JOIN stl_query q ON q.query = e.query
+WHERE q.userid > 1
+  AND q.starttime > DATEADD(day, -%(days)s, GETDATE())
+  AND e.plannode LIKE '%%Seq Scan on %%'
+  AND e.info LIKE 'Filter:%%';
+"""
+
+column_profile = """\
+SELECT
+  APPROXIMATE COUNT(DISTINCT {column}),
+  COUNT(*),
+  (SELECT MAX(n) FROM (SELECT COUNT(*) AS n FROM {table} GROUP BY {column}))
+FROM {table};
+"""
+
+# Owner and grants of a Postgres table, for carrying over to its replacement
+pg_table_privileges = """\
+SELECT pg_catalog.pg_get_userbyid(c.relowner),
+       pg_catalog.array_to_string(c.relacl, '\n')
+FROM pg_catalog.pg_class c
+WHERE c.oid = %(table)s::regclass;
+"""
+
+# Every user with their settings, for reconciling against a spec
+users = """\
+SELECT usename, usesysid, usecreatedb, usesuper,
+       CAST(valuntil AS VARCHAR), useconfig
+FROM pg_catalog.pg_user;
+"""
+
+# Every group with the usesysids of its members
+groups = """\
+SELECT groname, grolist
+FROM pg_catalog.pg_group;
 """
@@ -6,13 +6,19 @@ and utility functions for managing that database.
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
+from contextlib import contextmanager
 import os
 
 import psycopg2
 
+from shiftmanager import queries
+from shiftmanager.access import AccessIndex
+from shiftmanager.catalog import CatalogSnapshot, PrivilegeCache
 from shiftmanager.mixins import (AdminMixin, ReflectionMixin, PostgresMixin,
                                  S3Mixin)
 from shiftmanager.memoized_property import memoized_property
+from shiftmanager.rendering import render
+from shiftmanager.retry import writes_rows
 
 
 class Redshift(AdminMixin, ReflectionMixin, PostgresMixin, S3Mixin):
@@ -42,6 +48,13 @@ class Redshift(AdminMixin, ReflectionMixin, PostgresMixin, S3Mixin):
         envvar equivalent: AWS_SECRET_ACCESS_KEY
     security_token : str
         envvar equivalent: AWS_SECURITY_TOKEN or AWS_SESSION_TOKEN
+    catalog_ttl : int or float
+        Seconds to cache catalog lookups in `catalog` and `privileges`;
+        None never expires
+    retry_policy : `~shiftmanager.retry.RetryPolicy` or None
+        Default policy for retrying transactions that fail with
+        serializable isolation violations or lost connections;
+        None (the default) never retries
     kwargs : dict
         Additional keyword arguments sent to psycopg2.connect
     """
@@ -60,11 +73,44 @@ class Redshift(AdminMixin, ReflectionMixin, PostgresMixin, S3Mixin):
                                 password=self.password,
                                 **self.pgkwargs)
 
+    @memoized_property
+    def catalog(self):
+        """A `~shiftmanager.catalog.CatalogSnapshot` used to answer
+        column, identity and diststyle lookups.
+
+        Call ``catalog.load(schemas)`` to warm several schemas at once
+        and ``catalog.invalidate()`` after changing table structure.
+        """
+        return CatalogSnapshot(self._fetchall, ttl=self.catalog_ttl,
+                               on_invalidate=self._forget_bulk_reflected)
+
+    @memoized_property
+    def privileges(self):
+        """A `~shiftmanager.catalog.PrivilegeCache` of relation ownership
+        and grants, used when reproducing them in table and view definitions.
+
+        Call ``privileges.load(schemas)`` to warm several schemas at once
+        and ``privileges.invalidate()`` after changing grants.
+        """
+        return PrivilegeCache(self._fetchall, ttl=self.catalog_ttl)
+
+    @memoized_property
+    def access(self):
+        """An `~shiftmanager.access.AccessIndex` answering which users can
+        access which relations, through groups and PUBLIC included.
+
+        Call ``access.load(schemas)`` to index schemas and
+        ``access.refresh()`` to pick up changed grants and memberships.
+        """
+        return AccessIndex(self._fetchall)
+
     def __init__(self, database=None, user=None, password=None, host=None,
                  port=5439,
                  aws_access_key_id=None,
                  aws_secret_access_key=None,
                  security_token=None,
+                 catalog_ttl=300,
+                 retry_policy=None,
                  **kwargs):
 
         self.set_aws_credentials(aws_access_key_id, aws_secret_access_key,
@@ -76,16 +122,37 @@ class Redshift(AdminMixin, ReflectionMixin, PostgresMixin, S3Mixin):
         self.database = database or os.environ.get('PGDATABASE')
         self.password = password or os.environ.get('PGPASSWORD')
         self.pgkwargs = kwargs
+        self.catalog_ttl = catalog_ttl
+        self.retry_policy = retry_policy
 
-        self._all_privileges = None
+        self._bulk_reflected = set()
+        self._session = None
 
         S3Mixin.__init__(self)
 
-    def execute(self, batch, parameters=None):
+    def clone(self):
+        """
+        Return a new `Redshift` instance with the same settings and
+        credentials but its own connection, for use from another thread.
+        """
+        other = type(self)(database=self.database, user=self.user,
+                           password=self.password, host=self.host,
+                           port=self.port,
+                           aws_access_key_id=self.aws_access_key_id,
+                           aws_secret_access_key=self.aws_secret_access_key,
+                           security_token=self.security_token,
+                           catalog_ttl=self.catalog_ttl,
+                           retry_policy=self.retry_policy,
+                           **self.pgkwargs)
+        other.set_aws_role(self.aws_account_id, self.aws_role_name)
+        return other
+
+    def execute(self, batch, parameters=None, retry_policy=None):
         """
         Execute a batch of SQL statements using this instance's connection.
 
-        Statements are executed within a transaction.
+        Statements are executed within a transaction, which is committed
+        immediately unless the call happens inside a `transaction` block.
 
         Parameters
         ----------
@@ -93,38 +160,154 @@ class Redshift(AdminMixin, ReflectionMixin, PostgresMixin, S3Mixin):
             The batch of SQL statements to execute.
         parameters : list or dict
             Values to bind to the batch, passed to `cursor.execute`
+        retry_policy : `~shiftmanager.retry.RetryPolicy` or None
+            Policy for retrying the transaction on transient errors;
+            defaults to the instance's *retry_policy*. Batches that write
+            rows aren't replayed after a lost connection unless the
+            policy has *replay_writes* set.
         """
-        with self.connection as conn:
-            with conn.cursor() as cur:
-                cur.execute(batch, parameters)
+        def run(cur):
+            cur.execute(batch, parameters)
+        self._with_cursor(run, retry_policy, idempotent=not writes_rows(batch))
+
+    @contextmanager
+    def transaction(self):
+        """
+        Context manager grouping every statement executed within it
+        into a single transaction.
+
+        Redshift serializes commits across the whole cluster, so
+        batching many small statements into one commit is much cheaper
+        than committing each. The transaction is committed when the block
+        exits normally and rolled back if it raises. Nested blocks join
+        the outermost transaction. Retries are not attempted inside
+        the block, since earlier statements can't be replayed.
+
+        Example::
+
+            with redshift.transaction():
+                for name in names:
+                    redshift.alter_user(name, createdb=False, execute=True)
+        """
+        if self._session == 'transaction':
+            yield
+            return
+        if self._session is not None:
+            raise ValueError("Cannot start a transaction "
+                             "within an autocommit block")
+        conn = self.connection
+        self._session = 'transaction'
+        try:
+            with conn:
+                yield
+        finally:
+            self._session = None
+
+    @contextmanager
+    def autocommit(self):
+        """
+        Context manager executing every statement within it outside of
+        any transaction.
+
+        Use this for statements such as VACUUM that Redshift refuses to
+        run inside a transaction block::
+
+            with redshift.autocommit():
+                redshift.execute("VACUUM my_table")
+        """
+        if self._session is not None:
+            raise ValueError("Cannot switch to autocommit "
+                             "within a %s block" % self._session)
+        conn = self.connection
+        conn.autocommit = True
+        self._session = 'autocommit'
+        try:
+            yield
+        finally:
+            self._session = None
+            conn.autocommit = False
 
     def mogrify(self, batch, parameters=None, execute=False):
+        """
+        Return *batch* with *parameters* bound, optionally executing it.
+
+        Rendering happens locally, so no connection to Redshift is made
+        unless *execute* is True.
+
+        Parameters
+        ----------
+        batch : str
+            The batch of SQL statements to render.
+        parameters : list or dict
+            Values to bind to the batch, using the same placeholder
+            conventions as `cursor.execute`
+        execute : boolean
+            Execute the batch in addition to returning it.
+        """
         if execute:
             self.execute(batch, parameters)
-        with self.connection as conn:
-            with conn.cursor() as cur:
-                mogrified = cur.mogrify(batch, parameters)
-        return mogrified.decode('utf-8')
+        return render(batch, parameters)
 
-    def table_exists(self, table_name):
+    def table_exists(self, table_name, schema=None):
         """
         Check Redshift for whether a table exists.
 
         Parameters
         ----------
         table_name : str
-            The name of the table for whose existence we're checking
+            The name of the table for whose existence we're checking;
+            may be qualified as 'schema.table'
+        schema : str
+            The schema to look in, if not given as part of *table_name*;
+            defaults to the schemas on the session's search_path
 
         Returns
         -------
         boolean
         """
-        with self.connection as conn:
-            with conn.cursor() as cur:
-                cur.execute("""select count (distinct tablename)
-                               from pg_table_def
-                               where tablename = '{}';""".format(table_name))
+        if schema is None and '.' in table_name:
+            schema, table_name = table_name.split('.', 1)
+        # Always asks the cluster, since callers check for tables they've
+        # just created or dropped, which `catalog` may not have seen yet
+        rows = self._fetchall(queries.table_exists,
+                              {'table': table_name, 'schema': schema})
+        return rows[0][0] > 0
+
+    def _fetchall(self, query, parameters=None):
+        def run(cur):
+            cur.execute(query, parameters)
+            return cur.fetchall()
+        return self._with_cursor(run)
+
+    def _with_cursor(self, func, retry_policy=None, idempotent=True):
+        """Call *func* with a cursor, within the current session if any,
+        or else within a new transaction that is retried per policy."""
+        if self._session is not None:
+            with self.connection.cursor() as cur:
+                return func(cur)
+
+        def attempt():
+            with self.connection as conn:
+                with conn.cursor() as cur:
+                    return func(cur)
+        return self._run_with_retries(attempt, retry_policy, idempotent)
 
-                table_count = cur.fetchone()[0]
+    def _run_with_retries(self, func, retry_policy=None, idempotent=True):
+        policy = retry_policy or self.retry_policy
+        if policy is None:
+            return func()
+        return policy.run(func, on_disconnect=self._discard_connection,
+                          idempotent=idempotent)
 
-        return table_count == 1
+    def _discard_connection(self):
+        """Close the memoized connection so the next use reconnects."""
+        conn = self.__dict__.pop('_connection', None)
+        if conn is not None:
+            try:
+                conn.close()
+            except psycopg2.Error:
+                pass
+        # The engine wraps a single connection, so it must be rebuilt too
+        if self.__dict__.pop('_engine', None) is not None and \
+                '_meta' in self.__dict__:
+            self._meta.bind = self.engine
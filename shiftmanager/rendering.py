@@ -0,0 +1,105 @@
+"""
+Functions for rendering parameterized SQL locally, without a round trip
+to the database.
+
+Parameters are bound using the same placeholder conventions as
+``psycopg2``: ``%s`` for sequences of values and ``%(name)s`` for
+mappings. String literals are quoted the way Redshift expects, doubling
+single quotes and backslashes, since Redshift treats backslash as an
+escape character within string literals.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+import re
+
+import psycopg2.extensions
+
+try:
+    text_type = unicode  # noqa: F821
+except NameError:
+    text_type = str
+
+
+PLAIN_IDENTIFIER_RE = re.compile(r'^[a-z_][a-z0-9_$]*$')
+
+
+def quote_identifier(name):
+    """Return *name* as a Redshift identifier, double-quoted if it's
+    mixed case, a reserved word, or otherwise not a plain identifier.
+
+    >>> print(quote_identifier('analysts'))
+    analysts
+    >>> print(quote_identifier('Analysts'))
+    "Analysts"
+    >>> print(quote_identifier('group'))
+    "group"
+    >>> print(quote_identifier('my"team'))
+    "my""team"
+    """
+    from sqlalchemy_redshift.dialect import RESERVED_WORDS
+
+    if PLAIN_IDENTIFIER_RE.match(name) and name not in RESERVED_WORDS:
+        return name
+    return '"%s"' % name.replace('"', '""')
+
+
+def quote_literal(value):
+    """Return *value* rendered as a Redshift SQL literal.
+
+    >>> print(quote_literal("it's"))
+    'it''s'
+    >>> print(quote_literal('C:\\\\temp'))
+    'C:\\\\temp'
+    >>> print(quote_literal(None))
+    NULL
+    >>> print(quote_literal(True))
+    true
+    >>> print(quote_literal(('a', 1)))
+    ('a', 1)
+    """
+    if isinstance(value, bytes):
+        value = value.decode('utf-8')
+    if isinstance(value, text_type):
+        if '\x00' in value:
+            raise ValueError("A string literal cannot contain "
+                             "NUL (0x00) characters.")
+        return "'%s'" % value.replace('\\', '\\\\').replace("'", "''")
+    if isinstance(value, tuple):
+        return '(%s)' % ', '.join(quote_literal(v) for v in value)
+    if isinstance(value, list):
+        return 'ARRAY[%s]' % ', '.join(quote_literal(v) for v in value)
+    quoted = psycopg2.extensions.adapt(value).getquoted()
+    if isinstance(quoted, bytes):
+        quoted = quoted.decode('utf-8')
+    return quoted
+
+
+def render(batch, parameters=None):
+    """Return *batch* with *parameters* bound as quoted literals.
+
+    When *parameters* is None, *batch* is returned unchanged,
+    matching the behavior of ``cursor.mogrify``.
+
+    >>> print(render("SELECT %s, %s", ['a', None]))
+    SELECT 'a', NULL
+    >>> print(render("ALTER USER chad PASSWORD %(password)s",
+    ...              dict(password="s3cr'et")))
+    ALTER USER chad PASSWORD 's3cr''et'
+    >>> print(render("SELECT 100%"))
+    SELECT 100%
+    """
+    if parameters is None:
+        return batch
+    if isinstance(parameters, Mapping):
+        quoted = dict((key, quote_literal(val))
+                      for key, val in parameters.items())
+    else:
+        quoted = tuple(quote_literal(val) for val in parameters)
+    return batch % quoted
@@ -0,0 +1,172 @@
+"""
+Retrying transactions that fail for transient reasons.
+
+Redshift aborts one of two concurrent transactions that touch the same
+tables with a serializable isolation violation (error 1023), and long
+running loads occasionally lose their connection. An aborted transaction
+is safe to retry since `Redshift.execute` runs each batch in its own
+transaction, which is rolled back when an error occurs. A lost connection
+is not always: the commit may have gone through before the connection
+dropped, so batches that write rows are only replayed on request.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import random
+import re
+import time
+
+import psycopg2
+import psycopg2.extensions
+
+SERIALIZATION = 'serialization'
+DISCONNECT = 'disconnect'
+
+SERIALIZATION_MESSAGE = 'Serializable isolation violation'
+
+# SQLSTATE class 08 is "connection exception"
+CONNECTION_EXCEPTION_CLASS = '08'
+
+# libpq reports most lost connections without a SQLSTATE
+DISCONNECT_RE = re.compile(
+    r'server closed the connection|connection already closed|'
+    r'terminating connection|could not (?:receive|send) data|'
+    r'SSL SYSCALL error|SSL connection has been closed|EOF detected|'
+    r'connection reset|no connection to the server|could not connect',
+    re.I)
+
+WRITE_RE = re.compile(r'\b(?:COPY|INSERT|UPDATE|DELETE)\b', re.I)
+
+
+def classify_error(exc):
+    """
+    Return the reason *exc* is worth retrying,
+    either `SERIALIZATION` or `DISCONNECT`, or None if it is not.
+
+    Only a lost connection counts as `DISCONNECT`: other operational
+    errors, like a full disk or a statement timeout, would fail again.
+
+    >>> print(classify_error(psycopg2.InternalError(
+    ...     'ERROR:  1023\\nDETAIL:  Serializable isolation violation')))
+    serialization
+    >>> print(classify_error(psycopg2.OperationalError(
+    ...     'server closed the connection unexpectedly')))
+    disconnect
+    >>> print(classify_error(psycopg2.OperationalError(
+    ...     'Disk Full\\nDETAIL:  error: Disk Full')))
+    None
+    >>> print(classify_error(psycopg2.ProgrammingError('syntax error')))
+    None
+    """
+    if isinstance(exc, psycopg2.extensions.TransactionRollbackError):
+        return SERIALIZATION
+    if isinstance(exc, psycopg2.extensions.QueryCanceledError):
+        return None
+    if isinstance(exc, (psycopg2.OperationalError, psycopg2.InterfaceError)):
+        pgcode = getattr(exc, 'pgcode', None) or ''
+        cursor = getattr(exc, 'cursor', None)
+        closed = cursor is not None and bool(cursor.connection.closed)
+        if pgcode.startswith(CONNECTION_EXCEPTION_CLASS) or closed or \
+                DISCONNECT_RE.search(str(exc)):
+            return DISCONNECT
+        return None
+    if isinstance(exc, psycopg2.Error) and SERIALIZATION_MESSAGE in str(exc):
+        return SERIALIZATION
+    return None
+
+
+def writes_rows(batch):
+    """
+    Return whether *batch* may add, change or remove rows, so that
+    replaying it after a commit already went through would repeat that.
+
+    >>> writes_rows("COPY events FROM 's3://bucket/events'")
+    True
+    >>> writes_rows("SELECT COUNT(*) FROM events")
+    False
+    """
+    return bool(WRITE_RE.search(batch))
+
+
+class RetryPolicy(object):
+    """
+    Describes how many times, and how patiently, to retry a transaction.
+
+    Delays grow exponentially from *base_delay* up to *max_delay* seconds
+    and are drawn uniformly from zero up to that bound ("full jitter"),
+    so that concurrent jobs that conflicted once don't conflict again.
+
+    Parameters
+    ----------
+    max_attempts : int
+        Total number of attempts, including the first
+    base_delay : float
+        Upper bound in seconds on the delay before the first retry
+    max_delay : float
+        Upper bound in seconds on any single delay
+    retry_serialization : bool
+        Retry serializable isolation violations
+    retry_disconnects : bool
+        Reconnect and retry after the connection is lost
+    replay_writes : bool
+        Also retry batches that write rows after the connection is lost,
+        which repeats the writes if the lost transaction had committed
+    """
+
+    def __init__(self, max_attempts=5, base_delay=1.0, max_delay=60.0,
+                 retry_serialization=True, retry_disconnects=True,
+                 replay_writes=False):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_serialization = retry_serialization
+        self.retry_disconnects = retry_disconnects
+        self.replay_writes = replay_writes
+
+    def retry_reason(self, exc, idempotent=True):
+        """Return the reason to retry after *exc*, or None to give up."""
+        reason = classify_error(exc)
+        if reason == SERIALIZATION and self.retry_serialization:
+            return reason
+        if reason == DISCONNECT and self.retry_disconnects and \
+                (idempotent or self.replay_writes):
+            return reason
+        return None
+
+    def delay(self, attempt):
+        """Return the number of seconds to wait after failed *attempt*."""
+        bound = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return random.uniform(0, bound)
+
+    def run(self, func, on_disconnect=None, idempotent=True):
+        """
+        Call *func* until it succeeds, raising once *max_attempts*
+        is reached or a non-retryable error occurs.
+
+        Parameters
+        ----------
+        func : callable
+            Function taking no arguments that runs one attempt
+        on_disconnect : callable
+            Called with no arguments before retrying a lost connection
+        idempotent : bool
+            Whether *func* can safely run again after a lost connection;
+            if not, it is only retried with *replay_writes*
+        """
+        attempt = 1
+        while True:
+            try:
+                return func()
+            except psycopg2.Error as e:
+                reason = self.retry_reason(e, idempotent)
+                if reason is None or attempt >= self.max_attempts:
+                    raise
+                if reason == DISCONNECT and on_disconnect is not None:
+                    on_disconnect()
+                delay = self.delay(attempt)
+                print("Retrying after %s error (attempt %d of %d) "
+                      "in %.1f seconds..." %
+                      (reason, attempt + 1, self.max_attempts, delay))
+                time.sleep(delay)
+                attempt += 1
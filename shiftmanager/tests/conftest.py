@@ -5,13 +5,11 @@ Test fixture definitions.
 These fixtures are automatically imported for test files in this directory.
 """
 
-import collections
 import random
 import uuid
 
 from mock import MagicMock, PropertyMock
 import pytest
-import psycopg2
 
 
 @pytest.fixture
@@ -37,6 +35,9 @@ def mock_connection():
                 self.cursor_position += 1
                 return next_row
 
+        def fetchall(self, *args, **kwargs):
+            return list(self.return_rows)
+
         def __enter__(self, *args, **kwargs):
             return self
 
@@ -92,26 +93,111 @@ def json_data():
     return data
 
 
-def mogrify(self, batch, parameters=None, execute=False):
-    if isinstance(parameters, collections.Mapping):
-        parameters = dict([
-            (key, psycopg2.extensions.adapt(val).getquoted().decode('utf-8'))
-            for key, val in parameters.items()])
-    elif isinstance(parameters, collections.Sequence):
-        parameters = [
-            psycopg2.extensions.adapt(val).getquoted()
-            for val in parameters]
-    if parameters:
-        return batch % parameters
-    return batch
+class FakeConnection(object):
+    """A psycopg2 connection stand-in recording statements and commits.
+
+    *results* maps a substring of a query to the rows it returns;
+    *error* is raised by every statement if set.
+    """
+
+    def __init__(self, results=None, error=None):
+        self.results = results or {}
+        self.error = error
+        self.closed = False
+        self.autocommit = False
+        self.statements = []
+        self.copied = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is None:
+            self.commits += 1
+        else:
+            self.rollbacks += 1
+        return False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeCursor(object):
+
+    description = None
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.rows = []
+
+    def execute(self, statement, parameters=None):
+        if self.connection.error:
+            raise self.connection.error
+        self.connection.statements.append(statement)
+        self.rows = []
+        for fragment, rows in self.connection.results.items():
+            if fragment in statement:
+                self.rows = list(rows)
+
+    def copy_expert(self, statement, file):
+        self.execute(statement)
+        self.connection.copied.append(file.read())
+
+    def fetchall(self):
+        return self.rows
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchmany(self, size=1):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+@pytest.fixture
+def fake_connections(monkeypatch):
+    """Patch psycopg2.connect to hand out queued FakeConnections.
+
+    Append connections to the returned list before they're needed;
+    a new empty FakeConnection is created when the list runs dry.
+    """
+    connections = []
+
+    def connect(**kwargs):
+        if connections:
+            return connections.pop(0)
+        return FakeConnection()
+
+    monkeypatch.setattr('psycopg2.connect', connect)
+    return connections
+
+
+@pytest.fixture
+def fake_shift(fake_connections):
+    """A Redshift instance talking to FakeConnections"""
+    import shiftmanager.redshift as rs
+    return rs.Redshift("", "", "", "",
+                       aws_access_key_id="access_key",
+                       aws_secret_access_key="secret_key")
 
 
-def id_cols(self, table_name):
+def id_cols(self, table_name, schema='public'):
     if table_name == 'my_identity_table':
         return {'id_col'}
 
 
-def columns_and_types(self, table, col_str='*'):
+def columns_and_types(self, table, schema='public', col_str='*'):
     return [
         ('foo', 'boolean'),
         ('bar', 'numeric(23,2)'),
@@ -127,7 +213,6 @@ def shift(monkeypatch, mock_connection, mock_s3):
     monkeypatch.setattr('shiftmanager.Redshift.connection', mock_connection)
     monkeypatch.setattr('shiftmanager.Redshift.get_s3_connection',
                         lambda *args, **kwargs: mock_s3)
-    monkeypatch.setattr('shiftmanager.Redshift.mogrify', mogrify)
     monkeypatch.setattr('shiftmanager.Redshift.execute', MagicMock())
     monkeypatch.setattr('shiftmanager.Redshift._get_identity_columns', id_cols)
     monkeypatch.setattr(
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests for the inverted access index
+
+Test Runner: PyTest
+"""
+
+import pytest
+
+from shiftmanager import queries
+from shiftmanager.privileges import mask_from_chars
+
+
+USERS = [
+    ('rdsdb', 1, True, True, None, None),
+    ('ops', 100, True, False, None, None),
+    ('ann', 101, False, False, None, None),
+    ('bob', 102, False, False, None, None),
+    ('cat', 103, False, False, None, None),
+]
+GROUPS = [('analysts', [101, 102])]
+
+
+def fake_catalog(acls):
+    def fetchall(query, parameters=None):
+        if query == queries.users:
+            return USERS
+        if query == queries.groups:
+            return GROUPS
+        assert query == queries.all_privileges
+        fetchall.scans.append(parameters['schemas'])
+        return [(schema, name, 'r', owner, privileges, 'table')
+                for (schema, name), (owner, privileges) in sorted(acls.items())
+                if schema in parameters['schemas']]
+    fetchall.scans = []
+    return fetchall
+
+
+def test_access_index(shift):
+    acls = {
+        ('sales', 'orders'): ('ops', 'ops=arwdRxt/ops\n'
+                                     'group analysts=r/ops\ncat=a/ops'),
+        ('sales', 'returns'): ('ops', 'ops=arwdRxt/ops\nbob=rw/ops'),
+        ('public', 'events'): ('cat', 'cat=arwdRxt/cat\n=r/cat'),
+    }
+    shift._fetchall = fake_catalog(acls)
+    index = shift.access
+    index.load(['sales', 'public'])
+
+    assert sorted(index.relations_for('ann')) == [
+        ('public', 'events'), ('sales', 'orders')]
+    bob = index.relations_for('bob')
+    assert bob[('sales', 'returns')] == mask_from_chars('rw')
+    assert sorted(index.relations_for('cat', 'INSERT')) == [
+        ('public', 'events'), ('sales', 'orders')]
+    assert len(index.relations_for('rdsdb')) == 3
+
+    assert index.users_for(('sales', 'orders')) == set(
+        ['rdsdb', 'ops', 'ann', 'bob'])
+    assert index.users_for(('sales', 'orders'), 'INSERT') == set(
+        ['rdsdb', 'ops', 'cat'])
+    assert index.users_for(('public', 'events')) == set(
+        name for name, _, _, _, _, _ in USERS)
+    with pytest.raises(KeyError):
+        index.users_for(('sales', 'missing'))
+
+    # Refreshing rescans the loaded schemas in one query
+    # and only touches relations that changed
+    acls[('sales', 'returns')] = ('ops', 'ops=arwdRxt/ops')
+    del acls[('sales', 'orders')]
+    acls[('sales', 'refunds')] = ('ops', 'ops=arwdRxt/ops\nann=r/ops')
+    assert index.refresh() == set([
+        ('sales', 'returns'), ('sales', 'orders'), ('sales', 'refunds')])
+    assert shift._fetchall.scans[-1] == ('public', 'sales')
+    assert sorted(index.relations_for('ann')) == [
+        ('public', 'events'), ('sales', 'refunds')]
+    assert ('sales', 'returns') not in index.relations_for('bob')
+    assert index.grants('GROUP analysts') == {}
+    assert index.refresh() == set()
@@ -8,6 +8,8 @@ Test Runner: PyTest
 
 import datetime
 
+import pytest
+
 
 def test_random_password(shift):
     for password in [shift.random_password() for i in range(0, 6, 1)]:
@@ -37,3 +39,69 @@ def test_create_user(shift):
 def test_alter_user(shift):
     statement = shift.alter_user("swiper", password="swiperpass")
     assert statement == "ALTER USER swiper PASSWORD 'swiperpass'"
+
+
+def test_reconcile_users(shift):
+    from shiftmanager import queries
+
+    def fetchall(query, parameters=None):
+        if query == queries.users:
+            return [('rdsdb', 1, True, True, None, None),
+                    ('swiper', 100, False, False, None,
+                     ['wlm_query_slot_count=2']),
+                    ('dora', 101, True, False, '2015-01-01 00:00:00+00',
+                     None),
+                    ('boots', 102, False, False, None, None)]
+        return [('analyticsusers', [100, 101]), ('old', [102])]
+
+    shift._fetchall = fetchall
+    spec = {
+        'swiper': {'groups': ['analyticsusers'],
+                   'config': {'wlm_query_slot_count': 2}},
+        'dora': {'createdb': False, 'valid_until': '2015-01-01',
+                 'groups': ['analyticsusers', 'explorers']},
+        'map': {'password': "map's pass", 'groups': ['explorers']},
+    }
+    batch = shift.reconcile_users(spec, drop_users=True, drop_groups=True)
+    assert batch.split(';\n') == [
+        "CREATE GROUP explorers",
+        "CREATE USER map PASSWORD 'map''s pass'",
+        "ALTER USER dora NOCREATEDB",
+        "ALTER GROUP explorers ADD USER dora, map",
+        "DROP USER boots",
+        "DROP GROUP \"old\"",
+    ]
+
+    unchanged = {
+        'swiper': {'groups': ['analyticsusers'],
+                   'config': {'wlm_query_slot_count': 2}},
+        'dora': {'createdb': True, 'valid_until': '2015-01-01'},
+    }
+    assert shift.reconcile_users(unchanged) == ""
+    assert shift.reconcile_users(unchanged, groups=['explorers']) == \
+        "CREATE GROUP explorers"
+
+
+def test_reconcile_users_quotes_names_and_config(shift):
+    from shiftmanager import queries
+
+    def fetchall(query, parameters=None):
+        if query == queries.users:
+            return [('ann', 100, False, False, None,
+                     ['search_path=$user, public'])]
+        return [('analysts', [])]
+
+    shift._fetchall = fetchall
+    # Redshift keeps names in lower case, so 'Ann' is the existing 'ann'
+    spec = {'Ann': {'groups': ['Analysts', 'Group'],
+                    'config': {'timezone': 'America/New_York',
+                               'search_path': "'$user', public"}}}
+    assert shift.reconcile_users(spec).split(';\n') == [
+        'CREATE GROUP "group"',
+        "ALTER USER ann SET timezone = 'America/New_York'",
+        "ALTER GROUP analysts ADD USER ann",
+        'ALTER GROUP "group" ADD USER ann',
+    ]
+
+    with pytest.raises(ValueError):
+        shift.reconcile_users({'ann': {}, 'Ann': {}})
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests for bulk schema reflection.
+
+Test Runner: PyTest
+"""
+
+import os
+
+import pytest
+
+from shiftmanager import queries
+
+FINGERPRINT_ROWS = [
+    ('orders', 1001, 'r', 1, 1, 'id', 23, -1, True, 1, True, 0,
+     None, None, None),
+    ('orders', 1001, 'r', 1, None, None, None, None, None, None, None, None,
+     'orders_pkey', 'p', '1 -> '),
+]
+
+RELATION_ROWS = [
+    ('customers', 'r', 'ALL'),
+    ('orders', 'r', 'KEY'),
+]
+
+COLUMN_ROWS = [
+    ('customers', 'id', 'none', False, 0, True, 'integer', None),
+    ('orders', 'id', 'none', False, 1, True, 'bigint',
+     '"identity"(445178, 0, \'1,1\'::text)'),
+    ('orders', 'customer_id', 'lzo', True, 0, False, 'integer', None),
+    ('orders', 'note', 'lzo', False, 2, False,
+     'character varying(256)', None),
+]
+
+CONSTRAINT_ROWS = [
+    ('customers', 'p', 'customers_pkey', 'PRIMARY KEY (id)'),
+    ('orders', 'f', 'orders_customer_fkey',
+     'FOREIGN KEY (customer_id) REFERENCES customers(id)'),
+    ('orders', 'f', 'orders_other_fkey',
+     'FOREIGN KEY (customer_id) REFERENCES other.customers(id)'),
+]
+
+
+class FakeCatalog(object):
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, query, parameters=None):
+        self.queries.append(query)
+        if query == queries.schema_fingerprint:
+            return FINGERPRINT_ROWS
+        if query == queries.bulk_relations:
+            return RELATION_ROWS
+        if query == queries.bulk_constraints:
+            return CONSTRAINT_ROWS
+        if 'pg_table_def' in query:
+            assert 'SET LOCAL search_path TO "public"' in query
+            return COLUMN_ROWS
+        raise AssertionError("Unexpected query %s" % query)
+
+
+def cleaned(statement):
+    return ' '.join(str(statement).split())
+
+
+@pytest.fixture
+def fake_catalog(shift):
+    catalog = FakeCatalog()
+    shift._fetchall = catalog
+    return catalog
+
+
+def test_reflect_schema(shift, fake_catalog, tmpdir):
+    tables = shift.reflect_schema('public', cache_dir=str(tmpdir))
+    assert sorted(tables) == ['customers', 'orders']
+
+    # Tables are found by reflected_table without autoloading
+    orders = shift.reflected_table('orders', redshift_distkey='id')
+    assert orders is tables['orders']
+    statement = shift.table_definition(orders, copy_privileges=False)
+    assert cleaned(statement) == cleaned("""
+    CREATE TABLE public.orders (
+    id BIGINT IDENTITY(1,1) NOT NULL,
+    customer_id INTEGER ENCODE lzo,
+    note VARCHAR(256) ENCODE lzo,
+    CONSTRAINT orders_customer_fkey FOREIGN KEY(customer_id)
+    REFERENCES public.customers (id)
+    ) DISTSTYLE KEY DISTKEY (id) SORTKEY (id, note)
+    """)
+
+    statement = shift.table_definition('customers', copy_privileges=False)
+    assert cleaned(statement) == cleaned("""
+    CREATE TABLE public.customers (
+    id INTEGER NOT NULL,
+    CONSTRAINT customers_pkey PRIMARY KEY (id)
+    ) DISTSTYLE ALL
+    """)
+
+
+def test_invalidating_the_catalog_forgets_reflected_tables(
+        shift, fake_catalog, tmpdir):
+    shift.reflect_schema('public', use_disk_cache=False)
+    assert 'public.orders' in shift.meta.tables
+
+    shift.catalog.invalidate('other')
+    assert 'public.orders' in shift.meta.tables
+
+    # A deep copy invalidates the schema after changing its structure,
+    # so the next reflected_table must autoload again
+    shift.catalog.invalidate('public')
+    assert 'public.orders' not in shift.meta.tables
+    assert not shift._bulk_reflected
+
+
+def test_reflect_schema_disk_cache(shift, fake_catalog, tmpdir):
+    cache_dir = str(tmpdir)
+    shift.reflect_schema('public', cache_dir=cache_dir)
+    assert len(fake_catalog.queries) == 4
+    assert len(os.listdir(cache_dir)) == 1
+
+    # A warm start only checks the fingerprint
+    shift.reflect_schema('public', cache_dir=cache_dir)
+    assert len(fake_catalog.queries) == 5
+
+    # A changed fingerprint forces a reload, even if only an encoding
+    # changed
+    original = FINGERPRINT_ROWS[0]
+    FINGERPRINT_ROWS[0] = original[:11] + (3,) + original[12:]
+    try:
+        shift.reflect_schema('public', cache_dir=cache_dir)
+    finally:
+        FINGERPRINT_ROWS[0] = original
+    assert len(fake_catalog.queries) == 9
+
+    shift.reflect_schema('public', use_disk_cache=False)
+    assert len(fake_catalog.queries) == 12
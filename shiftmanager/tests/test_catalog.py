@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests for CatalogSnapshot.
+
+Test Runner: PyTest
+"""
+
+import pytest
+
+from shiftmanager import queries
+from shiftmanager.catalog import CatalogSnapshot
+
+
+class FakeCatalog(object):
+    """Answers the bulk catalog queries from canned rows."""
+
+    def __init__(self):
+        self.calls = []
+        self.rows = {
+            queries.catalog_relations: [
+                ('public', 'events', 'r', 1),
+                ('public', 'empty', 'r', 8),
+                ('public', 'event_view', 'v', None),
+            ],
+            queries.catalog_table_info: [
+                ('public', 'events', 'KEY(id)', 120, 5000),
+            ],
+            queries.catalog_columns: [
+                ('public', 'events', 'id', 'integer', True),
+                ('public', 'events', 'name', 'character varying(256)',
+                 False),
+                ('public', 'empty', 'flag', 'boolean', False),
+                ('public', 'event_view', 'id', 'integer', False),
+            ],
+        }
+
+    def __call__(self, query, parameters=None):
+        self.calls.append((query, parameters))
+        return self.rows[query]
+
+
+@pytest.fixture
+def fetchall():
+    return FakeCatalog()
+
+
+def test_load_and_lookup(fetchall):
+    catalog = CatalogSnapshot(fetchall)
+    events = catalog.relation('events')
+    assert events.kind == 'r'
+    assert events.diststyle == 'KEY(id)'
+    assert events.size == 120
+    assert events.rows == 5000
+    assert events.columns == ('id', 'name')
+    assert events.types == ('integer', 'character varying(256)')
+    assert events.identity_columns == frozenset(['id'])
+
+    empty = catalog.relation('empty')
+    assert empty.diststyle == 'ALL'
+    assert empty.size is None
+
+    assert catalog.relation('event_view').diststyle is None
+    assert catalog.relation('missing') is None
+
+    # All lookups were answered from a single bulk load
+    assert len(fetchall.calls) == 3
+    assert fetchall.calls[0][1] == {'schemas': ('public',)}
+
+
+def test_ttl_and_invalidate(fetchall, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('time.time', lambda: now[0])
+    catalog = CatalogSnapshot(fetchall, ttl=60)
+    catalog.relation('events')
+    assert len(fetchall.calls) == 3
+
+    now[0] += 30
+    catalog.relation('events')
+    assert len(fetchall.calls) == 3
+
+    now[0] += 31
+    catalog.relation('events')
+    assert len(fetchall.calls) == 6
+
+    catalog.invalidate('public')
+    catalog.relation('events')
+    assert len(fetchall.calls) == 9
+
+
+def test_redshift_lookups(shift, fetchall):
+    shift._fetchall = fetchall
+    assert shift._diststyle('empty') == 'ALL'
+    assert shift._diststyle('events') == 'KEY(id)'
+    assert len(fetchall.calls) == 3
+
+
+def test_table_exists_asks_the_cluster(shift, fetchall):
+    tables = set([(None, 'events'), ('analytics', 'events')])
+
+    def exists(query, parameters=None):
+        if query != queries.table_exists:
+            return fetchall(query, parameters)
+        key = (parameters['schema'], parameters['table'])
+        return [(1 if key in tables else 0,)]
+
+    shift._fetchall = exists
+    shift.catalog.load('public')
+    assert shift.table_exists('events')
+    assert shift.table_exists('analytics.events')
+    assert shift.table_exists('events', 'analytics')
+    assert not shift.table_exists('created_since')
+    tables.add((None, 'created_since'))
+    assert shift.table_exists('created_since')
+    # The snapshot loaded above wasn't consulted or reloaded
+    assert len(fetchall.calls) == 3
+
+
+def test_privileges_across_schemas(shift, monkeypatch):
+    import sqlalchemy as sa
+
+    calls = []
+
+    def fetchall(query, parameters=None):
+        calls.append(parameters)
+        assert query == queries.all_privileges
+        rows = [
+            ('public', 'events', 'r', 'ops', 'ops=arwdRxt/ops', 'table'),
+            ('sales', 'orders', 'r', 'sales', '=r/sales', 'table'),
+            ('sales', 'order_view', 'v', 'sales', None, 'view'),
+        ]
+        return [r for r in rows if r[0] in parameters['schemas']]
+
+    shift._fetchall = fetchall
+    shift.privileges.load(['public', 'sales'])
+    meta = sa.MetaData()
+    events = sa.Table('events', meta, sa.Column('id', sa.Integer))
+    orders = sa.Table('orders', meta, sa.Column('id', sa.Integer),
+                      schema='sales')
+
+    assert shift.reflected_privileges(events) == (
+        'ALTER TABLE events OWNER TO ops;\n'
+        'GRANT ALL ON events TO ops')
+    assert shift.reflected_privileges(orders) == (
+        'ALTER TABLE sales.orders OWNER TO sales;\n'
+        'GRANT SELECT ON sales.orders TO PUBLIC')
+    assert calls == [{'schemas': ('public', 'sales')}]
+
+    # Bypassing the cache reloads only the relation's schema
+    shift.reflected_privileges(orders, use_cache=False)
+    assert calls[-1] == {'schemas': ('sales',)}
+
+    with pytest.raises(KeyError):
+        shift.reflected_privileges(sa.Table('missing', meta, schema='sales'))
+
+
+def test_reconcile_privileges(shift):
+    def fetchall(query, parameters=None):
+        assert query == queries.all_privileges
+        return [
+            ('sales', 'orders', 'r', 'ops',
+             'ops=arwdRxt/ops\nann=r*w/ops\n=r/ops', 'table'),
+            ('sales', 'returns', 'r', 'ops', 'ops=arwdRxt/ops', 'table'),
+            ('sales', 'order_view', 'v', 'ops', 'ops=arwdRxt/ops', 'view'),
+        ]
+
+    shift._fetchall = fetchall
+    policy = {
+        ('sales', '*'): {'GROUP analysts': ['SELECT'], 'GROUP etl': 'arwd'},
+        ('sales', 'orders'): {'GROUP analysts': ['SELECT'],
+                              'GROUP etl': 'arwd', 'ann': 'r'},
+    }
+    assert shift.reconcile_privileges(policy).split(';\n') == [
+        "REVOKE SELECT ON sales.orders FROM PUBLIC",
+        "REVOKE UPDATE ON sales.orders FROM ann",
+        "REVOKE GRANT OPTION FOR SELECT ON sales.orders FROM ann",
+        "GRANT SELECT ON ALL TABLES IN SCHEMA sales TO GROUP analysts",
+        "GRANT INSERT, SELECT, UPDATE, DELETE "
+        "ON ALL TABLES IN SCHEMA sales TO GROUP etl",
+    ]
+
+    # A relation outside the policy keeps its grants and
+    # prevents collapsing into a schema-wide statement
+    policy = {('sales', 'orders'): {'GROUP analysts': 'r'},
+              ('sales', 'returns'): {'GROUP analysts': 'r'}}
+    assert shift.reconcile_privileges(policy, ignore=['ann']).split(';\n') == [
+        "REVOKE SELECT ON sales.orders FROM PUBLIC",
+        "GRANT SELECT ON sales.orders TO GROUP analysts",
+        "GRANT SELECT ON sales.returns TO GROUP analysts",
+    ]
+
+    with pytest.raises(KeyError):
+        shift.reconcile_privileges({('sales', 'missing'): {}})
+
+    # Redshift only lets users hold grant options
+    for grantee in ['GROUP analysts', 'PUBLIC']:
+        with pytest.raises(ValueError):
+            shift.reconcile_privileges({('sales', '*'): {grantee: 'r*'}})
+
+
+def test_reconcile_privileges_quotes_names(shift):
+    def fetchall(query, parameters=None):
+        return [('Sales', 'user', 'r', 'ops',
+                 'ops=arwdRxt/ops\n"Ann"=r/ops', 'table')]
+
+    shift._fetchall = fetchall
+    policy = {('Sales', 'user'): {'GROUP Analysts': 'r', 'Ann': 'r'}}
+    assert shift.reconcile_privileges(policy) == \
+        'GRANT SELECT ON "Sales"."user" TO GROUP "Analysts"'
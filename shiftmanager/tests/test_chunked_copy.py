@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests for chunked, resumable deep copies.
+
+Test Runner: PyTest
+"""
+
+import pytest
+import sqlalchemy as sa
+
+from shiftmanager import queries
+
+
+@pytest.fixture
+def events():
+    return sa.Table('events', sa.MetaData(),
+                    sa.Column('id', sa.Integer),
+                    sa.Column('name', sa.String(10)),
+                    redshift_sortkey='id')
+
+
+@pytest.fixture
+def catalog(fake_shift):
+    """Answers catalog and range queries; add relation names to
+    the returned set to make them exist."""
+    relations = set(['events'])
+
+    def fetchall(query, parameters=None):
+        if query == queries.catalog_relations:
+            return [('public', name, 'r', 0) for name in relations]
+        if query == queries.table_exists:
+            return [(int(parameters['table'] in relations),)]
+        if 'NTILE(3)' in query:
+            return [(1,), (50,), (50,), (90,)]
+        if query == queries.all_privileges:
+            return [('public', 'events', 'r', 'ops', '=r/ops', 'table')]
+        return []
+
+    fake_shift._fetchall = fetchall
+    return relations
+
+
+def test_chunked_deep_copy_resumes(fake_shift, catalog, events, tmpdir):
+    conn = fake_shift.connection
+    execute = fake_shift.execute
+
+    def interrupted(batch, *args, **kwargs):
+        if batch.startswith('\nINSERT') and 'id >= 90' in batch:
+            raise KeyboardInterrupt()
+        execute(batch, *args, **kwargs)
+
+    fake_shift.execute = interrupted
+    with pytest.raises(KeyboardInterrupt):
+        fake_shift.chunked_deep_copy(events, chunks=3,
+                                     deduplicate_partition_by='id, name',
+                                     deduplicate_order_by='name',
+                                     state_dir=str(tmpdir), preflight=None)
+    assert 'CREATE TABLE events$incoming' in conn.statements[0]
+    inserts = [s for s in conn.statements if s.startswith('\nINSERT')]
+    assert len(inserts) == 2
+    assert 'WHERE id < 50' in inserts[0]
+    assert 'WHERE id >= 50 AND id < 90\n) WHERE row_number = 1' in \
+        inserts[1]
+    assert conn.rollbacks == 1
+
+    del fake_shift.execute
+    catalog.add('events$incoming')
+    conn.statements[:] = []
+    copied = fake_shift.chunked_deep_copy(events, chunks=3,
+                                          state_dir=str(tmpdir),
+                                          preflight=None)
+    assert copied == 2
+    assert conn.statements[0] == \
+        'DELETE FROM events$incoming WHERE id >= 90'
+    assert conn.statements[2] == \
+        'DELETE FROM events$incoming WHERE id IS NULL'
+    assert conn.statements[-1] == (
+        'LOCK TABLE events;\n'
+        'ALTER TABLE events RENAME TO events$outgoing;\n'
+        'ALTER TABLE events$incoming RENAME TO events;\n'
+        'ALTER TABLE events OWNER TO ops;\n'
+        'GRANT SELECT ON events TO PUBLIC;\n'
+        'DROP TABLE events$outgoing;\n'
+        'ANALYZE events;')
+    assert not [f for f in tmpdir.listdir() if f.ext == '.json']
+
+
+def test_chunked_deep_copy_checks_dedupe_columns(fake_shift, catalog,
+                                                 events, tmpdir):
+    with pytest.raises(ValueError):
+        fake_shift.chunked_deep_copy(events, deduplicate_partition_by='name',
+                                     state_dir=str(tmpdir))
+
+
+def test_online_deep_copy(fake_shift, catalog, events):
+    conn = fake_shift.connection
+    catalog_fetchall = fake_shift._fetchall
+    watermarks = [[(10,)], [(15,)], [(15,)]]
+
+    def fetchall(query, parameters=None):
+        if query.startswith('SELECT MAX'):
+            return watermarks.pop(0)
+        return catalog_fetchall(query, parameters)
+
+    fake_shift._fetchall = fetchall
+    fake_shift.online_deep_copy(events, key_column='id', preflight=None)
+    assert not watermarks
+    assert 'CREATE TABLE events$incoming' in conn.statements[0]
+    assert conn.statements[1].endswith(
+        'FROM events\nWHERE id <= 10 OR id IS NULL')
+    assert conn.statements[2].endswith('FROM events\nWHERE id > 10 AND '
+                                       'id <= 15')
+    # The second pass found nothing new
+    assert conn.statements[3] == 'LOCK TABLE events'
+    assert conn.statements[4].endswith('FROM events\nWHERE id > 15')
+    assert conn.statements[5].startswith(
+        'ALTER TABLE events RENAME TO events$outgoing;\n'
+        'ALTER TABLE events$incoming RENAME TO events;\n')
+    assert conn.statements[-1] == 'ANALYZE events'
+    assert conn.commits == 4
+
+
+def test_online_deep_copy_replaces_updated_rows(fake_shift, catalog,
+                                                events):
+    conn = fake_shift.connection
+    catalog_fetchall = fake_shift._fetchall
+    watermarks = [[("2016-01-01",)], [("2016-01-02",)]]
+
+    def fetchall(query, parameters=None):
+        if query.startswith('SELECT MAX'):
+            return watermarks.pop(0)
+        return catalog_fetchall(query, parameters)
+
+    fake_shift._fetchall = fetchall
+    fake_shift.online_deep_copy(events, key_column='id',
+                                updated_column='name', catch_up_passes=1,
+                                copy_privileges=False, analyze=False,
+                                preflight=None)
+    condition = "name >= '2016-01-01' AND name <= '2016-01-02'"
+    assert conn.statements[2] == (
+        'DELETE FROM events$incoming WHERE id IN '
+        '(SELECT id FROM events WHERE %s)' % condition)
+    assert conn.statements[3].endswith('WHERE ' + condition)
+    assert conn.statements[5] == (
+        'DELETE FROM events$incoming WHERE id IN '
+        "(SELECT id FROM events WHERE name >= '2016-01-02')")
+
+
+def test_online_deep_copy_drops_incoming_on_failure(fake_shift, catalog,
+                                                    events):
+    conn = fake_shift.connection
+    catalog_fetchall = fake_shift._fetchall
+    execute = fake_shift.execute
+
+    def fetchall(query, parameters=None):
+        if query.startswith('SELECT MAX'):
+            return [(10,)]
+        return catalog_fetchall(query, parameters)
+
+    def failing(batch, *args, **kwargs):
+        if batch.startswith('LOCK'):
+            raise RuntimeError("lock timeout")
+        execute(batch, *args, **kwargs)
+
+    fake_shift._fetchall = fetchall
+    fake_shift.execute = failing
+    with pytest.raises(RuntimeError):
+        fake_shift.online_deep_copy(events, key_column='id', preflight=None)
+    assert conn.statements[-1] == 'DROP TABLE IF EXISTS events$incoming'
+    assert conn.rollbacks == 1
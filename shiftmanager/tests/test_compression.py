@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests for sampled ANALYZE COMPRESSION and cached recommendations.
+
+Test Runner: PyTest
+"""
+
+import sqlalchemy as sa
+
+from shiftmanager.compression import CompressionAdvice
+
+
+def test_advice_persists(tmpdir, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('time.time', lambda: now[0])
+    path = str(tmpdir.join('advice', 'cluster.json'))
+    advice = CompressionAdvice(path)
+    advice.put('events', 'public', {'id': 'delta'}, comprows=1000)
+
+    now[0] += 60
+    reloaded = CompressionAdvice(path)
+    recommendation = reloaded.get('events', 'public')
+    assert recommendation.encodings == {'id': 'delta'}
+    assert recommendation.analyzed_at == 1000.0
+    assert recommendation.comprows == 1000
+    assert reloaded.get('events', 'public', max_age=30) is None
+    assert reloaded.get('events', 'other') is None
+
+
+def test_analyze_compression(fake_shift, fake_connections):
+    from conftest import FakeConnection
+
+    fake_shift._compression_advice = CompressionAdvice()
+    fake_shift.compression_advice.put('fresh', 'public', {'id': 'raw'})
+    rows = [('events', 'id', 'delta', '50.00'),
+            ('events', 'name', 'zstd', '70.00')]
+    connections = [FakeConnection(results={'ANALYZE COMPRESSION': rows})
+                   for _ in range(2)]
+    fake_connections.extend(connections)
+
+    results = fake_shift.analyze_compression(
+        ['events', 'sales.orders', 'fresh'], comprows=5000, max_age=60)
+    assert results['public', 'fresh'].encodings == {'id': 'raw'}
+    assert results['public', 'events'].encodings == {'id': 'delta',
+                                                     'name': 'zstd'}
+    assert results['sales', 'orders'].comprows == 5000
+    statements = sorted(c.statements[0] for c in connections)
+    assert statements == [
+        'ANALYZE COMPRESSION public.events COMPROWS 5000',
+        'ANALYZE COMPRESSION sales.orders COMPROWS 5000']
+    assert all(c.closed for c in connections)
+
+
+def test_table_definition_reuses_advice(shift):
+    calls = []
+
+    def fetchall(query, parameters=None):
+        calls.append(query)
+        return [('events', 'id', 'delta', '50.00')]
+
+    shift._fetchall = fetchall
+    shift._compression_advice = CompressionAdvice()
+    table = sa.Table('events', sa.MetaData(), sa.Column('id', sa.Integer))
+    for _ in range(2):
+        ddl = shift.table_definition(table, copy_privileges=False,
+                                     analyze_compression=True,
+                                     compression_max_age=3600)
+        assert 'id INTEGER ENCODE delta' in ddl
+    assert calls == ['ANALYZE COMPRESSION public.events']
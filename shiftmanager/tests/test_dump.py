@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests for dumping the DDL of whole schemas.
+
+Test Runner: PyTest
+"""
+
+import io
+
+from shiftmanager import queries
+
+
+def fetchall(query, parameters=None):
+    if query == queries.catalog_relations:
+        rows = [('public', 'events', 'r', 0),
+                ('public', 'users', 'r', 0),
+                ('public', 'active_users', 'v', None),
+                ('public', 'recent_active_users', 'v', None),
+                ('sales', 'orders', 'r', 1),
+                ('sales', 'a_order_view', 'v', None)]
+        return [r for r in rows if r[0] in parameters['schemas']]
+    if query == queries.view_dependencies:
+        return [('public', 'active_users', 'public', 'users'),
+                ('sales', 'a_order_view', 'public', 'recent_active_users'),
+                ('public', 'recent_active_users', 'public', 'active_users')]
+    return []
+
+
+def test_dump_ddl(fake_shift, monkeypatch, tmpdir):
+    def table_definition(self, name, schema, copy_privileges):
+        assert self is not fake_shift
+        return "CREATE TABLE %s.%s ();\n" % (schema, name)
+
+    def view_definition(self, name, schema, copy_privileges):
+        return "CREATE VIEW %s.%s AS SELECT 1" % (schema, name)
+
+    monkeypatch.setattr('shiftmanager.Redshift.table_definition',
+                        table_definition)
+    monkeypatch.setattr('shiftmanager.Redshift.view_definition',
+                        view_definition)
+    fake_shift._fetchall = fetchall
+
+    output = io.StringIO()
+    count = fake_shift.dump_ddl(output, schemas=['public', 'sales'],
+                                max_workers=3, copy_privileges=False)
+    assert count == 6
+    assert output.getvalue() == (
+        "CREATE SCHEMA IF NOT EXISTS sales;\n\n"
+        "CREATE TABLE public.events ();\n\n"
+        "CREATE TABLE public.users ();\n\n"
+        "CREATE TABLE sales.orders ();\n\n"
+        "CREATE VIEW public.active_users AS SELECT 1;\n\n"
+        "CREATE VIEW public.recent_active_users AS SELECT 1;\n\n"
+        "CREATE VIEW sales.a_order_view AS SELECT 1;\n\n")
+
+    path = str(tmpdir.join('dump.sql'))
+    fake_shift.dump_ddl(path, schemas='sales', copy_privileges=False)
+    with io.open(path) as f:
+        assert f.read().startswith("CREATE SCHEMA IF NOT EXISTS sales;")
@@ -0,0 +1,20 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Guard against heavy dependencies being imported by ``import shiftmanager``.
+
+Test Runner: PyTest
+"""
+
+import subprocess
+import sys
+
+
+def test_heavy_dependencies_load_lazily():
+    script = ("import sys, shiftmanager; "
+              "print(' '.join(sorted(sys.modules)))")
+    output = subprocess.check_output([sys.executable, '-c', script])
+    modules = set(output.decode('utf-8').split())
+    for name in ['boto', 'sqlalchemy', 'sqlalchemy_redshift',
+                 'sqlalchemy_views', 'psycopg2.extras']:
+        assert name not in modules
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests for the distribution and sort key advisor.
+
+Test Runner: PyTest
+"""
+
+from shiftmanager import key_advisor, queries
+
+HISTORY = {
+    queries.catalog_relations: [
+        ('public', 'orders', 'r', 0),
+        ('public', 'customers', 'r', 0),
+        ('public', 'regions', 'r', 0),
+    ],
+    queries.catalog_columns: [
+        ('public', 'orders', 'id', 'integer', False),
+        ('public', 'orders', 'customer_id', 'integer', False),
+        ('public', 'orders', 'region_id', 'integer', False),
+        ('public', 'orders', 'ordered_at', 'timestamp', False),
+        ('public', 'customers', 'id', 'integer', False),
+        ('public', 'regions', 'region_id', 'integer', False),
+    ],
+    queries.redistributed_join_plans: [
+        (1, 1, 0, 'XN Hash Join DS_DIST_INNER  (cost=1.00..2.00)',
+         'Hash Cond: ("outer".customer_id = "inner".id)'),
+        (1, 2, 1, 'XN Seq Scan on orders o  (cost=0.00..1.00)', None),
+        (1, 3, 1, 'XN Hash  (cost=0.00..1.00)', None),
+        (1, 4, 3, 'XN Seq Scan on customers c  (cost=0.00..1.00)', None),
+        (2, 1, 0, 'XN Hash Join DS_DIST_INNER  (cost=1.00..2.00)',
+         'Hash Cond: ("outer".customer_id = "inner".id)'),
+        (2, 2, 1, 'XN Seq Scan on orders  (cost=0.00..1.00)', None),
+        (2, 3, 1, 'XN Hash  (cost=0.00..1.00)', None),
+        (2, 4, 3, 'XN Seq Scan on customers  (cost=0.00..1.00)', None),
+        (3, 1, 0, 'XN Hash Join DS_BCAST_INNER  (cost=1.00..2.00)',
+         'Hash Cond: ("outer".region_id = "inner".region_id)'),
+        (3, 2, 1, 'XN Seq Scan on orders  (cost=0.00..1.00)', None),
+        (3, 3, 1, 'XN Hash  (cost=0.00..1.00)', None),
+        (3, 4, 3, 'XN Seq Scan on regions  (cost=0.00..1.00)', None),
+    ],
+    queries.redistribution_cost: [
+        (1, 4000, 30000000), (2, 6000, 10000000), (3, 100, 2000000),
+    ],
+    queries.scan_filters: [
+        (1, 'XN Seq Scan on orders o  (cost=0.00..1.00)',
+         "Filter: (ordered_at > '2016-01-01 00:00:00'::timestamp)"),
+        (2, 'XN Seq Scan on orders  (cost=0.00..1.00)',
+         "Filter: ((ordered_at > '2016-01-01 00:00:00'::timestamp) "
+         "AND (id = 7))"),
+    ],
+    queries.slice_count: [(4,)],
+    queries.table_keys: [
+        ('orders', 'EVEN', 'id', 1000000),
+        ('customers', 'KEY(id)', None, 50000),
+        ('regions', 'EVEN', None, 20),
+    ],
+}
+
+PROFILES = {
+    'customer_id': (40000, 1000000, 200),
+    'id': (50000, 50000, 1),
+    'region_id': (10, 20, 2),
+}
+
+
+def fetchall(query, parameters=None):
+    if query in HISTORY:
+        return HISTORY[query]
+    if 'APPROXIMATE' in query:
+        for column, profile in PROFILES.items():
+            if 'COUNT(DISTINCT %s)' % column in query:
+                return [profile]
+    return []
+
+
+def test_advise_keys(shift):
+    shift._fetchall = fetchall
+    advice = dict((a.table, a) for a in shift.advise_keys())
+
+    orders = advice['orders']
+    assert orders.kwargs == {'redshift_diststyle': 'KEY',
+                             'redshift_distkey': 'customer_id',
+                             'redshift_sortkey': ('ordered_at', 'id')}
+    assert orders.changed
+    assert orders.expected_gain_seconds == 40.0
+    assert orders.redistributed_bytes == 10000
+    assert orders.filtered_scans == 2
+
+    # Already distributed on its join column
+    assert advice['customers'].kwargs == {'redshift_diststyle': 'KEY',
+                                          'redshift_distkey': 'id'}
+    assert not advice['customers'].changed
+
+    # Too few values to distribute on, but small enough to copy everywhere
+    regions = advice['regions']
+    assert regions.kwargs == {'redshift_diststyle': 'ALL'}
+    assert regions.changed
+    assert 'too few distinct values' in regions.reasons[0]
+
+
+def test_join_stats_credits_the_joined_tables():
+    plans = [
+        (1, 1, 0, 'XN Hash Join DS_BCAST_INNER  (cost=1.00..2.00)',
+         'Hash Cond: ("outer".id = "inner".id)'),
+        (1, 2, 1, 'XN Hash Join DS_DIST_NONE  (cost=1.00..2.00)',
+         'Hash Cond: ("outer".customer_id = "inner".id)'),
+        (1, 3, 2, 'XN Seq Scan on orders  (cost=0.00..1.00)', None),
+        (1, 4, 2, 'XN Hash  (cost=0.00..1.00)', None),
+        (1, 5, 4, 'XN Seq Scan on customers  (cost=0.00..1.00)', None),
+        (1, 6, 1, 'XN Hash  (cost=0.00..1.00)', None),
+        (1, 7, 6, 'XN Seq Scan on regions  (cost=0.00..1.00)', None),
+    ]
+    columns = {'orders': set(['id', 'customer_id']),
+               'customers': set(['id']),
+               'regions': set(['id']),
+               'events': set(['id'])}
+    stats = key_advisor.join_stats(plans, [(1, 900, 3000000)], columns)
+
+    # Only the redistributing join is counted, and the outer side's
+    # cost is split between the two tables it could have come from
+    assert sorted(stats) == ['customers', 'orders', 'regions']
+    assert stats['orders'] == {'id': {'seconds': 1.5, 'bytes': 450,
+                                      'joins': 1, 'broadcasts': 1}}
+    assert stats['customers'] == stats['orders']
+    assert stats['regions'] == {'id': {'seconds': 3.0, 'bytes': 900,
+                                       'joins': 1, 'broadcasts': 1}}
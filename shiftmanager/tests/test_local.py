@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests for the local Postgres and filesystem S3 stand-in
+
+Test Runner: PyTest
+"""
+
+import io
+import json
+
+import psycopg2
+import pytest
+
+from conftest import FakeConnection
+from shiftmanager.local import (Emulator, FilesystemS3Connection,
+                                LocalRedshift)
+from shiftmanager.unload import gunzip_chunks, manifest_urls
+
+
+def test_filesystem_bucket(tmpdir):
+    bucket = FilesystemS3Connection(str(tmpdir)).get_bucket('bucket')
+    bucket.new_key('tmp/a/one').set_contents_from_string('first')
+    bucket.new_key('/tmp/a/two').set_contents_from_file(io.StringIO('2nd'))
+    path = tmpdir.join('local')
+    path.write('third')
+    bucket.new_key('tmp/b').set_contents_from_filename(str(path))
+
+    assert [k.name for k in bucket.list(prefix='tmp/a/')] == [
+        'tmp/a/one', 'tmp/a/two']
+    assert bucket.get_key('tmp/a/two').get_contents_as_string() == b'2nd'
+    assert bucket.get_key('tmp/missing') is None
+    key = bucket.get_key('tmp/b')
+    assert [key.read(2), key.read(2), key.read(2), key.read(2)] == [
+        b'th', b'ir', b'd', b'']
+    key.close()
+
+    bucket.delete_keys(['tmp/a/one', bucket.get_key('tmp/b')])
+    assert [k.name for k in bucket.list()] == ['tmp/a/two']
+    with pytest.raises(ValueError):
+        bucket.new_key('../outside').set_contents_from_string('x')
+
+
+def test_copy_json_to_table(tmpdir, fake_connections):
+    conn = FakeConnection(
+        {'information_schema.columns': [('id',), ('name',), ('tags',)]})
+    fake_connections.append(conn)
+    redshift = LocalRedshift(s3_root=str(tmpdir.join('s3')))
+    data = [{'id': 1, 'name': 'a, "b"', 'tags': {'x': 1}},
+            {'id': 2, 'name': None},
+            {'id': 3, 'name': 'c'}]
+    jsonpaths = {'jsonpaths': ["$['id']", "$['name']", "$['tags']"]}
+    redshift.copy_json_to_table('bucket', 'tmp/load', data, jsonpaths,
+                                'public.events', slices=2,
+                                local_path=str(tmpdir.join('local')))
+
+    lines = sorted(b''.join(conn.copied).decode('utf-8').splitlines())
+    assert lines == ['1,"a, ""b""","{""x"": 1}"', '2,\\N,\\N', '3,c,\\N']
+    assert all('FORMAT csv' in s for s in conn.statements
+               if s.startswith('COPY'))
+    assert conn.commits == 1
+    # Staged files are cleaned up afterwards
+    assert list(redshift.get_bucket('bucket').list()) == []
+
+
+def test_unload_table_to_s3(tmpdir, fake_connections):
+    rows = [(i, 'name %d' % i if i % 3 else None, i % 2 == 0)
+            for i in range(10)]
+    conn = FakeConnection({'FROM public.events': rows})
+    fake_connections.append(conn)
+    redshift = LocalRedshift(s3_root=str(tmpdir), slices=3)
+    redshift.unload_table_to_s3('bucket', 'tmp', 'events',
+                                file_format='csv')
+
+    bucket = redshift.get_bucket('bucket')
+    manifest = bucket.get_key('tmp/events/manifest')
+    parts = manifest_urls(manifest.get_contents_as_string())
+    assert [key for _, key in parts] == [
+        'tmp/events/0000_part_00.gz', 'tmp/events/0001_part_00.gz',
+        'tmp/events/0002_part_00.gz']
+    unloaded = []
+    for _, key in parts:
+        data = bucket.get_key(key).get_contents_as_string()
+        unloaded += b''.join(
+            gunzip_chunks([data])).decode('utf-8').splitlines()
+    assert sorted(unloaded, key=lambda line: int(line.split(',')[0])) == [
+        '%d,%s,%s' % (i, 'name %d' % i if i % 3 else '',
+                      't' if i % 2 == 0 else 'f')
+        for i in range(10)]
+
+    # Without ALLOWOVERWRITE, a non-empty destination is an error
+    with pytest.raises(psycopg2.InternalError):
+        redshift.unload_table_to_s3('bucket', 'tmp', 'events',
+                                    options='MANIFEST', file_format='csv')
+
+    # CLEANPATH clears out parts a smaller unload wouldn't overwrite
+    fake_connections.append(FakeConnection({'FROM public.events': rows}))
+    redshift = LocalRedshift(s3_root=str(tmpdir), slices=2)
+    redshift.unload_table_to_s3('bucket', 'tmp', 'events',
+                                options='MANIFEST GZIP CLEANPATH',
+                                file_format='csv')
+    assert [key.name for key in bucket.list('tmp/events/')] == [
+        'tmp/events/0000_part_00.gz', 'tmp/events/0001_part_00.gz',
+        'tmp/events/manifest']
+
+
+def test_emulator_passes_other_statements_through(tmpdir):
+    conn = FakeConnection()
+    emulator = Emulator(FilesystemS3Connection(str(tmpdir)))
+    emulator.execute(conn.cursor(), "SELECT 'FROM s3://'")
+    assert conn.statements == ["SELECT 'FROM s3://'"]
+
+
+@pytest.mark.postgrestest
+def test_round_trip(tmpdir):
+    redshift = LocalRedshift(database='shiftmanager', user='shiftmanager',
+                             host='localhost', s3_root=str(tmpdir))
+    redshift.execute("DROP TABLE IF EXISTS local_events; "
+                     "CREATE TABLE local_events "
+                     "(id integer, name varchar(32), seen timestamp)")
+    try:
+        data = [{'id': i, 'name': 'name %d' % i,
+                 'seen': '2016-01-02 03:04:%02d' % (i % 60)}
+                for i in range(1000)]
+        redshift.copy_json_to_table(
+            'bucket', 'tmp/load', data,
+            redshift.gen_jsonpaths(json.dumps(data[0])), 'local_events',
+            local_path=str(tmpdir.join('local')))
+        rows = [row for batch in redshift.iter_table(
+            'local_events', bucket='bucket', keypath='tmp/unload',
+            cursor_max_rows=-1) for row in batch]
+        assert sorted(row[0] for row in rows) == list(range(1000))
+    finally:
+        redshift.execute("DROP TABLE local_events")
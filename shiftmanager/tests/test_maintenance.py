@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests for planning and running schema-wide table maintenance.
+
+Test Runner: PyTest
+"""
+
+import threading
+import time
+
+from shiftmanager import maintenance
+
+HEALTH = [
+    # schema, table, size, tbl_rows, unsorted, stats_off, sortkey1
+    ('public', 'clean', 500, 10000, 0.5, 1.0, 'id'),
+    ('public', 'messy_small', 10, 100, 80.0, 0.0, 'id'),
+    ('public', 'messy_big', 400, 9000, 30.0, 0.0, 'id'),
+    ('public', 'unsorted_a_bit', 200, 5000, 6.0, 0.0, 'id'),
+    ('public', 'stale', 50, 1000, None, 40.0, None),
+]
+
+
+def test_plan_ranks_and_chooses_actions():
+    plan = maintenance.plan_maintenance(HEALTH)
+    assert [(t.table, t.action) for t in plan] == [
+        ('messy_big', 'deep_copy'),
+        ('unsorted_a_bit', 'vacuum'),
+        ('messy_small', 'deep_copy'),
+        ('stale', 'analyze'),
+    ]
+    assert plan[0].required_space == 800
+    assert plan[1].required_space == 200
+    assert plan[-1].required_space == 0
+
+
+def test_run_within_budget_limits_disk_and_workers():
+    tasks = [maintenance.MaintenanceTask('public', name, 'deep_copy',
+                                         size, 50.0, 0.0, size)
+             for name, size in [('a', 60), ('b', 60), ('c', 30),
+                                ('d', 10), ('huge', 500)]]
+    lock = threading.Lock()
+    running = {'space': 0, 'tasks': 0, 'max_space': 0, 'max_tasks': 0}
+
+    def func(task):
+        with lock:
+            running['space'] += task.required_space
+            running['tasks'] += 1
+            running['max_space'] = max(running['max_space'],
+                                       running['space'])
+            running['max_tasks'] = max(running['max_tasks'],
+                                       running['tasks'])
+        time.sleep(0.01)
+        with lock:
+            running['space'] -= task.required_space
+            running['tasks'] -= 1
+        return task.table
+
+    results, skipped = maintenance.run_within_budget(
+        tasks, func, max_workers=3, budget=100)
+    assert sorted(results) == ['a', 'b', 'c', 'd']
+    assert [t.table for t in skipped] == ['huge']
+    assert running['max_space'] <= 100
+    assert running['max_tasks'] <= 3
+
+
+def test_run_within_budget_records_failures():
+    tasks = [maintenance.MaintenanceTask('public', name, 'vacuum',
+                                         10, 10.0, 0.0, 10)
+             for name in ['ok', 'broken', 'huge']]
+    tasks[2] = tasks[2]._replace(required_space=500)
+
+    def func(task):
+        if task.table == 'broken':
+            raise RuntimeError("connection refused")
+        return task.table
+
+    results, skipped = maintenance.run_within_budget(tasks, func,
+                                                     budget=100)
+    assert 'ok' in results
+    failed = [r for r in results if r != 'ok']
+    assert len(failed) == 1
+    assert failed[0].task.table == 'broken'
+    assert isinstance(failed[0].error, RuntimeError)
+    assert [t.table for t in skipped] == ['huge']
+
+
+def test_run_table_maintenance(fake_shift, fake_connections, capsys):
+    from conftest import FakeConnection
+
+    fake_shift._fetchall = lambda query, params=None: [(1000, 200)]
+    plan = maintenance.plan_maintenance(
+        [('public', 'events', 300, 100, 8.0, 0.0, 'id')])
+    worker = FakeConnection(results={'svv_table_info': [(120,)]})
+    fake_connections.append(worker)
+
+    results = fake_shift.run_table_maintenance(plan)
+    assert worker.statements[:2] == ['VACUUM FULL public.events',
+                                     'ANALYZE public.events']
+    assert worker.closed
+    assert len(results) == 1
+    assert results[0].reclaimed == 180
+    assert results[0].error is None
+    assert 'public.events' in capsys.readouterr().out
+
+
+def stats_fetchall(size, capacity, used):
+    from shiftmanager import queries
+
+    def fetchall(query, parameters=None):
+        if query == queries.table_stats:
+            return [(size, 4000000, 'id')]
+        if query == queries.disk_space:
+            return [(capacity, used)]
+        if query == queries.insert_throughput:
+            return [(1000000, 5000)]
+    return fetchall
+
+
+def test_deep_copy_estimate(shift):
+    shift._fetchall = stats_fetchall(100, 1000, 500)
+    estimate = shift.deep_copy_estimate('events')
+    assert estimate.required_space == 200
+    assert estimate.free_space == 500
+    assert estimate.fits
+    assert estimate.seconds == 20.0
+
+
+def test_deep_copy_preflight(shift):
+    import pytest
+    import sqlalchemy as sa
+
+    table = sa.Table('events', sa.MetaData(), sa.Column('id', sa.Integer))
+    shift._fetchall = stats_fetchall(300, 1000, 500)
+    with pytest.raises(ValueError) as e:
+        shift.deep_copy(table, copy_privileges=False, execute=True,
+                        preflight='raise')
+    assert 'needs about 600 MB' in str(e.value)
+    assert not shift.execute.called
+
+    # Only executed statements are checked
+    shift.deep_copy(table, copy_privileges=False, preflight='raise')
+
+    with pytest.warns(UserWarning):
+        shift.deep_copy(table, copy_privileges=False, execute=True,
+                        preflight='warn')
+    assert shift.execute.called
+
+
+def test_deep_copy_skips_preflight_by_default(shift):
+    import sqlalchemy as sa
+
+    table = sa.Table('events', sa.MetaData(), sa.Column('id', sa.Integer))
+    stats = stats_fetchall(300, 1000, 500)
+    queried = []
+    shift._fetchall = lambda query, parameters=None: \
+        queried.append(query) or stats(query, parameters)
+    shift.deep_copy(table, copy_privileges=False, execute=True)
+    assert shift.execute.called
+    assert queried == []
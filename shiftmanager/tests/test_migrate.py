@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests for migrating tables between clusters.
+
+Test Runner: PyTest
+"""
+
+import json
+import threading
+
+from conftest import FakeConnection
+from shiftmanager import migrate
+
+
+class FakeKey(object):
+
+    def __init__(self, name, contents=None):
+        self.name = name
+        self.contents = contents
+
+    def get_contents_as_string(self):
+        return self.contents
+
+
+class FakeBucket(object):
+
+    def __init__(self, record_counts=None):
+        self.deleted = []
+        self.record_counts = record_counts or {}
+
+    def get_key(self, name):
+        count = self.record_counts[name.rsplit('/', 2)[-2]]
+        manifest = {'entries': [{'url': 's3://bukkit/' + name,
+                                 'meta': {'record_count': count}}]}
+        return FakeKey(name, json.dumps(manifest).encode('utf-8'))
+
+    def list(self, prefix):
+        return [FakeKey(prefix + 'manifest'), FakeKey(prefix + '0000_part')]
+
+    def delete_keys(self, names):
+        self.deleted += names
+
+
+def test_migrate_tables(monkeypatch):
+    import shiftmanager.redshift as rs
+
+    lock = threading.Lock()
+    connections = {'source': [], 'target': []}
+
+    def connect(**kwargs):
+        host = kwargs['host']
+        conn = FakeConnection(results={
+            'pg_table_is_visible': [(0,)],
+            'COUNT(*) FROM sales.orders': [(2,)],
+            'COUNT(*) FROM public.events': [(5,)]})
+        with lock:
+            connections[host].append(conn)
+        return conn
+
+    bucket = FakeBucket({'orders': 3, 'events': 5})
+    monkeypatch.setattr('psycopg2.connect', connect)
+    monkeypatch.setattr(
+        'shiftmanager.Redshift.table_definition',
+        lambda self, table, schema, copy_privileges: (
+            'CREATE TABLE %s.%s (id INTEGER)' % (schema, table)))
+    monkeypatch.setattr('shiftmanager.Redshift.get_bucket',
+                        lambda self, name: bucket)
+    source = rs.Redshift(host='source', aws_access_key_id='key',
+                         aws_secret_access_key='secret')
+    target = rs.Redshift(host='target', aws_access_key_id='key',
+                         aws_secret_access_key='secret')
+    source.s3_conn = target.s3_conn = object()
+
+    results = source.migrate_tables(target, ['sales.orders', 'events'],
+                                    'bukkit', 'migration', max_workers=2)
+    assert [(r.schema, r.table) for r in results] == [
+        ('sales', 'orders'), ('public', 'events')]
+    assert results[0].error is None
+    assert (results[0].source_rows, results[0].target_rows) == (3, 2)
+    assert not migrate.verified(results[0])
+    assert migrate.verified(results[1])
+
+    statements = [s for conn in connections['target']
+                  for s in conn.statements]
+    assert 'CREATE SCHEMA IF NOT EXISTS sales' in statements
+    assert 'CREATE TABLE sales.orders (id INTEGER)' in statements
+    assert "COPY sales.orders\n" \
+        "FROM 's3://bukkit/migration/sales/orders/manifest'\n" \
+        "CREDENTIALS 'aws_access_key_id=key;aws_secret_access_key=secret'\n" \
+        "FORMAT AS PARQUET\nMANIFEST;" in statements
+    # Source rows come from the UNLOAD manifests, not a later count
+    assert not [s for conn in connections['source'] for s in conn.statements
+                if 'COUNT(*)' in s]
+    unloads = [s for conn in connections['source'] for s in conn.statements
+               if 'UNLOAD' in s]
+    assert len(unloads) == 2
+    assert 'FORMAT AS PARQUET' in unloads[0]
+    assert sorted(bucket.deleted) == [
+        'migration/public/events/0000_part',
+        'migration/public/events/manifest',
+        'migration/sales/orders/0000_part',
+        'migration/sales/orders/manifest']
+
+
+def test_migrate_tables_refuses_existing(monkeypatch, fake_shift):
+    monkeypatch.setattr('shiftmanager.Redshift.table_exists',
+                        lambda self, table, schema: True)
+    results = fake_shift.migrate_tables(fake_shift, ['events'], 'bukkit',
+                                        'migration')
+    assert isinstance(results[0].error, ValueError)
+
+
+def test_migrate_tables_quotes_schemas(monkeypatch, fake_shift,
+                                       fake_connections):
+    conn = FakeConnection()
+    fake_connections.append(conn)
+    monkeypatch.setattr('shiftmanager.Redshift.table_exists',
+                        lambda self, table, schema: True)
+    fake_shift.migrate_tables(fake_shift, ['Sales.orders'], 'bukkit',
+                              'migration')
+    assert conn.statements[0] == 'CREATE SCHEMA IF NOT EXISTS "Sales"'
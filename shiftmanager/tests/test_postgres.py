@@ -162,3 +162,49 @@ def test_aws_security_token(postgres, tmpdir):
     creds = ("credentials 'aws_access_key_id=access_key;"
              "aws_secret_access_key=secret_key;token=sec_token'")
     assert split_statement[2] == creds
+
+
+def test_copy_table_to_postgres(fake_shift, fake_connections):
+    from mock import MagicMock
+    from conftest import FakeConnection
+    from test_unload import FakeBucket, gzipped
+
+    pg = FakeConnection(results={
+        'pg_get_userbyid': [('ops', '=r/ops\nloader=arwdDxt/ops')]})
+    redshift = FakeConnection()
+    workers = [FakeConnection(), FakeConnection()]
+    fake_connections.extend([pg, redshift] + workers)
+    bucket = FakeBucket({
+        'tmp/events/manifest': (
+            b'{"entries": [{"url": "s3://bukkit/tmp/events/0000_part_00"},'
+            b' {"url": "s3://bukkit/tmp/events/0001_part_00"}]}'),
+        'tmp/events/0000_part_00': gzipped('1,a\n'),
+        'tmp/events/0001_part_00': gzipped('2,\\N\n'),
+    })
+    fake_shift.s3_conn = MagicMock()
+    fake_shift.s3_conn.get_bucket.return_value = bucket
+    fake_shift._fetchall = lambda query, parameters=None: []
+    fake_shift.create_pg_connection(database='ops')
+
+    fake_shift.copy_table_to_postgres('events', 'reports.events', 'bukkit',
+                                      'tmp', col_str='id, name')
+    assert "FORMAT AS CSV" in redshift.statements[0]
+    assert pg.statements[0] == \
+        'CREATE TABLE reports.events$incoming (LIKE reports.events ' \
+        'INCLUDING ALL)'
+    copied = workers[0].copied + workers[1].copied
+    assert sorted(copied) == [b'1,a\n', b'2,\\N\n']
+    assert workers[0].statements[0] == (
+        "COPY reports.events$incoming (id, name) FROM STDIN "
+        "WITH (FORMAT csv, NULL '\\N')")
+    assert workers[0].closed
+    assert pg.statements[-1] == (
+        'ALTER TABLE reports.events RENAME TO events$outgoing;\n'
+        'ALTER TABLE reports.events$incoming RENAME TO events;\n'
+        'ALTER TABLE reports.events OWNER TO ops;\n'
+        'GRANT SELECT ON reports.events TO PUBLIC;\n'
+        'GRANT INSERT, SELECT, UPDATE, DELETE, TRUNCATE, REFERENCES, '
+        'TRIGGER ON reports.events TO loader;\n'
+        'DROP TABLE reports.events$outgoing;\n'
+        'ANALYZE reports.events;')
+    assert len(bucket.deleted) == 3
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests for the Redshift class's connection and transaction handling.
+
+Test Runner: PyTest
+"""
+
+import pytest
+
+from conftest import FakeConnection
+
+
+def test_execute_commits_each_batch(fake_shift):
+    fake_shift.execute("SELECT 1")
+    fake_shift.execute("SELECT 2")
+    assert fake_shift.connection.commits == 2
+
+
+def test_transaction_groups_statements(fake_shift):
+    conn = fake_shift.connection
+    with fake_shift.transaction():
+        fake_shift.execute("SELECT 1")
+        fake_shift.alter_user("chad", createdb=False, execute=True)
+        with fake_shift.transaction():
+            fake_shift.execute("SELECT 2")
+        assert conn.commits == 0
+    assert conn.commits == 1
+    assert conn.statements == ["SELECT 1", "ALTER USER chad NOCREATEDB",
+                               "SELECT 2"]
+
+    # The block is over, so statements commit individually again
+    fake_shift.execute("SELECT 3")
+    assert conn.commits == 2
+
+
+def test_transaction_rolls_back(fake_shift):
+    conn = fake_shift.connection
+    with pytest.raises(RuntimeError):
+        with fake_shift.transaction():
+            fake_shift.execute("SELECT 1")
+            raise RuntimeError("boom")
+    assert conn.commits == 0
+    assert conn.rollbacks == 1
+
+
+def test_autocommit(fake_shift, fake_connections):
+    fake_connections.append(FakeConnection())
+    conn = fake_shift.connection
+    with fake_shift.autocommit():
+        assert conn.autocommit
+        fake_shift.execute("VACUUM my_table")
+        with pytest.raises(ValueError):
+            with fake_shift.transaction():
+                pass
+    assert not conn.autocommit
+    assert conn.statements == ["VACUUM my_table"]
+    assert conn.commits == 0
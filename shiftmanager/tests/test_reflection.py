@@ -145,3 +145,68 @@ def test_identity(shift, identity_table):
     DROP TABLE my_identity_table$outgoing;
     """
     assert(cleaned(statement) == cleaned(expected))
+
+
+def test_append_falls_back_to_insert(shift, table):
+    statement = shift.deep_copy(table, distinct=True, use_append=True,
+                                copy_privileges=False, analyze=False)
+    assert 'INSERT INTO my_table' in statement
+    assert 'APPEND' not in statement
+
+
+def test_append(fake_shift, table, monkeypatch):
+    import psycopg2
+
+    monkeypatch.setattr('shiftmanager.Redshift._append_blocker',
+                        lambda self, table, rewrite_requested: None)
+    conn = fake_shift.connection
+    statement = fake_shift.deep_copy(table, use_append=True,
+                                     copy_privileges=False, execute=True)
+    expected = """
+    ALTER TABLE my_table RENAME TO my_table$outgoing;
+    CREATE TABLE my_table (
+    col1 INTEGER
+    );
+
+    ALTER TABLE my_table APPEND FROM my_table$outgoing;
+
+    DROP TABLE my_table$outgoing;
+    ANALYZE my_table;
+    """
+    assert cleaned(statement) == cleaned(expected)
+    assert len(conn.statements) == 5
+    assert conn.commits == 0
+
+    # The original table is restored if the append fails
+    conn.statements[:] = []
+    execute = fake_shift.execute
+
+    def failing_append(batch, *args, **kwargs):
+        if 'APPEND' in batch:
+            raise psycopg2.InternalError("columns don't match")
+        execute(batch, *args, **kwargs)
+
+    fake_shift.execute = failing_append
+    with pytest.raises(psycopg2.InternalError):
+        fake_shift.deep_copy(table, use_append=True,
+                             copy_privileges=False, execute=True)
+    assert conn.statements[-2:] == [
+        'DROP TABLE IF EXISTS my_table',
+        'ALTER TABLE my_table$outgoing RENAME TO my_table']
+
+    # ...and if recreating the table fails
+    conn.statements[:] = []
+
+    def failing_create(batch, *args, **kwargs):
+        if 'CREATE TABLE' in batch:
+            raise psycopg2.ProgrammingError("permission denied")
+        execute(batch, *args, **kwargs)
+
+    fake_shift.execute = failing_create
+    with pytest.raises(psycopg2.ProgrammingError):
+        fake_shift.deep_copy(table, use_append=True,
+                             copy_privileges=False, execute=True)
+    assert conn.statements == [
+        'ALTER TABLE my_table RENAME TO my_table$outgoing',
+        'DROP TABLE IF EXISTS my_table',
+        'ALTER TABLE my_table$outgoing RENAME TO my_table']
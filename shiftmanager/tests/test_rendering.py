@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests for local SQL rendering.
+
+Test Runner: PyTest
+"""
+
+import datetime
+import decimal
+
+import pytest
+
+from shiftmanager import rendering
+
+
+def test_quote_strings():
+    assert rendering.quote_literal("plain") == "'plain'"
+    assert rendering.quote_literal("it's") == "'it''s'"
+    assert rendering.quote_literal("back\\slash") == "'back\\\\slash'"
+    assert rendering.quote_literal(b"bytes") == "'bytes'"
+    assert rendering.quote_literal(u"caf\xe9") == u"'caf\xe9'"
+    with pytest.raises(ValueError):
+        rendering.quote_literal("nul\x00")
+
+
+def test_quote_other_types():
+    assert rendering.quote_literal(None) == "NULL"
+    assert rendering.quote_literal(False) == "false"
+    assert rendering.quote_literal(42) == "42"
+    assert rendering.quote_literal(decimal.Decimal('1.50')) == "1.50"
+    assert (rendering.quote_literal(datetime.date(2015, 1, 1)) ==
+            "'2015-01-01'::date")
+    assert rendering.quote_literal(('a', 'b')) == "('a', 'b')"
+
+
+def test_render():
+    assert (rendering.render("SELECT %s, %s", ('a', 1)) ==
+            "SELECT 'a', 1")
+    assert (rendering.render("SELECT %(x)s, %%", {'x': 'y'}) ==
+            "SELECT 'y', %")
+    assert rendering.render("SELECT '%'") == "SELECT '%'"
+
+
+def test_mogrify_needs_no_connection(monkeypatch):
+    import shiftmanager.redshift as rs
+
+    def no_connection(self):
+        raise AssertionError("mogrify should not connect")
+
+    monkeypatch.setattr('shiftmanager.Redshift.connection',
+                        property(no_connection))
+    shift = rs.Redshift("", "", "", "",
+                        aws_access_key_id="access_key",
+                        aws_secret_access_key="secret_key")
+    statement = shift.alter_user("swiper", password="swiper's pass")
+    assert statement == "ALTER USER swiper PASSWORD 'swiper''s pass'"
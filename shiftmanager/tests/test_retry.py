@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests for retrying transient transaction failures.
+
+Test Runner: PyTest
+"""
+
+import psycopg2
+import pytest
+
+from shiftmanager.retry import RetryPolicy
+
+SERIALIZATION_ERROR = psycopg2.InternalError(
+    "1023\nDETAIL:  Serializable isolation violation on table - 100")
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    delays = []
+    monkeypatch.setattr('time.sleep', delays.append)
+    return delays
+
+
+def failing(errors):
+    """Return a function raising each of *errors* in turn, then succeeding"""
+    errors = list(errors)
+    calls = []
+
+    def func():
+        calls.append(1)
+        if errors:
+            raise errors.pop(0)
+        return len(calls)
+    return func
+
+
+def test_retries_serialization_errors(no_sleep):
+    policy = RetryPolicy(max_attempts=3, base_delay=2, max_delay=3)
+    func = failing([SERIALIZATION_ERROR, SERIALIZATION_ERROR])
+    assert policy.run(func) == 3
+    assert len(no_sleep) == 2
+    assert 0 <= no_sleep[0] <= 2
+    assert 0 <= no_sleep[1] <= 3
+
+
+def test_gives_up(no_sleep):
+    policy = RetryPolicy(max_attempts=2)
+    func = failing([SERIALIZATION_ERROR] * 2)
+    with pytest.raises(psycopg2.InternalError):
+        policy.run(func)
+    assert len(no_sleep) == 1
+
+    func = failing([psycopg2.ProgrammingError("syntax error")])
+    with pytest.raises(psycopg2.ProgrammingError):
+        policy.run(func)
+    assert len(no_sleep) == 1
+
+    policy = RetryPolicy(retry_serialization=False)
+    with pytest.raises(psycopg2.InternalError):
+        policy.run(failing([SERIALIZATION_ERROR]))
+
+
+def test_execute_reconnects(fake_shift, fake_connections, no_sleep):
+    from conftest import FakeConnection
+
+    first = FakeConnection(
+        error=psycopg2.OperationalError("server closed the connection"))
+    second = FakeConnection()
+    fake_connections.extend([first, second])
+    fake_shift.retry_policy = RetryPolicy(max_attempts=2)
+
+    fake_shift.execute("SELECT 1")
+    assert first.closed
+    assert second.statements == ["SELECT 1"]
+    assert second.commits == 1
+    assert len(no_sleep) == 1
+
+
+def test_only_lost_connections_are_disconnects(no_sleep):
+    policy = RetryPolicy(max_attempts=3)
+    disk_full = psycopg2.OperationalError("Disk Full")
+    with pytest.raises(psycopg2.OperationalError):
+        policy.run(failing([disk_full]))
+    assert no_sleep == []
+
+    lost = psycopg2.OperationalError("SSL SYSCALL error: EOF detected")
+    assert policy.run(failing([lost])) == 2
+
+
+def test_writes_not_replayed_after_disconnect(fake_shift, fake_connections,
+                                              no_sleep):
+    from conftest import FakeConnection
+
+    lost = psycopg2.OperationalError("server closed the connection")
+    first = FakeConnection(error=lost)
+    second = FakeConnection()
+    fake_connections.extend([first, second])
+    fake_shift.retry_policy = RetryPolicy(max_attempts=2)
+    with pytest.raises(psycopg2.OperationalError):
+        fake_shift.execute("INSERT INTO events SELECT * FROM staging")
+    assert no_sleep == []
+
+    fake_shift.retry_policy = RetryPolicy(max_attempts=2, replay_writes=True)
+    fake_shift.execute("INSERT INTO events SELECT * FROM staging")
+    assert first.closed
+    assert second.statements == ["INSERT INTO events SELECT * FROM staging"]
@@ -35,7 +35,8 @@ class SqlTextMatcher(object):
 def assert_execute(shift, expected):
     """Helper for asserting an executed SQL statement on mock connection"""
     assert shift.execute.called
-    shift.execute.assert_called_with(SqlTextMatcher(expected))
+    shift.execute.assert_called_with(SqlTextMatcher(expected),
+                                     retry_policy=None)
 
 
 def test_connection_with_security_token(shift):
@@ -240,3 +241,22 @@ def test_unload_table_to_s3(shift):
 
     shift.unload_table_to_s3(bucket, keypath, table)
     assert_execute(shift, expected)
+
+
+def test_unload_table_to_s3_native_format(shift):
+    shift.unload_table_to_s3('com.simple.mock', 'tmp/tests/', 'foo_table',
+                             file_format='parquet', max_file_size=256)
+    expected = """
+    UNLOAD ($$SELECT * FROM public.foo_table$$)
+    TO 's3://com.simple.mock/tmp/tests/foo_table/'
+    CREDENTIALS '{creds}'
+    MANIFEST FORMAT AS PARQUET MAXFILESIZE 256 MB ALLOWOVERWRITE;
+    """.format(creds="aws_access_key_id=access_key;"
+                     "aws_secret_access_key=secret_key;"
+                     "token=security_token")
+    assert_execute(shift, expected)
+
+    with pytest.raises(ValueError):
+        shift.unload_table_to_s3('com.simple.mock', 'tmp/tests/',
+                                 'foo_table', file_format='parquet',
+                                 compression='gzip')
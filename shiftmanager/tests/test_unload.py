@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests for reading unloaded data back in parallel.
+
+Test Runner: PyTest
+"""
+
+import gzip
+import io
+import json
+import threading
+
+import pytest
+
+from shiftmanager import queries, unload
+
+
+def gzipped(text):
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+        f.write(text.encode('utf-8'))
+    return buf.getvalue()
+
+
+def chunked(data, size=7):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def test_read_parts():
+    parts = {
+        'a': gzipped('1,x\n2,\\N\n3,"multi\nline"\n'),
+        'b': gzipped('4,y\n'),
+        'c': gzipped(''),
+    }
+    batches = list(unload.read_parts(lambda part: chunked(parts[part]),
+                                     sorted(parts), max_workers=2,
+                                     batch_size=2, converters=[int, None]))
+    assert sorted(len(batch) for batch in batches) == [1, 1, 2]
+    assert sorted(row for batch in batches for row in batch) == [
+        (1, 'x'), (2, None), (3, 'multi\nline'), (4, 'y')]
+
+
+def test_read_parts_bounds_pending_batches():
+    data = gzipped(''.join('%d\n' % i for i in range(1000)))
+    produced = []
+    lock = threading.Lock()
+
+    def open_part(part):
+        for chunk in chunked(data, 50):
+            with lock:
+                produced.append(part)
+            yield chunk
+
+    batches = unload.read_parts(open_part, range(4), max_workers=2,
+                                batch_size=10, max_pending=2)
+    next(batches)
+    batches.close()
+    # The workers stopped early rather than reading every part
+    assert len(produced) < 4 * len(chunked(data, 50))
+
+
+def test_read_parts_raises_worker_errors():
+    def open_part(part):
+        raise IOError("connection reset")
+
+    with pytest.raises(IOError):
+        list(unload.read_parts(open_part, ['a', 'b']))
+
+
+class FakeKey(object):
+
+    def __init__(self, data):
+        self.data = io.BytesIO(data)
+
+    def read(self, size):
+        return self.data.read(size)
+
+    def get_contents_as_string(self):
+        return self.data.getvalue()
+
+    def close(self):
+        pass
+
+
+class FakeBucket(object):
+
+    def __init__(self, keys=None):
+        self.keys = keys or {}
+        self.deleted = []
+
+    def get_key(self, name):
+        if name not in self.keys:
+            return None
+        return FakeKey(self.keys[name])
+
+    def new_key(self, name):
+        bucket = self
+
+        class NewKey(object):
+            def set_contents_from_string(self, data):
+                if not isinstance(data, bytes):
+                    data = data.encode('utf-8')
+                bucket.keys[name] = data
+        return NewKey()
+
+    def delete_keys(self, names):
+        self.deleted += names
+
+
+def test_iter_table_unloads_large_tables(shift):
+    def fetchall(query, parameters=None):
+        if query == queries.table_stats:
+            return [(900, 1000000, None)]
+        return []
+
+    shift._fetchall = fetchall
+    bucket = FakeBucket({
+        'tmp/foo_table/manifest': json.dumps({'entries': [
+            {'url': 's3://bukkit/tmp/foo_table/0000_part_00.gz'},
+            {'url': 's3://bukkit/tmp/foo_table/0001_part_00.gz'},
+        ]}).encode('utf-8'),
+        'tmp/foo_table/0000_part_00.gz': gzipped('t,1.50,a\n'),
+        'tmp/foo_table/0001_part_00.gz': gzipped('\\N,2.00,\\N\n'),
+    })
+    shift.s3_conn.get_bucket = lambda name: bucket
+
+    batches = list(shift.iter_table('foo_table', 'bukkit', 'tmp',
+                                    columnar=True))
+    statement = shift.execute.call_args[0][0]
+    assert "NULL AS '\\N' FORMAT AS CSV" in statement
+    assert "s3://bukkit/tmp/foo_table/" in statement
+    columns = dict((name, []) for name in ['foo', 'bar', 'baz'])
+    for batch in batches:
+        for name, values in batch.items():
+            columns[name] += values
+    assert sorted(columns['foo'], key=str) == [None, True]
+    assert sorted(str(value) for value in columns['bar']) == \
+        ['1.50', '2.00']
+    assert len(bucket.deleted) == 3
+
+
+def test_iter_table_queries_small_tables(shift):
+    def fetchall(query, parameters=None):
+        if query == queries.table_stats:
+            return [(1, 2, None)]
+        assert query == "SELECT foo, baz FROM public.foo_table"
+        return [(True, 'a'), (False, 'b')]
+
+    shift._fetchall = fetchall
+    assert list(shift.iter_table('foo_table', col_str='foo, baz')) == [
+        (True, 'a'), (False, 'b')]
+    assert not shift.execute.called
+
+
+def test_iter_table_sizes_views_with_explain(shift):
+    plan = ['XN Subquery Scan foo_view  (cost=0.00..9.00 rows=500 width=8)']
+
+    def fetchall(query, parameters=None):
+        if query == queries.catalog_relations:
+            return [('public', 'foo_view', 'v', None)]
+        if query.startswith('EXPLAIN'):
+            assert query == "EXPLAIN SELECT * FROM public.foo_view"
+            return [(line,) for line in plan]
+        if query == "SELECT * FROM public.foo_view":
+            return [(True, 1, 'a')]
+        return []
+
+    shift._fetchall = fetchall
+    assert list(shift.iter_table('foo_view', cursor_max_rows=1000)) == [
+        (True, 1, 'a')]
+
+    plan[0] = plan[0].replace('rows=500', 'rows=5000')
+    with pytest.raises(ValueError):
+        list(shift.iter_table('foo_view', cursor_max_rows=1000))
+
+
+def test_unload_table_ranges(shift):
+    fingerprints = [[(0, 10, '2016-01-01'), (1, 10, '2016-01-01'),
+                     (2, 5, '2016-01-01')]]
+
+    def fetchall(query, parameters=None):
+        if query == queries.table_stats:
+            return [(900, 1000000, 'id')]
+        if 'NTILE(3)' in query:
+            return [(1,), (50,), (90,)]
+        if query.startswith('SELECT CASE'):
+            return fingerprints[0]
+        return []
+
+    bucket = FakeBucket()
+    shift._fetchall = fetchall
+    shift.s3_conn.get_bucket = lambda name: bucket
+
+    state = shift.unload_table_ranges('bukkit', 'tmp', 'foo_table',
+                                      ranges=3, change_column='updated_at',
+                                      file_format='parquet', max_workers=2)
+    assert state['unloaded'] == [0, 1, 2, 3]
+    statements = sorted(call[0][0] for call in shift.execute.call_args_list)
+    assert len(statements) == 4
+    assert 'SELECT * FROM public.foo_table WHERE id >= 50 AND ' \
+        'id < 90$$' in statements[1]
+    assert "TO 's3://bukkit/tmp/foo_table/range=0001/'" in statements[1]
+    # Re-unloading a range must not leave its earlier parts behind
+    assert 'CLEANPATH' in statements[1]
+    assert 'ALLOWOVERWRITE' not in statements[1]
+    saved = json.loads(bucket.keys['tmp/foo_table/ranges.json']
+                       .decode('utf-8'))
+    assert saved['bounds'] == ['1', '50', '90']
+    assert saved['ranges'][3]['fingerprint'] == [0, None]
+
+    # Only the range that changed is unloaded again
+    shift.execute.reset_mock()
+    fingerprints[0] = [(0, 10, '2016-01-01'), (1, 10, '2016-01-02'),
+                       (2, 5, '2016-01-01')]
+    state = shift.unload_table_ranges('bukkit', 'tmp', 'foo_table',
+                                      ranges=3, change_column='updated_at',
+                                      file_format='parquet')
+    assert state['unloaded'] == [1]
+    assert shift.execute.call_count == 1
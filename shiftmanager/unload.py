@@ -0,0 +1,440 @@
+"""
+Helpers for building UNLOAD statements and reading their output back.
+
+Redshift can write UNLOAD output as delimited text, CSV, JSON or Parquet.
+The native formats are produced by the compute nodes directly, whereas
+JSON built up in SQL from string concatenation is one large expression
+per column that the leader node must compile and every row must
+evaluate, which is slow for wide tables.
+
+Unloaded CSV parts can be read back in parallel with `read_parts`, which
+streams each part through decompression and parsing in a worker thread
+rather than downloading whole files first.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import codecs
+import csv
+import datetime
+from decimal import Decimal
+import json
+import re
+import threading
+import zlib
+
+try:
+    from queue import Empty, Full, Queue
+except ImportError:
+    from Queue import Empty, Full, Queue
+
+try:
+    integer_types = (int, long)  # noqa: F821
+except NameError:
+    integer_types = (int,)
+
+if bytes is str:
+    # Python 2's csv module only reads byte strings
+    def _csv_reader(lines):
+        lines = (line.encode('utf-8') if isinstance(line, unicode)  # noqa
+                 else line for line in lines)
+        for row in csv.reader(lines):
+            yield [value.decode('utf-8') for value in row]
+else:
+    _csv_reader = csv.reader
+
+#: What `read_parts` expects NULLs to have been unloaded as
+NULL_MARKER = '\\N'
+
+#: File formats `unload_options` accepts; None is Redshift's default of
+#: pipe-delimited text.
+FORMATS = ('csv', 'json', 'parquet')
+
+#: Compression options UNLOAD accepts for formats other than Parquet,
+#: which is always compressed with Snappy.
+COMPRESSIONS = ('gzip', 'bzip2', 'zstd')
+
+
+def unload_options(file_format=None, compression=None, max_file_size=None,
+                   options=None, partition_by=None, clean_path=False):
+    """
+    Return the options clause of an UNLOAD statement.
+
+    Parameters
+    ----------
+    file_format : str or None
+        One of `FORMATS`, or None for pipe-delimited text
+    compression : str, False or None
+        One of `COMPRESSIONS`, False for none, or None for GZIP unless
+        *file_format* is 'parquet'
+    max_file_size : int, str or None
+        Largest file to write, as a number of MB or a string like '1 GB'
+    options : str or None
+        Replaces the default 'MANIFEST <compression> ALLOWOVERWRITE';
+        the file format, maximum file size and partitioning are still added
+    partition_by : str, list or None
+        Columns to partition the output by
+    clean_path : bool
+        Delete everything under the destination prefix before writing,
+        with CLEANPATH, rather than overwriting same-named files
+
+    >>> print(unload_options())
+    MANIFEST GZIP ALLOWOVERWRITE
+    >>> print(unload_options(clean_path=True))
+    MANIFEST GZIP CLEANPATH
+    >>> print(unload_options('parquet', max_file_size=256))
+    MANIFEST FORMAT AS PARQUET MAXFILESIZE 256 MB ALLOWOVERWRITE
+    >>> print(unload_options('csv', compression='zstd',
+    ...                      max_file_size='1 GB'))
+    MANIFEST FORMAT AS CSV ZSTD MAXFILESIZE 1 GB ALLOWOVERWRITE
+    >>> print(unload_options('parquet', partition_by=['year', 'month']))
+    MANIFEST FORMAT AS PARQUET PARTITION BY (year, month) ALLOWOVERWRITE
+    """
+    if file_format is not None and file_format.lower() not in FORMATS:
+        raise ValueError("file_format must be one of %s, not %r"
+                         % (', '.join(FORMATS), file_format))
+    parquet = file_format is not None and file_format.lower() == 'parquet'
+    if compression is None:
+        compression = False if parquet else 'gzip'
+    if compression and parquet:
+        raise ValueError("Parquet files are always compressed with Snappy; "
+                         "compression can't be set")
+    if compression and compression.lower() not in COMPRESSIONS:
+        raise ValueError("compression must be one of %s, not %r"
+                         % (', '.join(COMPRESSIONS), compression))
+    if isinstance(max_file_size, integer_types):
+        max_file_size = '%d MB' % max_file_size
+
+    extra = []
+    if file_format:
+        extra.append('FORMAT AS %s' % file_format.upper())
+    if compression and options is None:
+        extra.append(compression.upper())
+    if max_file_size:
+        extra.append('MAXFILESIZE %s' % max_file_size)
+    if partition_by:
+        if not isinstance(partition_by, (list, tuple)):
+            partition_by = [partition_by]
+        extra.append('PARTITION BY (%s)' % ', '.join(partition_by))
+    if options is not None:
+        return ' '.join([options] + extra)
+    return ' '.join(['MANIFEST'] + extra +
+                    ['CLEANPATH' if clean_path else 'ALLOWOVERWRITE'])
+
+
+def manifest_urls(manifest):
+    """
+    Return the (bucket, key) of every file listed in an UNLOAD manifest.
+
+    >>> for bucket, key in manifest_urls(
+    ...         b'{"entries": [{"url": "s3://b/tmp/t/0000_part_00"}]}'):
+    ...     print(bucket, key)
+    b tmp/t/0000_part_00
+    """
+    if isinstance(manifest, bytes):
+        manifest = manifest.decode('utf-8')
+    urls = []
+    for entry in json.loads(manifest)['entries']:
+        bucket, key = entry['url'][len('s3://'):].split('/', 1)
+        urls.append((bucket, key))
+    return urls
+
+
+def explained_rows(plan):
+    """
+    Return the number of rows the planner expects a query to return,
+    given the rows of its EXPLAIN output, or None if it doesn't say.
+
+    >>> explained_rows([('XN Seq Scan on events  '
+    ...                  '(cost=0.00..0.20 rows=20 width=12)',)])
+    20
+    """
+    if not plan:
+        return None
+    match = re.search(r'\brows=(\d+)', plan[0][0])
+    return int(match.group(1)) if match else None
+
+
+def manifest_record_count(manifest):
+    """
+    Return the number of rows an UNLOAD wrote, from a manifest written
+    with MANIFEST VERBOSE, or None if the manifest doesn't record it.
+
+    >>> manifest_record_count('{"entries": ['
+    ...     '{"url": "s3://b/t/0000_part_00", "meta": {"record_count": 2}},'
+    ...     '{"url": "s3://b/t/0001_part_00", "meta": {"record_count": 3}}]}')
+    5
+    """
+    if isinstance(manifest, bytes):
+        manifest = manifest.decode('utf-8')
+    manifest = json.loads(manifest)
+    meta = manifest.get('meta') or {}
+    if 'record_count' in meta:
+        return meta['record_count']
+    counts = [(entry.get('meta') or {}).get('record_count')
+              for entry in manifest['entries']]
+    if None in counts:
+        return None
+    return sum(counts)
+
+
+def gunzip_chunks(chunks):
+    """
+    Decompress an iterable of gzip-compressed byte chunks as they arrive,
+    yielding decompressed byte chunks.
+
+    Files made of several gzip members, as written by some tools,
+    are decompressed one member after another.
+
+    >>> import gzip, io
+    >>> buf = io.BytesIO()
+    >>> with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+    ...     _ = f.write(b'a,b\\n')
+    >>> data = buf.getvalue()
+    >>> b''.join(gunzip_chunks([data[:5], data[5:]])) == b'a,b\\n'
+    True
+    """
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        while chunk:
+            data = decompressor.decompress(chunk)
+            if data:
+                yield data
+            chunk = decompressor.unused_data
+            if chunk:
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    data = decompressor.flush()
+    if data:
+        yield data
+
+
+def iter_lines(chunks, encoding='utf-8'):
+    """
+    Yield the lines, with their line endings, of text arriving as an
+    iterable of byte *chunks*.
+
+    >>> print('|'.join(iter_lines([b'ab\\nc', b'd\\n', b'e'])))
+    ab
+    |cd
+    |e
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    pending = ''
+    for chunk in chunks:
+        pending += decoder.decode(chunk)
+        lines = pending.split('\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line + '\n'
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending
+
+
+def _parse_timestamp(value):
+    fmt = '%Y-%m-%d %H:%M:%S.%f' if '.' in value else '%Y-%m-%d %H:%M:%S'
+    return datetime.datetime.strptime(value, fmt)
+
+
+def _parse_date(value):
+    return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+
+
+_CONVERTERS = {
+    'smallint': int,
+    'integer': int,
+    'bigint': int,
+    'real': float,
+    'double precision': float,
+    'numeric': Decimal,
+    'boolean': lambda value: value in ('t', 'true', '1'),
+    'date': _parse_date,
+    'timestamp without time zone': _parse_timestamp,
+}
+
+
+def column_converter(col_type):
+    """
+    Return a function converting an unloaded value of a column of type
+    *col_type* into the Python value a cursor would have returned, or
+    None if it's best left as a string.
+
+    >>> column_converter('bigint')('42')
+    42
+    >>> column_converter('numeric(18,2)')('1.50')
+    Decimal('1.50')
+    >>> column_converter('timestamp without time zone')(
+    ...     '2016-01-02 03:04:05.5')
+    datetime.datetime(2016, 1, 2, 3, 4, 5, 500000)
+    >>> column_converter('character varying(256)') is None
+    True
+    """
+    return _CONVERTERS.get(col_type.split('(')[0])
+
+
+def parse_csv(lines, converters=None):
+    """
+    Yield rows as tuples from CSV *lines*, with `NULL_MARKER` as None
+    and other values passed through the matching function in
+    *converters*, if any.
+
+    >>> list(parse_csv(['1,"a ""b"" c",\\\\N\\n', '2,"c\\n', 'd",\\n'])) == [
+    ...     ('1', 'a "b" c', None), ('2', 'c\\nd', '')]
+    True
+    >>> list(parse_csv(['caf\\xe9,1\\n'])) == [('caf\\xe9', '1')]
+    True
+    """
+    for row in _csv_reader(lines):
+        if converters:
+            yield tuple(None if value == NULL_MARKER
+                        else convert(value) if convert else value
+                        for value, convert in zip(row, converters))
+        else:
+            yield tuple(None if value == NULL_MARKER else value
+                        for value in row)
+
+
+class ChunkReader(object):
+    """
+    A read-only file-like object over an iterable of byte chunks, for
+    handing streamed data to APIs like ``cursor.copy_expert``.
+
+    >>> reader = ChunkReader([b'abc', b'de', b'f'])
+    >>> reader.read(4) == b'abcd', reader.read() == b'ef', reader.read() == b''
+    (True, True, True)
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b''
+
+    def read(self, size=-1):
+        while size is None or size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._chunks)
+            except StopIteration:
+                break
+        if size is None or size < 0:
+            data, self._buffer = self._buffer, b''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+class _Failure(object):
+
+    def __init__(self, error):
+        self.error = error
+
+
+def read_parts(open_part, parts, max_workers=4, batch_size=10000,
+               max_pending=None, converters=None):
+    """
+    Yield lists of rows parsed from gzipped CSV *parts*, downloading,
+    decompressing and parsing up to *max_workers* parts at once in
+    worker threads.
+
+    At most *max_pending* batches wait to be consumed at any time, so
+    memory use stays bounded however large the parts are. Batches from
+    different parts are interleaved, so rows come in no particular order.
+    If the consumer stops early, the workers stop after their current
+    chunk.
+
+    Parameters
+    ----------
+    open_part : callable
+        Called with an item of *parts* and returning an iterable of
+        gzip-compressed byte chunks
+    parts : iterable
+        Parts to read, such as the (bucket, key) pairs from `manifest_urls`
+    max_workers : int
+        Number of parts to read at once
+    batch_size : int
+        Number of rows in each yielded list, except the last of each part
+    max_pending : int or None
+        Number of batches that may wait to be consumed;
+        defaults to twice *max_workers*
+    converters : list or None
+        Passed to `parse_csv`
+    """
+    remaining = Queue()
+    for part in parts:
+        remaining.put(part)
+    batches = Queue(maxsize=max_pending or 2 * max_workers)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def worker():
+        try:
+            while not stop.is_set():
+                try:
+                    part = remaining.get_nowait()
+                except Empty:
+                    return
+                batch = []
+                lines = iter_lines(gunzip_chunks(open_part(part)))
+                for row in parse_csv(lines, converters):
+                    batch.append(row)
+                    if len(batch) >= batch_size:
+                        if not put(batch):
+                            return
+                        batch = []
+                if batch and not put(batch):
+                    return
+        except Exception as e:
+            put(_Failure(e))
+        finally:
+            put(done)
+
+    threads = [threading.Thread(target=worker)
+               for _ in range(max(1, max_workers))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    running = len(threads)
+    try:
+        while running:
+            item = batches.get()
+            if item is done:
+                running -= 1
+            elif isinstance(item, _Failure):
+                raise item.error
+            else:
+                yield item
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+def fingerprint_query(table, conditions, change_column=None, where=None):
+    """
+    Return a query for the number of rows in each range of *table*
+    selected by *conditions*, by index, along with the greatest value of
+    *change_column* in each, if given.
+
+    >>> print(fingerprint_query('public.events', ['"id" < 50', '"id" >= 50'],
+    ...                         '"updated_at"', where="kind = 'click'"))
+    SELECT CASE WHEN "id" < 50 THEN 0 WHEN "id" >= 50 THEN 1 END,
+           COUNT(*), MAX("updated_at")
+    FROM public.events
+    WHERE kind = 'click'
+    GROUP BY 1;
+    """
+    cases = ' '.join('WHEN %s THEN %d' % (condition, i)
+                     for i, condition in enumerate(conditions))
+    query = ("SELECT CASE %s END,\n       COUNT(*), MAX(%s)\nFROM %s\n"
+             % (cases, change_column or 'NULL', table))
+    if where:
+        query += "WHERE %s\n" % where
+    return query + "GROUP BY 1;"
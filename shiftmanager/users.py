@@ -0,0 +1,298 @@
+"""
+Reconciling a cluster's users and groups with a desired state.
+
+The current users, their settings and their group memberships are read
+in two queries against pg_user and pg_group, compared with a spec of
+what they should be, and turned into the smallest batch of statements
+that makes them match: users and groups are only created, altered or
+dropped where they differ, and membership changes are collected into a
+single ALTER GROUP per group.
+
+A spec maps each user name to a dict of any of these keys, each of which
+is only reconciled if given:
+
+``createdb``, ``createuser`` : bool
+    Whether the user may create databases or is a superuser
+``valid_until`` : str or datetime
+    When the user's password expires, or 'infinity'
+``groups`` : list of str
+    Exactly the groups the user belongs to
+``config`` : dict
+    Exactly the configuration parameters set for the user
+``password`` : str
+    Only used when creating the user; without one, the user is created
+    with PASSWORD DISABLE
+
+Redshift stores user and group names in lower case, so names in a spec
+are lower-cased before they're compared with the cluster's.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+from collections import namedtuple
+
+from shiftmanager.rendering import quote_identifier, quote_literal
+
+# Configuration parameters whose values are comma-separated lists
+LIST_PARAMETERS = frozenset(['search_path'])
+
+#: A user as found on the cluster; *groups* is a frozenset of group names
+#: and *config* a dict of configuration parameters.
+UserState = namedtuple('UserState', [
+    'name', 'createdb', 'createuser', 'valid_until', 'groups', 'config'])
+
+
+def normalize_time(value):
+    """
+    Return a timestamp as a 'YYYY-MM-DD HH:MM:SS' string for comparison.
+
+    >>> print(normalize_time('2017-01-01'))
+    2017-01-01 00:00:00
+    >>> print(normalize_time('2017-01-01 12:30:00+00'))
+    2017-01-01 12:30:00
+    >>> print(normalize_time(None))
+    None
+    """
+    if value is None:
+        return None
+    text = str(value)
+    if 'infinity' in text:
+        return 'infinity'
+    if len(text) == 10:
+        text += ' 00:00:00'
+    return text[:19]
+
+
+def current_state(user_rows, group_rows):
+    """
+    Return a dict mapping user names to `UserState`, and a set of
+    group names.
+
+    Parameters
+    ----------
+    user_rows : iterable
+        Rows of (name, usesysid, createdb, superuser, valid_until,
+        config) as returned by the ``users`` query
+    group_rows : iterable
+        Rows of (name, member usesysids) as returned by the ``groups`` query
+    """
+    user_rows = list(user_rows)
+    names_by_id = dict((row[1], row[0]) for row in user_rows)
+    groups_by_user = {}
+    group_names = set()
+    for group, members in group_rows:
+        group_names.add(group)
+        for member in members or ():
+            if member in names_by_id:
+                groups_by_user.setdefault(names_by_id[member],
+                                          set()).add(group)
+    users = {}
+    for name, _, createdb, superuser, valid_until, config in user_rows:
+        settings = dict(entry.split('=', 1) for entry in config or ())
+        users[name] = UserState(
+            name=name, createdb=bool(createdb), createuser=bool(superuser),
+            valid_until=normalize_time(valid_until),
+            groups=frozenset(groups_by_user.get(name, ())), config=settings)
+    return users, group_names
+
+
+def _create_user(name, spec):
+    statement = "CREATE USER %s" % quote_identifier(name)
+    if spec.get('createdb'):
+        statement += " CREATEDB"
+    if spec.get('createuser'):
+        statement += " CREATEUSER"
+    if spec.get('password'):
+        statement += " PASSWORD %s" % quote_literal(spec['password'])
+    else:
+        statement += " PASSWORD DISABLE"
+    if spec.get('valid_until'):
+        statement += " VALID UNTIL %s" % quote_literal(
+            str(spec['valid_until']))
+    return statement
+
+
+def _alter_user(name, spec, state):
+    options = []
+    for key, on, off in [('createdb', 'CREATEDB', 'NOCREATEDB'),
+                         ('createuser', 'CREATEUSER', 'NOCREATEUSER')]:
+        wanted = spec.get(key)
+        if wanted is not None and bool(wanted) != getattr(state, key):
+            options.append(on if wanted else off)
+    valid_until = spec.get('valid_until')
+    if valid_until is not None and \
+            normalize_time(valid_until) != state.valid_until:
+        options.append("VALID UNTIL %s" % quote_literal(str(valid_until)))
+    statements = []
+    if options:
+        statements.append("ALTER USER %s %s" % (
+            quote_identifier(name), ' '.join(options)))
+    return statements
+
+
+def _config_elements(param, value):
+    """
+    Return a configuration value as a list of strings, split into its
+    elements for list-valued parameters like search_path.
+
+    >>> _config_elements('search_path', "'$user', public")
+    ['$user', 'public']
+    >>> _config_elements('search_path', ['etl', 'public'])
+    ['etl', 'public']
+    >>> _config_elements('enable_result_cache_for_session', False)
+    ['false']
+    """
+    if isinstance(value, bool):
+        return [str(value).lower()]
+    if param in LIST_PARAMETERS:
+        if not isinstance(value, (list, tuple)):
+            value = str(value).split(',')
+        return [str(v).strip().strip('\'"') for v in value]
+    return [str(value)]
+
+
+def config_value(param, value):
+    """
+    Return *value* rendered for ``ALTER USER ... SET param = value``:
+    numbers and booleans bare, strings as literals, and list-valued
+    parameters as a list of literals.
+
+    >>> print(config_value('timezone', 'America/New_York'))
+    'America/New_York'
+    >>> print(config_value('search_path', "'$user', public"))
+    '$user', 'public'
+    >>> print(config_value('wlm_query_slot_count', 2))
+    2
+    """
+    if isinstance(value, (bool, int, float)):
+        return quote_literal(value)
+    return ', '.join(quote_literal(element)
+                     for element in _config_elements(param, value))
+
+
+def _config_statements(name, wanted, current):
+    statements = []
+    user = quote_identifier(name)
+    for param in sorted(wanted):
+        value = wanted[param]
+        if value is None:
+            continue
+        if param not in current or _config_elements(param, value) != \
+                _config_elements(param, current[param]):
+            statements.append("ALTER USER %s SET %s = %s" %
+                              (user, param, config_value(param, value)))
+    for param in sorted(current):
+        if wanted.get(param) is None:
+            statements.append("ALTER USER %s RESET %s" % (user, param))
+    return statements
+
+
+def _fold_names(desired):
+    """
+    Return *desired* with its user and group names in lower case.
+
+    >>> folded = _fold_names({'Ann': {'groups': ['Analysts']}})
+    >>> for name, spec in folded.items():
+    ...     print(name, *spec['groups'])
+    ann analysts
+    """
+    folded = {}
+    for name, spec in desired.items():
+        if name.lower() in folded:
+            raise ValueError("%s is in the spec more than once, ignoring "
+                             "case" % name)
+        spec = dict(spec)
+        if spec.get('groups') is not None:
+            spec['groups'] = [group.lower() for group in spec['groups']]
+        folded[name.lower()] = spec
+    return folded
+
+
+def reconcile(desired, users, groups, extra_groups=(), drop_users=False,
+              drop_groups=False, ignore=('rdsdb',)):
+    """
+    Return the statements that bring *users* and *groups* in line with
+    the *desired* spec.
+
+    Parameters
+    ----------
+    desired : dict
+        Maps user names to specs, as described in this module's docstring
+    users, groups :
+        As returned by `current_state`
+    extra_groups : iterable of str
+        Groups that must exist even if no user in *desired* belongs to them
+    drop_users : bool
+        Drop users missing from *desired*
+    drop_groups : bool
+        Drop groups that neither *desired* nor *extra_groups* mention
+    ignore : iterable of str
+        Users never to alter or drop, such as the cluster's own
+
+    >>> users, groups = current_state(
+    ...     [('ann', 100, False, False, None, None),
+    ...      ('bob', 101, True, False, None, ['search_path=etl'])],
+    ...     [('analysts', [100, 101])])
+    >>> for s in reconcile({'ann': {'createdb': True,
+    ...                             'groups': ['analysts', 'etl']},
+    ...                     'bob': {'groups': ['etl'], 'config': {}},
+    ...                     'cat': {'groups': ['analysts']}},
+    ...                    users, groups):
+    ...     print(s)
+    CREATE GROUP etl
+    CREATE USER cat PASSWORD DISABLE
+    ALTER USER ann CREATEDB
+    ALTER USER bob RESET search_path
+    ALTER GROUP analysts ADD USER cat
+    ALTER GROUP analysts DROP USER bob
+    ALTER GROUP etl ADD USER ann, bob
+    """
+    desired = _fold_names(desired)
+    ignore = set(name.lower() for name in ignore)
+    wanted_groups = set(group.lower() for group in extra_groups)
+    for spec in desired.values():
+        wanted_groups.update(spec.get('groups') or ())
+
+    create_groups, create_users, alter_users = [], [], []
+    for group in sorted(wanted_groups - set(groups)):
+        create_groups.append("CREATE GROUP %s" % quote_identifier(group))
+
+    adds, drops = {}, {}
+    for name in sorted(desired):
+        if name in ignore:
+            continue
+        spec = desired[name]
+        state = users.get(name)
+        if state is None:
+            create_users.append(_create_user(name, spec))
+            current_groups, current_config = frozenset(), {}
+        else:
+            alter_users += _alter_user(name, spec, state)
+            current_groups, current_config = state.groups, state.config
+        if spec.get('config') is not None:
+            alter_users += _config_statements(name, spec['config'],
+                                              current_config)
+        if spec.get('groups') is not None:
+            wanted = set(spec['groups'])
+            for group in wanted - current_groups:
+                adds.setdefault(group, []).append(name)
+            for group in current_groups - wanted:
+                drops.setdefault(group, []).append(name)
+
+    statements = create_groups + create_users + alter_users
+    for group in sorted(set(adds) | set(drops)):
+        for verb, members in [('ADD', adds), ('DROP', drops)]:
+            if group in members:
+                statements.append("ALTER GROUP %s %s USER %s" % (
+                    quote_identifier(group), verb,
+                    ', '.join(quote_identifier(name)
+                              for name in sorted(members[group]))))
+    if drop_users:
+        for name in sorted(set(users) - set(desired) - ignore):
+            if not users[name].createuser:
+                statements.append("DROP USER %s" % quote_identifier(name))
+    if drop_groups:
+        for group in sorted(set(groups) - wanted_groups):
+            statements.append("DROP GROUP %s" % quote_identifier(group))
+    return statements
@@ -2,6 +2,8 @@
 
 from functools import wraps
 import math
+import os
+import re
 
 
 def memoize(f):
@@ -73,3 +75,13 @@ def linspace(start, stop, num):
             break
         res.append(int(math.floor(accum)))
     return res
+
+
+def cache_path(cache_dir, *parts):
+    """Return a JSON file path in *cache_dir* named after *parts*
+
+    >>> print(cache_path('/tmp', 'my-host', 5439, 'db/name'))
+    /tmp/my-host-5439-db_name.json
+    """
+    name = '-'.join(re.sub(r'[^\w.$-]', '_', str(p)) for p in parts)
+    return os.path.join(cache_dir, name + '.json')